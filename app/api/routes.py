@@ -1,68 +1,312 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
 from typing import List
+import asyncio
+import json
+import logging
 import os
-import tempfile
 
+from app.core.concurrency import run_in_parsing_pool
+from app.core.config import settings
+from app.core.metrics import CACHE_LOOKUPS, render_metrics
+from app.services.cache import get_cache, build_cache_key
 from app.services.document_processor import process_documents
+from app.services.job_queue import (
+    TransientJobError, get_job_store, notify_job_runner, QUEUED, RUNNING, FAILED,
+)
+from app.services.llm_gateway import parse_response
 from app.services.llm_service import extract_field_from_document
+from app.utils.upload_utils import remove_files, save_uploads, saved_uploads
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+def _cacheable(extracted_data):
+    """
+    Only complete results are cached: a failed text or vision extraction
+    (timeouts included) would otherwise be served for every re-upload.
+    """
+    parts = [extracted_data] + [
+        extracted_data.get(name) or {} for name in ("text_extraction", "vision_extraction")
+    ]
+    return not any("error" in part or part.get("retryable") for part in parts)
+
+async def _extract_documents(temp_file_paths, file_hashes, progress=None):
+    """
+    Run the parse + extract pipeline for one shipment's files, going through
+    the result cache. Returns the extracted data and the cache status.
+
+    progress is passed on to process_documents and extract_field_from_document.
+    """
+    # Re-uploads of the same files skip parsing and extraction entirely
+    cache = get_cache()
+    cache_key = build_cache_key(file_hashes)
+    extracted_data = await run_in_threadpool(cache.get, cache_key) if cache else None
+    if extracted_data is not None:
+        CACHE_LOOKUPS.labels("hit").inc()
+        return extracted_data, "hit"
+    if cache:
+        CACHE_LOOKUPS.labels("miss").inc()
+
+    # Process documents on the parsing pool so the event loop stays responsive
+    document_data = await run_in_parsing_pool(process_documents, temp_file_paths, progress=progress)
+
+    # Extract data from document
+    extracted_data = await extract_field_from_document(document_data, progress=progress)
+
+    if cache and _cacheable(extracted_data):
+        await run_in_threadpool(cache.set, cache_key, extracted_data)
+
+    return extracted_data, "miss" if cache else "disabled"
 
 @router.post("/process-documents", response_model=dict)
 async def process_documents_endpoint(
     files: List[UploadFile] = File(...)
 ):
-    print(f"DEBUG: Received {len(files)} files")
-    temp_file_paths = []
-    for file in files:
-        print(f"DEBUG: Processing uploaded file: {file.filename}, content_type: {file.content_type}")
-        
-        # Extract file extension
-        file_ext = os.path.splitext(file.filename)[1]  # e.g., ".pdf" or ".xlsx"
-        print(f"DEBUG: File extension: {file_ext}")
-        
-        # Save uploaded file temporarily
-        temp_file = tempfile.NamedTemporaryFile(suffix=file_ext, delete=False)
-        temp_file_paths.append(temp_file.name)
-        print(f"DEBUG: Created temp file: {temp_file.name}")
+    logger.info("Received %d files", len(files))
+    async with saved_uploads(files) as (temp_file_paths, file_hashes):
+        extracted_data, cache_status = await _extract_documents(temp_file_paths, file_hashes)
 
-        # Write content to temp file
-        content = await file.read()
-        print(f"DEBUG: Read {len(content)} bytes from uploaded file")
-        temp_file.write(content)
-        temp_file.close()
+    return {"extracted_data": extracted_data, "cache": cache_status}
 
-    # Process documents
-    document_data = process_documents(temp_file_paths)
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    # Extract data from document
-    extracted_data = extract_field_from_document(document_data)
+class _UploadsStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that removes the uploaded temp files once the response
+    ends, however it ends. A client that disconnects before the body starts
+    never runs the stream generator, so its own finally can't be relied on.
+    """
 
-    # Clean up temp files
-    for path in temp_file_paths:
-        os.unlink(path)
+    def __init__(self, content, temp_file_paths, **kwargs):
+        super().__init__(content, **kwargs)
+        self.temp_file_paths = temp_file_paths
 
-    return {"extracted_data": extracted_data} 
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            remove_files(self.temp_file_paths)
+
+@router.post("/process-documents/stream")
+async def process_documents_stream_endpoint(
+    files: List[UploadFile] = File(...)
+):
+    """
+    Streaming variant of /process-documents that reports progress as
+    server-sent events while the documents are processed:
+
+    - upload_stored: {"files", "bytes"}
+    - text_extracted: {"file", "type", "length"} per uploaded file
+    - ocr_page: {"page", "done", "pages"} per OCR'd page of scanned PDFs
+    - text_extraction / vision_extraction: each extraction result as soon as it arrives
+    - result: {"extracted_data", "cache"}, the same body /process-documents returns
+    - error: {"error"} if processing failed
+
+    The stream ends after result or error.
+    """
+    logger.info("Received %d files for streaming", len(files))
+    temp_file_paths, file_hashes = await save_uploads(files)
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def progress(event, data):
+        # Called from the parsing pool as well as from the event loop
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    async def run():
+        try:
+            extracted_data, cache_status = await _extract_documents(temp_file_paths, file_hashes, progress)
+            progress("result", {"extracted_data": extracted_data, "cache": cache_status})
+        except Exception as e:
+            logger.exception("Streaming extraction failed: %s", e)
+            progress("error", {"error": str(e)})
+        finally:
+            progress(None, None)
+
+    async def stream():
+        task = asyncio.create_task(run())
+        try:
+            yield _sse_event("upload_stored", {
+                "files": len(temp_file_paths),
+                "bytes": sum(os.path.getsize(path) for path in temp_file_paths),
+            })
+            while True:
+                event, data = await events.get()
+                if event is None:
+                    break
+                yield _sse_event(event, data)
+        finally:
+            # Also reached when the client disconnects mid-stream
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    return _UploadsStreamingResponse(
+        stream(),
+        temp_file_paths,
+        media_type="text/event-stream",
+        # Keep proxies (nginx) from buffering the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/process-documents/batch", response_model=dict)
+async def process_documents_batch_endpoint(
+    files: List[UploadFile] = File(...),
+    shipment_ids: List[str] = Form(...),
+):
+    """
+    Extract many shipments in one request.
+
+    shipment_ids has one entry per uploaded file, in the same order; files
+    sharing an id form one shipment. Shipments are processed concurrently,
+    at most BATCH_MAX_CONCURRENCY at a time, and each gets its own result
+    or error in the order the ids first appear.
+    """
+    if len(shipment_ids) != len(files):
+        raise HTTPException(
+            status_code=422,
+            detail=f"Expected one shipment id per file, got {len(shipment_ids)} ids for {len(files)} files",
+        )
+
+    shipments = {}
+    for index, shipment_id in enumerate(shipment_ids):
+        shipments.setdefault(shipment_id, []).append(index)
+
+    if len(shipments) > settings.BATCH_MAX_SHIPMENTS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"A batch may contain at most {settings.BATCH_MAX_SHIPMENTS} shipments",
+        )
+
+    logger.info("Received batch of %d shipments, %d files", len(shipments), len(files))
+    semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+
+    async def extract_shipment(shipment_id, indexes, temp_file_paths, file_hashes):
+        async with semaphore:
+            try:
+                extracted_data, cache_status = await _extract_documents(
+                    [temp_file_paths[i] for i in indexes],
+                    [file_hashes[i] for i in indexes],
+                )
+                return {"shipment_id": shipment_id, "extracted_data": extracted_data, "cache": cache_status}
+            except Exception as e:
+                logger.exception("Shipment %s failed: %s", shipment_id, e)
+                return {"shipment_id": shipment_id, "error": str(e)}
+
+    async with saved_uploads(files) as (temp_file_paths, file_hashes):
+        results = await asyncio.gather(*(
+            extract_shipment(shipment_id, indexes, temp_file_paths, file_hashes)
+            for shipment_id, indexes in shipments.items()
+        ))
+
+    return {"results": results}
+
+async def run_extraction_job(job):
+    """
+    Job body for /jobs: the same pipeline as /process-documents, run on the
+    job's stored files. Transient OpenAI failures are raised so the job is retried.
+    """
+    files = job["files"]
+    extracted_data, cache_status = await _extract_documents(
+        [f["path"] for f in files],
+        [(f["ext"], f["sha256"]) for f in files],
+    )
+    if extracted_data.get("retryable"):
+        raise TransientJobError(extracted_data["error"])
+    return {"extracted_data": extracted_data, "cache": cache_status}
+
+@router.post("/jobs", response_model=dict, status_code=202)
+async def submit_job(
+    files: List[UploadFile] = File(...)
+):
+    """
+    Queue documents for extraction and return a job id right away. Poll
+    GET /jobs/{job_id} for the status and fetch GET /jobs/{job_id}/result.
+    """
+    logger.info("Received job with %d files", len(files))
+    store = get_job_store()
+    job_id, job_dir = await run_in_threadpool(store.new_job_dir)
+    try:
+        paths, file_hashes = await save_uploads(files, directory=job_dir)
+        job_files = [
+            {"path": path, "ext": ext, "sha256": sha256}
+            for path, (ext, sha256) in zip(paths, file_hashes)
+        ]
+        await run_in_threadpool(store.create, job_id, job_files)
+    except BaseException:
+        await run_in_threadpool(store.remove_job_dir, job_id)
+        raise
+
+    logger.info("Queued job %s", job_id)
+    notify_job_runner()
+    return {"job_id": job_id, "status": QUEUED}
+
+async def _get_job(job_id):
+    job = await run_in_threadpool(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@router.get("/jobs/{job_id}", response_model=dict)
+async def get_job_status(job_id: str):
+    job = await _get_job(job_id)
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+@router.get("/jobs/{job_id}/result", response_model=dict)
+async def get_job_result(job_id: str):
+    job = await _get_job(job_id)
+    if job["status"] in (QUEUED, RUNNING):
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is still {job['status']}")
+    if job["status"] == FAILED:
+        return {"job_id": job_id, "status": FAILED, "error": job["error"]}
+    return {"job_id": job_id, "status": job["status"], **job["result"]}
+
+@router.delete("/cache")
+async def purge_cache():
+    """
+    Remove every cached extraction result.
+    """
+    cache = get_cache()
+    purged = await run_in_threadpool(cache.purge) if cache else 0
+    return {"status": "success", "purged": purged}
+
+@router.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics: pipeline stage timings, HTTP and LLM requests in
+    flight and their durations, LLM tokens and errors, and cache lookups.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 @router.get("/health-check/openai")
 async def health_check_openai():
     """
     Health check endpoint to verify OpenAI API connectivity using responses.parse()
+
+    Goes through the LLM gateway, so it reuses the pooled client and counts
+    against the concurrency and rate limits, but is not retried.
     """
-    from openai import OpenAI
     from pydantic import BaseModel
-    import os
     
     class HealthCheckResponse(BaseModel):
         status: str
         message: str
     
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        
         # Make a simple test request using the new responses.parse() format
-        response = client.responses.parse(
-            model="gpt-5-mini",
+        response = await parse_response(
+            model=settings.LLM_MODEL,
+            max_retries=0,
             input=[
                 {"role": "system", "content": "You are a health check assistant. Respond with a status and message."},
                 {"role": "user", "content": "Perform a health check. Return status as 'OK' and a brief message confirming the API is working."}
@@ -75,7 +319,7 @@ async def health_check_openai():
         return {
             "status": "success",
             "message": "OpenAI API is accessible",
-            "model": "gpt-5-mini",
+            "model": settings.LLM_MODEL,
             "response": {
                 "status": parsed_response.status,
                 "message": parsed_response.message
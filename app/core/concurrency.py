@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from app.core.config import settings
+
+# Blocking parsing work is dispatched to a bounded thread pool so the event
+# loop stays free for other requests. The threads mostly wait: poppler and
+# tesseract run in subprocesses, Pillow releases the GIL while resizing and
+# encoding, and the pure-Python parsing (PyPDF2 text layers and page
+# classification, openpyxl workbooks), which holds the GIL, runs on the
+# parsing processes below.
+_parsing_executor = None
+
+# Pure-Python parsing would stall the event loop and every other thread for
+# as long as it holds the GIL, so it runs in worker processes.
+_parsing_process_executor = None
+
+# OCR is CPU-bound in tesseract itself, so pages are spread across processes.
+_ocr_executor = None
+
+
+def get_parsing_executor() -> ThreadPoolExecutor:
+    global _parsing_executor
+    if _parsing_executor is None:
+        _parsing_executor = ThreadPoolExecutor(
+            max_workers=settings.PARSING_POOL_WORKERS,
+            thread_name_prefix="parsing",
+        )
+    return _parsing_executor
+
+
+def _init_parsing_worker(niceness: int):
+    # When parses outnumber the cores, the server process still gets the CPU
+    # it needs to answer other requests
+    os.nice(niceness)
+
+
+def get_parsing_process_executor() -> ProcessPoolExecutor:
+    global _parsing_process_executor
+    if _parsing_process_executor is None:
+        # spawn rather than fork: the server process is multi-threaded
+        _parsing_process_executor = ProcessPoolExecutor(
+            max_workers=settings.PARSING_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_parsing_worker,
+            initargs=(settings.PARSING_PROCESS_NICENESS,),
+        )
+    return _parsing_process_executor
+
+
+def reset_parsing_process_executor():
+    """
+    Drop the parsing process pool (e.g. after a worker crashed) so the next call starts a fresh one.
+    """
+    global _parsing_process_executor
+    if _parsing_process_executor is not None:
+        _parsing_process_executor.shutdown(wait=False, cancel_futures=True)
+        _parsing_process_executor = None
+
+
+def run_in_parsing_process(func, *args):
+    """
+    Call func(*args) on the parsing process pool and wait for its result, or
+    call it in the calling thread if PARSING_PROCESSES is 0. func, its
+    arguments and its result must be picklable; metrics and context
+    variables of the calling process aren't seen by func.
+    """
+    if settings.PARSING_PROCESSES <= 0:
+        return func(*args)
+    try:
+        return get_parsing_process_executor().submit(func, *args).result()
+    except BrokenProcessPool:
+        reset_parsing_process_executor()
+        raise
+
+
+def _init_ocr_worker(tesseract_threads: int):
+    # Each worker runs one tesseract at a time; cap its OpenMP threads so
+    # OCR_WORKERS processes don't oversubscribe the CPU
+    os.environ["OMP_THREAD_LIMIT"] = str(tesseract_threads)
+
+
+def get_ocr_executor() -> ProcessPoolExecutor:
+    global _ocr_executor
+    if _ocr_executor is None:
+        # spawn rather than fork: the server process is multi-threaded
+        _ocr_executor = ProcessPoolExecutor(
+            max_workers=settings.OCR_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_ocr_worker,
+            initargs=(settings.OCR_TESSERACT_THREADS,),
+        )
+    return _ocr_executor
+
+
+def reset_ocr_executor():
+    """
+    Drop the OCR pool (e.g. after a worker crashed) so the next call starts a fresh one.
+    """
+    global _ocr_executor
+    if _ocr_executor is not None:
+        _ocr_executor.shutdown(wait=False, cancel_futures=True)
+        _ocr_executor = None
+
+
+async def run_in_parsing_pool(func, *args, **kwargs):
+    """
+    Run a blocking function on the parsing pool and await its result.
+    The function sees the caller's context variables (e.g. the request id).
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_parsing_executor(), partial(context.run, func, *args, **kwargs))
+
+
+def map_in_parsing_pool(func, items):
+    """
+    Call func(*item) for each item on the parsing pool, returning the results
+    in order. Safe to call from a parsing pool thread: the first item, and any
+    item no worker has picked up by the time its result is needed, runs in the
+    calling thread, so a busy pool can't deadlock.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [func(*item) for item in items]
+    executor = get_parsing_executor()
+    # Each call sees a copy of the caller's context variables (e.g. the request id)
+    futures = [
+        executor.submit(partial(contextvars.copy_context().run, func, *item))
+        for item in items[1:]
+    ]
+    results = [func(*items[0])]
+    try:
+        for item, future in zip(items[1:], futures):
+            results.append(func(*item) if future.cancel() else future.result())
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
+
+def shutdown_pools():
+    global _parsing_executor
+    if _parsing_executor is not None:
+        _parsing_executor.shutdown(wait=False, cancel_futures=True)
+        _parsing_executor = None
+    reset_parsing_process_executor()
+    reset_ocr_executor()
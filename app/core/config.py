@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -15,4 +16,157 @@ class Settings(BaseSettings):
     # Document types
     ALLOWED_DOCUMENT_TYPES: list[str] = [".pdf", ".xlsx"]
 
+    # Uploads
+    # Uploads are copied to disk in chunks of this size instead of being read whole
+    UPLOAD_CHUNK_BYTES: int = 1024 * 1024
+    MAX_UPLOAD_FILE_BYTES: int = 100 * 1024 * 1024
+    MAX_UPLOAD_REQUEST_BYTES: int = 250 * 1024 * 1024
+
+    # Concurrency
+    # Worker threads used for blocking document parsing (PyPDF2, poppler, tesseract, openpyxl)
+    PARSING_POOL_WORKERS: int = 4
+    # Processes running the pure-Python parsing (PDF text layers, workbooks), which
+    # holds the GIL; 0 parses in the worker threads, stalling the event loop meanwhile
+    PARSING_PROCESSES: int = 4
+    # Added to the parsing processes' niceness, so they yield the CPU to the server process
+    PARSING_PROCESS_NICENESS: int = 10
+    # Shipments of one batch request extracted at the same time
+    BATCH_MAX_CONCURRENCY: int = 8
+    BATCH_MAX_SHIPMENTS: int = 100
+
+    # PDF text
+    # Name of the backend in app.utils.pdf_backends.PDF_TEXT_BACKENDS: "pypdf2",
+    # "pypdfium2" or "pdftotext" (poppler); bench/bench_pdf_text.py compares them
+    PDF_TEXT_BACKEND: str = "pypdf2"
+    PDF_TEXT_TIMEOUT_SECONDS: float = 120.0
+
+    # PDF rendering
+    # Scanned PDFs are rendered once at OCR_DPI and downscaled in memory for vision
+    OCR_DPI: int = 200
+    VISION_DPI: int = 150
+    # Pages rendered per poppler call; peak memory grows with this, not with the page count
+    PDF_RENDER_WINDOW_PAGES: int = 4
+    # Scanned pages OCR'd and pages sent to the vision model per PDF; 0 means all.
+    # The first PDF_FIRST_PAGES pages are always picked, then pages with field labels
+    PDF_MAX_OCR_PAGES: int = 50
+    VISION_MAX_PAGES: int = 20
+    PDF_FIRST_PAGES: int = 3
+
+    # Vision image encoding
+    # Longest page side sent to the vision model, in pixels; 0 keeps the rendered size
+    VISION_MAX_LONG_EDGE: int = 1600
+    # Pages are never downsampled below this long edge to fit the byte budget
+    VISION_MIN_LONG_EDGE: int = 768
+    VISION_GRAYSCALE: bool = True
+    VISION_CROP_WHITESPACE: bool = True
+    # PNG, JPEG or WEBP; quality applies to JPEG and WEBP
+    VISION_IMAGE_FORMAT: str = "WEBP"
+    VISION_IMAGE_QUALITY: int = 80
+    # Base64 bytes of page images per vision request; 0 disables the budget
+    VISION_MAX_REQUEST_BYTES: int = 4 * 1024 * 1024
+
+    # Spreadsheets
+    # Non-empty rows and leading columns of each sheet included in the document text
+    XLSX_MAX_ROWS_PER_SHEET: int = 2000
+    XLSX_MAX_COLUMNS: int = 50
+    # Compute line item count and averages from spreadsheet tables instead of asking the LLM
+    LINE_ITEM_AGGREGATES_ENABLED: bool = True
+    # Rows searched for a line-item table header, per sheet
+    LINE_ITEM_HEADER_SCAN_ROWS: int = 50
+    # Line items shown to the LLM as a sample of each table
+    LINE_ITEM_SAMPLE_ROWS: int = 5
+
+    # OCR
+    # Processes running tesseract in parallel; 1 runs OCR inline, page by page
+    OCR_WORKERS: int = 4
+    # OMP_THREAD_LIMIT for each tesseract process
+    OCR_TESSERACT_THREADS: int = 1
+    # Pages that take longer are skipped instead of stalling the document
+    OCR_PAGE_TIMEOUT_SECONDS: float = 60.0
+    # Pages with less extracted text than this are OCR'd
+    OCR_MIN_PAGE_CHARS: int = 50
+    # A page covered by an image is OCR'd unless its text layer has at least this
+    # many characters per square inch, as searchable scans do
+    OCR_MIN_GLYPH_DENSITY: float = 2.0
+
+    # LLM
+    # Name of the backend in app.services.llm_backends.LLM_BACKENDS: "openai",
+    # "stub" (the local stand-in server at LLM_STUB_URL), or "record"/"replay"
+    # to save OpenAI responses to LLM_RECORDINGS_PATH and play them back offline
+    LLM_BACKEND: str = "openai"
+    LLM_MODEL: str = "gpt-5-mini"
+    LLM_STUB_URL: str = "http://127.0.0.1:8900/v1"
+    LLM_RECORDINGS_PATH: str = os.path.join(tempfile.gettempdir(), "document-processor", "llm_recordings.jsonl")
+    # Replayed responses take as long as the recorded calls did
+    LLM_REPLAY_LATENCY: bool = False
+    # Per-call timeout for each text/vision extraction request, in seconds
+    LLM_CALL_TIMEOUT_SECONDS: float = 120.0
+    # Document text tokens in the text extraction prompt; longer documents keep
+    # their most relevant chunks. 0 sends the full text
+    PROMPT_TOKEN_BUDGET: int = 12000
+    PROMPT_CHUNK_TOKENS: int = 300
+    # tiktoken encoding used to count tokens; if it can't be loaded (e.g. offline,
+    # without a cached encoding file) tokens are estimated at 4 characters each
+    PROMPT_TOKENIZER_ENCODING: str = "o200k_base"
+    # Requests in flight to OpenAI per server process, overall and per model;
+    # further requests wait for a slot
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_MAX_CONCURRENCY_PER_MODEL: int = 8
+    # Requests sent per minute, with bursts of up to LLM_RATE_LIMIT_BURST; 0 disables the limit
+    LLM_REQUESTS_PER_MINUTE: int = 500
+    LLM_RATE_LIMIT_BURST: int = 10
+    # Retries of 429, 5xx, timeout and connection errors, with jittered exponential
+    # backoff from LLM_RETRY_BASE_SECONDS; Retry-After is used when sent
+    LLM_MAX_RETRIES: int = 4
+    LLM_RETRY_BASE_SECONDS: float = 1.0
+    LLM_RETRY_MAX_SECONDS: float = 30.0
+    # Idle pooled connections to OpenAI are closed after this long
+    LLM_KEEPALIVE_SECONDS: float = 30.0
+    # Find fields with patterns first and only ask the LLM for the rest; fields
+    # below this confidence (0-1) are still asked of the LLM
+    RULES_ENABLED: bool = True
+    RULES_MIN_CONFIDENCE: float = 0.8
+    # "adaptive" runs the vision call after the text call, only when fields are
+    # missing, fail validation, disagree with the rules or come from OCR below
+    # VISION_MIN_OCR_CONFIDENCE (0-100), and only for those fields; "always"
+    # runs it for every PDF, alongside the text call
+    VISION_POLICY: str = "adaptive"
+    VISION_MIN_OCR_CONFIDENCE: float = 80.0
+
+    # Extraction result cache
+    CACHE_ENABLED: bool = True
+    # Name of the backend in app.services.cache.CACHE_BACKENDS
+    CACHE_BACKEND: str = "sqlite"
+    CACHE_PATH: str = os.path.join(tempfile.gettempdir(), "document-processor", "extraction_cache.sqlite3")
+    CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    CACHE_TTL_SECONDS: int = 7 * 24 * 60 * 60
+
+    # Background jobs
+    JOB_DB_PATH: str = os.path.join(tempfile.gettempdir(), "document-processor", "jobs.sqlite3")
+    # Uploaded files of queued jobs, one directory per job
+    JOB_FILES_DIR: str = os.path.join(tempfile.gettempdir(), "document-processor", "jobs")
+    # Jobs run at the same time in each server process
+    JOB_WORKERS: int = 2
+    # Attempts per job when extraction hits transient OpenAI errors or its worker dies
+    JOB_MAX_ATTEMPTS: int = 3
+    # Delay before the first retry, doubled for each later one
+    JOB_RETRY_BASE_SECONDS: float = 5.0
+    # Renewed every third of its length while the job runs; a job whose worker
+    # died is picked up again once its lease expires
+    JOB_LEASE_SECONDS: float = 900.0
+    JOB_POLL_SECONDS: float = 1.0
+    # Finished jobs and their results are kept this long
+    JOB_RETENTION_SECONDS: int = 24 * 60 * 60
+
+    # Logging
+    # Level of the app's loggers; DEBUG adds per-file, per-page and per-response detail
+    LOG_LEVEL: str = "INFO"
+    # One JSON object per line; false for plain text lines
+    LOG_JSON: bool = True
+    # Logged values are truncated to this many characters and collections to
+    # LOG_MAX_ITEMS entries; base64 payloads are replaced by their length
+    LOG_MAX_VALUE_CHARS: int = 500
+    LOG_MAX_ITEMS: int = 20
+    LOG_MAX_MESSAGE_CHARS: int = 4000
+
 settings = Settings()
@@ -0,0 +1,165 @@
+import json
+import logging
+import re
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from app.core.config import settings
+
+# Correlation id of the request (or job) being handled. Set by the request
+# middleware; asyncio tasks and the parsing pool inherit it, so every log line
+# of one request carries the same id
+REQUEST_ID = ContextVar("request_id", default=None)
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Client-supplied ids are reused only if they are short and plain
+_VALID_REQUEST_ID = re.compile(r"[\w.:-]{1,64}")
+
+# Page images and other encoded payloads are logged as their length only
+_BASE64_PAYLOAD = re.compile(r"(?:data:[\w/+.-]+;base64,)?[A-Za-z0-9+/]{200,}={0,2}")
+
+_SECRET_KEYS = ("api_key", "apikey", "authorization", "password", "secret", "token")
+
+_MAX_DEPTH = 4
+
+# Attributes every LogRecord has; anything else was passed with extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def request_id_from_header(value) -> str:
+    """
+    The client's request id if it is safe to log, otherwise a new one.
+    """
+    if value and _VALID_REQUEST_ID.fullmatch(value):
+        return value
+    return new_request_id()
+
+
+def _is_secret(key) -> bool:
+    key = str(key).lower()
+    return any(secret in key for secret in _SECRET_KEYS)
+
+
+def redact(value, max_chars: int = None, max_items: int = None, _depth: int = 0):
+    """
+    A copy of value that is cheap to log: base64 payloads are replaced by
+    their length, long strings truncated to max_chars, collections cut to
+    max_items entries, and values under secret-looking keys hidden.
+    """
+    max_chars = max_chars or settings.LOG_MAX_VALUE_CHARS
+    max_items = max_items or settings.LOG_MAX_ITEMS
+
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if _depth >= _MAX_DEPTH and isinstance(value, (dict, list, tuple, set)):
+        return f"<{type(value).__name__} of {len(value)}>"
+
+    if isinstance(value, dict):
+        redacted = {
+            str(key): "<redacted>" if _is_secret(key) else redact(item, max_chars, max_items, _depth + 1)
+            for key, item in list(value.items())[:max_items]
+        }
+        if len(value) > max_items:
+            redacted["..."] = f"{len(value) - max_items} more"
+        return redacted
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        redacted = [redact(item, max_chars, max_items, _depth + 1) for item in items[:max_items]]
+        if len(items) > max_items:
+            redacted.append(f"... {len(items) - max_items} more")
+        return redacted
+
+    text = value if isinstance(value, str) else str(value)
+    text = _BASE64_PAYLOAD.sub(lambda m: f"<base64 {len(m.group())} chars>", text)
+    if len(text) > max_chars:
+        text = f"{text[:max_chars]}... ({len(text)} chars)"
+    return text
+
+
+class RequestIdFilter(logging.Filter):
+    """
+    Stamp each record with the current request id.
+    """
+
+    def filter(self, record):
+        record.request_id = REQUEST_ID.get() or "-"
+        return True
+
+
+class RedactingFormatter(logging.Formatter):
+    """
+    Formats the message from redacted arguments, so a dict holding page
+    images is logged as a few hundred characters.
+
+    The arguments are only formatted when a handler emits the record; calls
+    below the configured level cost a level check.
+    """
+
+    def redacted_message(self, record) -> str:
+        args = record.args
+        if not args:
+            return redact(str(record.msg), max_chars=settings.LOG_MAX_MESSAGE_CHARS)
+        if isinstance(args, dict):
+            args = redact(args)
+        else:
+            args = tuple(redact(arg) for arg in args)
+        try:
+            message = str(record.msg) % args
+        except (TypeError, ValueError):
+            # A redacted argument no longer fits its placeholder (e.g. %d)
+            message = f"{record.msg} {args}"
+        return redact(message, max_chars=settings.LOG_MAX_MESSAGE_CHARS)
+
+    def format(self, record):
+        # Format a copy; other handlers may still need the original arguments
+        record = logging.makeLogRecord(vars(record))
+        record.msg, record.args = self.redacted_message(record), None
+        return super().format(record)
+
+
+class JsonFormatter(RedactingFormatter):
+    """
+    One JSON object per line: time, level, logger, request_id, message, any
+    fields passed with extra=, and the traceback if there is one.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": REQUEST_ID.get(),
+            "message": self.redacted_message(record),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and key not in entry:
+                entry[key] = "<redacted>" if _is_secret(key) else redact(value)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = None, stream=None) -> logging.Logger:
+    """
+    Send the app's log records (the "app" logger and its children) to stream
+    (stderr by default) at LOG_LEVEL, as JSON lines unless LOG_JSON is off.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if settings.LOG_JSON else RedactingFormatter(TEXT_FORMAT))
+    handler.addFilter(RequestIdFilter())
+
+    logger = logging.getLogger("app")
+    logger.handlers = [handler]
+    logger.setLevel((level or settings.LOG_LEVEL).upper())
+    logger.propagate = False
+    return logger
@@ -0,0 +1,130 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+# Pipeline stages are timed individually; a request's total is in http_request_duration_seconds
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Time spent in each document pipeline stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_ERRORS = Counter(
+    "pipeline_stage_errors_total",
+    "Pipeline stages that raised an exception",
+    ["stage"],
+)
+
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests being handled",
+    # Summed over the live worker processes when PROMETHEUS_MULTIPROC_DIR is set
+    multiprocess_mode="livesum",
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request handling time, until the response starts",
+    ["method", "route", "status"],
+    buckets=STAGE_BUCKETS,
+)
+
+LLM_REQUESTS_IN_FLIGHT = Gauge(
+    "llm_requests_in_flight",
+    "Requests sent to the LLM and not yet answered",
+    ["model"],
+    multiprocess_mode="livesum",
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "LLM request time per attempt, excluding time queued for a slot",
+    ["model", "outcome"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "llm_queue_wait_seconds",
+    "Time LLM requests waited for a concurrency slot and rate limiter token",
+    ["model"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens reported by the LLM API",
+    ["model", "kind"],
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total",
+    "Failed LLM request attempts, retried or not",
+    ["model", "error"],
+)
+
+PDF_PAGES = Counter(
+    "pdf_pages_total",
+    "PDF pages by kind: text, scanned (OCR'd) or blank",
+    ["kind"],
+)
+
+CACHE_LOOKUPS = Counter(
+    "extraction_cache_lookups_total",
+    "Extraction result cache lookups",
+    ["result"],
+)
+EXTRACTION_ERRORS = Counter(
+    "extraction_errors_total",
+    "Text or vision extractions that returned an error result",
+    ["path"],
+)
+
+VISION_DECISIONS = Counter(
+    "vision_decisions_total",
+    "Vision policy decisions: skip, or each distinct reason the vision call ran for",
+    ["decision"],
+)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+@contextmanager
+def timed_stage(stage: str):
+    """
+    Record the time spent in the block under pipeline_stage_duration_seconds,
+    and count it in pipeline_stage_errors_total if it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def render_metrics():
+    """
+    Metrics in the Prometheus text format, and its content type.
+
+    With several server processes (uvicorn --workers), each keeps its own
+    metrics; set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by
+    the workers so /metrics reports all of them, whichever worker serves it.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def mark_worker_dead():
+    """
+    Drop this process's live gauges from the multiprocess metrics on shutdown.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
@@ -1,10 +1,34 @@
-from fastapi import FastAPI
-from app.api.routes import router
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from app.api.routes import router, run_extraction_job
+from app.core.concurrency import shutdown_pools
+from app.core.config import settings
+from app.core.log import REQUEST_ID, REQUEST_ID_HEADER, configure_logging, request_id_from_header
+from app.core.metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT, mark_worker_dead
+from app.services.job_queue import start_job_runner, stop_job_runner
+from app.services.llm_gateway import close_client
+import time
 import uvicorn
 
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="Document Processing API")
+
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_job_runner(run_extraction_job)
+    yield
+    await stop_job_runner()
+    await close_client()
+    shutdown_pools()
+    mark_worker_dead()
+
+
+app = FastAPI(title="Document Processing API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,8 +36,82 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REQUEST_ID_HEADER],
 )
 
+# Headroom for multipart boundaries and part headers on top of the file bytes
+MULTIPART_OVERHEAD_BYTES = 1024 * 1024
+
+class RequestSizeLimitMiddleware:
+    """
+    Reject request bodies over MAX_UPLOAD_REQUEST_BYTES (plus multipart
+    overhead) before they are spooled: at once when Content-Length says so,
+    and otherwise, e.g. for chunked uploads, as soon as more bytes than that
+    have been received. The exact per-file and per-request caps are enforced
+    while uploads are copied.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = settings.MAX_UPLOAD_REQUEST_BYTES + MULTIPART_OVERHEAD_BYTES
+        detail = f"Upload exceeds the {settings.MAX_UPLOAD_REQUEST_BYTES} byte limit per request"
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            await JSONResponse(status_code=413, content={"detail": detail})(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised into the body parser; FastAPI passes HTTPExceptions from it through
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+app.add_middleware(RequestSizeLimitMiddleware)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+        # Label by route template, not path, so job ids don't create a series each
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method, route.path if route else "unmatched", str(status),
+        ).observe(time.perf_counter() - start)
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    # Added last, so it runs first: everything logged while handling the
+    # request, including in the parsing pool, carries this id
+    request_id = request_id_from_header(request.headers.get(REQUEST_ID_HEADER))
+    token = REQUEST_ID.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        REQUEST_ID.reset(token)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    return response
+
 app.include_router(router)
 
 @app.get("/")
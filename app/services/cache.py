@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Optional
+
+from app.core.config import settings
+from app.services.llm_service import extraction_fingerprint
+
+
+class CacheBackend(ABC):
+    """
+    Storage interface for extraction results. Implement this to plug in a
+    shared backend; the local SQLite backend is the default.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: dict) -> None:
+        ...
+
+    @abstractmethod
+    def purge(self) -> int:
+        """
+        Remove every entry and return how many were removed.
+        """
+        ...
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    On-disk cache with TTL expiry and least-recently-used eviction once the
+    stored values exceed max_bytes. Safe to share between uvicorn workers.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            return json.loads(value)
+
+    def set(self, key: str, value: dict) -> None:
+        now = time.time()
+        payload = json.dumps(value)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now: float) -> None:
+        conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        for key, size in conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+        ).fetchall():
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def purge(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM entries").rowcount
+
+
+CACHE_BACKENDS = {
+    "sqlite": lambda: SQLiteCacheBackend(
+        settings.CACHE_PATH,
+        max_bytes=settings.CACHE_MAX_BYTES,
+        ttl_seconds=settings.CACHE_TTL_SECONDS,
+    ),
+}
+
+_cache = None
+
+
+def get_cache() -> Optional[CacheBackend]:
+    """
+    Return the configured cache backend, or None when caching is disabled.
+    """
+    global _cache
+    if not settings.CACHE_ENABLED:
+        return None
+    if _cache is None:
+        if settings.CACHE_BACKEND not in CACHE_BACKENDS:
+            raise ValueError(f"Unknown cache backend: {settings.CACHE_BACKEND}")
+        _cache = CACHE_BACKENDS[settings.CACHE_BACKEND]()
+    return _cache
+
+
+def build_cache_key(file_hashes: list[tuple[str, str]]) -> str:
+    """
+    Key an extraction result on the uploaded bytes, given as (file extension,
+    SHA-256) pairs, plus the model, schema version and prompts that produced it.
+    """
+    h = hashlib.sha256()
+    for file_ext, sha256 in file_hashes:
+        h.update(f"{file_ext.lower()}:{sha256}".encode("utf-8"))
+        h.update(b"\0")
+    h.update(extraction_fingerprint().encode("utf-8"))
+    return h.hexdigest()
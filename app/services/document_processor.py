@@ -1,39 +1,146 @@
+import logging
 import os
-from app.utils.pdf_utils import extract_text_from_pdf, pdf_to_images_base64
+import time
+from app.core.concurrency import map_in_parsing_pool, run_in_parsing_process
+from app.core.config import settings
+from app.core.metrics import timed_stage
+from app.services.line_items import AGGREGATE_FIELDS, summarize_workbook
+from app.utils.pdf_utils import encode_vision_pages, extract_pages_from_pdf, RenderedPages
+from app.utils.xlsx_utils import extract_text_from_xlsx
 
-def process_documents(file_paths):
-    print(f"DEBUG: Processing {len(file_paths)} files")
+logger = logging.getLogger(__name__)
+
+def merge_file_aggregates(extracted_data, aggregates):
+    """
+    Add one workbook's line-item aggregates to extracted_data; fields already
+    computed from an earlier file are kept.
+    """
+    merged = extracted_data.setdefault('line_item_aggregates', {"sources": {}})
+    for name in AGGREGATE_FIELDS:
+        if name in aggregates and name not in merged:
+            merged[name] = aggregates[name]
+            merged["sources"][name] = aggregates["sources"][name]
+
+def process_pdf(file_path, index=0, progress=None):
+    """
+    Extract the page texts of one PDF. Its vision pages are encoded later, and
+    only if the vision call runs, together with those of the other PDFs, see
+    encode_pdf_images.
+    """
+    start = time.perf_counter()
+    # Pages are rasterized once and shared between OCR and the vision encoder
+    pages = RenderedPages(file_path)
+    page_texts = extract_pages_from_pdf(file_path, pages, progress=progress)
+    pdf_text = "".join(page_text + "\n" for page_text in page_texts if page_text)
+    logger.debug("Extracted %d characters of PDF text", len(pdf_text))
+    if progress:
+        progress("text_extracted", {"file": index, "type": "pdf", "length": len(pdf_text)})
+
+    return {
+        "file": index,
+        "name": os.path.basename(file_path),
+        "type": "pdf",
+        "text": pdf_text,
+        "pages": page_texts,
+        "page_count": pages.page_count,
+        # Rasterized pages shared with OCR, for encode_pdf_images
+        "rendered_pages": pages,
+        # Mean tesseract word confidence (0-100) of the OCR'd pages; None without OCR
+        "ocr_confidence": (sum(pages.ocr_confidence.values()) / len(pages.ocr_confidence)
+                           if pages.ocr_confidence else None),
+        "seconds": time.perf_counter() - start,
+    }
+
+def process_xlsx(file_path, index=0, progress=None):
+    """
+    Extract the text, and the line-item aggregates if enabled, of one workbook.
+    """
+    start = time.perf_counter()
+    result = {"file": index, "name": os.path.basename(file_path), "type": "xlsx", "text": ""}
+    try:
+        with timed_stage("xlsx_parse"):
+            # openpyxl is pure Python, so workbooks are read on a parsing process
+            if settings.LINE_ITEM_AGGREGATES_ENABLED:
+                # Line-item tables are summarized; their count and averages are computed here
+                result["text"], result["aggregates"] = run_in_parsing_process(summarize_workbook, file_path)
+            else:
+                # Streams rows from the workbook as compact TSV, one block per sheet
+                result["text"] = run_in_parsing_process(extract_text_from_xlsx, file_path)
+        logger.debug("Extracted %d characters of XLSX text", len(result["text"]))
+    except Exception as e:
+        logger.error("Error reading %s: %s", file_path, e)
+        result["error"] = str(e)
+    if progress:
+        progress("text_extracted", {"file": index, "type": "xlsx", "length": len(result["text"])})
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def encode_pdf_images(results):
+    """
+    Encode the vision pages of the PDFs among the per-file results under one
+    page limit and byte budget (see encode_vision_pages), adding "images" and
+    "image_pages", the 1-based page number of each image, to each PDF result.
+    PDFs whose pages were already encoded are left alone.
+    """
+    pdfs = [result for result in results if result["type"] == "pdf" and "rendered_pages" in result]
+    if not pdfs:
+        return
+    encoded = encode_vision_pages([result.pop("rendered_pages") for result in pdfs])
+    for result, pages in zip(pdfs, encoded):
+        result["images"] = [image for _, image in pages]
+        result["image_pages"] = [index + 1 for index, _ in pages]
+        logger.debug("Converted %s to %d images", result["name"], len(pages))
+
+def process_file(file_path, index=0, progress=None):
+    """
+    Process one uploaded file by its extension; None for unsupported types.
+    """
+    logger.debug("Processing file %s", file_path)
+    if file_path.endswith(".pdf"):
+        return process_pdf(file_path, index, progress)
+    if file_path.endswith(".xlsx"):
+        return process_xlsx(file_path, index, progress)
+    return None
+
+def merge_file_results(files):
+    """
+    Combine per-file results into the document data extract_field_from_document
+    takes: the texts of all PDFs and of all workbooks, the page images of all
+    PDFs if already encoded, the workbooks' line-item aggregates, and the per-file results under
+    "files" so the LLM layer can pick files and pages itself.
+    """
     extracted_data = {}
-    
-    for file_path in file_paths:
-        print(f"DEBUG: Processing file: {file_path}")
-        print(f"DEBUG: File exists: {os.path.exists(file_path)}")
-        
-        if file_path.endswith(".pdf"):
-            print(f"DEBUG: Processing as PDF")
-            pdf_text = extract_text_from_pdf(file_path)
-            print(f"DEBUG: Extracted PDF text length: {len(pdf_text)}")
-            extracted_data['pdf_text'] = extracted_data.get('pdf_text', "") + "\n" + pdf_text
-            
-            pdf_images = pdf_to_images_base64(file_path)
-            if pdf_images:
-                extracted_data['pdf_images'] = pdf_images
-                print(f"DEBUG: Converted PDF to {len(pdf_images)} images")
-        elif file_path.endswith(".xlsx"):
-            print(f"DEBUG: Processing as XLSX")
-            import pandas as pd
-            try:
-                # Read all sheets
-                xls = pd.ExcelFile(file_path)
-                text_content = []
-                for sheet_name in xls.sheet_names:
-                    df = pd.read_excel(xls, sheet_name=sheet_name)
-                    text_content.append(f"Sheet: {sheet_name}\n{df.to_string()}")
-                extracted_data['xlsx_text'] = extracted_data.get('xlsx_text', "") + "\n" + "\n".join(text_content)
-                print(f"DEBUG: Extracted XLSX text length: {len(extracted_data['xlsx_text'])}")
-            except Exception as e:
-                print(f"Error reading {file_path}: {e}")
-                extracted_data['xlsx_text'] = extracted_data.get('xlsx_text', "") + f"\nError reading {file_path}"
-    
-    print(f"DEBUG: Final extracted_data keys: {extracted_data.keys()}")
-    return extracted_data 
\ No newline at end of file
+    for result in files:
+        if result["type"] == "pdf":
+            extracted_data['pdf_text'] = extracted_data.get('pdf_text', "") + "\n" + result["text"]
+            # Pages of every PDF, including those that produced no images
+            extracted_data['pdf_page_count'] = extracted_data.get('pdf_page_count', 0) + result["page_count"]
+            if result.get("images"):
+                extracted_data['pdf_images'] = extracted_data.get('pdf_images', []) + result["images"]
+        else:
+            text = result["text"] if "error" not in result else f"Error reading {result['name']}"
+            extracted_data['xlsx_text'] = extracted_data.get('xlsx_text', "") + "\n" + text
+            if result.get("aggregates"):
+                merge_file_aggregates(extracted_data, result["aggregates"])
+    if files:
+        extracted_data['files'] = files
+    return extracted_data
+
+def process_documents(file_paths, progress=None):
+    """
+    Extract text from the uploaded files. Files are processed in parallel on
+    the parsing pool; see process_file for the per-file results and
+    merge_file_results for what is returned. PDF pages are rasterized here
+    only as OCR needs them; encode_pdf_images encodes them for the vision model.
+
+    progress, if given, is called as progress(event, data) after each file's
+    text is extracted and for each OCR'd page, from the thread processing the file.
+    """
+    logger.debug("Processing %d files", len(file_paths))
+    results = map_in_parsing_pool(
+        process_file, [(file_path, index, progress) for index, file_path in enumerate(file_paths)]
+    )
+    results = [result for result in results if result is not None]
+    extracted_data = merge_file_results(results)
+    logger.debug("Extracted data keys: %s", list(extracted_data))
+    return extracted_data
@@ -0,0 +1,335 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Awaitable, Callable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.log import REQUEST_ID
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class TransientJobError(Exception):
+    """
+    Raised by a job handler when the failure is worth retrying, e.g. an
+    OpenAI rate limit or timeout.
+    """
+
+
+class JobStore:
+    """
+    Durable job queue in SQLite, shared by every uvicorn worker on the host.
+
+    A claimed job holds a lease, extended while its worker runs it; if the
+    worker dies, the job becomes claimable again once the lease expires. Each job's uploaded files live
+    in their own directory under files_dir until the job finishes.
+    """
+
+    def __init__(self, path: str, files_dir: str):
+        self.path = path
+        self.files_dir = files_dir
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        os.makedirs(files_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    files TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    available_at REAL NOT NULL,
+                    lease_expires_at REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def new_job_dir(self) -> tuple[str, str]:
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.files_dir, job_id)
+        os.makedirs(job_dir)
+        return job_id, job_dir
+
+    def remove_job_dir(self, job_id: str) -> None:
+        shutil.rmtree(os.path.join(self.files_dir, job_id), ignore_errors=True)
+
+    def create(self, job_id: str, files: List[dict]) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, files, created_at, updated_at, available_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(files), now, now, now),
+            )
+
+    def claim(self, lease_seconds: float, max_attempts: Optional[int] = None) -> Optional[dict]:
+        """
+        Atomically take the oldest runnable job: queued and due, or running
+        with an expired lease.
+
+        A job whose lease expired after max_attempts attempts is failed
+        instead, so a job that keeps killing its worker isn't rerun forever.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                abandoned = []
+                if max_attempts is not None:
+                    abandoned = [row["id"] for row in conn.execute(
+                        "SELECT id FROM jobs WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+                        (RUNNING, now, max_attempts),
+                    )]
+                    for job_id in abandoned:
+                        conn.execute(
+                            "UPDATE jobs SET status = ?, error = ?, updated_at = ?, "
+                            "lease_expires_at = NULL WHERE id = ?",
+                            (FAILED, f"Worker lease expired after {max_attempts} attempts", now, job_id),
+                        )
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) "
+                    "OR (status = ? AND lease_expires_at < ?) "
+                    "ORDER BY available_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?, "
+                        "lease_expires_at = ? WHERE id = ?",
+                        (RUNNING, now, now + lease_seconds, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+        for job_id in abandoned:
+            logger.warning("Job %s failed: its lease expired after %d attempts", job_id, max_attempts)
+            self.remove_job_dir(job_id)
+        if row is None:
+            return None
+
+        job = self._to_dict(row)
+        job["status"] = RUNNING
+        job["attempts"] += 1
+        return job
+
+    def extend_lease(self, job_id: str, lease_seconds: float) -> None:
+        """
+        Keep a running job's lease from expiring while its worker is alive.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ?",
+                (time.time() + lease_seconds, job_id, RUNNING),
+            )
+
+    def complete(self, job_id: str, result: dict) -> None:
+        self._finish(job_id, SUCCEEDED, result=json.dumps(result))
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, FAILED, error=error)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, "
+                "lease_expires_at = NULL WHERE id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+
+    def retry(self, job_id: str, error: str, delay_seconds: float) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, available_at = ?, "
+                "lease_expires_at = NULL WHERE id = ?",
+                (QUEUED, error, now, now + delay_seconds, job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def prune(self, older_than_seconds: float) -> int:
+        """
+        Delete finished jobs last updated more than older_than_seconds ago.
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (SUCCEEDED, FAILED, time.time() - older_than_seconds),
+            ).rowcount
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        job = dict(row)
+        job["files"] = json.loads(job["files"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+class JobRunner:
+    """
+    Runs queued jobs on `workers` coroutines in this process, retrying
+    TransientJobError with exponential backoff up to max_attempts.
+    """
+
+    def __init__(self, store: JobStore, handler: Callable[[dict], Awaitable[dict]], workers: int,
+                 max_attempts: int, retry_base_seconds: float, lease_seconds: float,
+                 poll_seconds: float, retention_seconds: float):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """
+        Wake idle workers so a job submitted in this process starts right away.
+        """
+        self._wakeup.set()
+
+    async def _work(self) -> None:
+        while True:
+            job = await run_in_threadpool(self.store.claim, self.lease_seconds, self.max_attempts)
+            if job is None:
+                await run_in_threadpool(self.store.prune, self.retention_seconds)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Log lines of the job carry its id as their request id
+            token = REQUEST_ID.set(job["id"])
+            try:
+                await self._run(job)
+            finally:
+                REQUEST_ID.reset(token)
+
+    async def _run(self, job: dict) -> None:
+        job_id = job["id"]
+        logger.info("Running job %s, attempt %d", job_id, job["attempts"])
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            result = await self.handler(job)
+        except TransientJobError as e:
+            if job["attempts"] < self.max_attempts:
+                delay = self.retry_base_seconds * 2 ** (job["attempts"] - 1)
+                logger.warning("Job %s hit a transient error, retrying in %ss: %s", job_id, delay, e)
+                await run_in_threadpool(self.store.retry, job_id, str(e), delay)
+                return
+            await run_in_threadpool(self.store.fail, job_id, str(e))
+        except asyncio.CancelledError:
+            # Shutting down; the lease expires and another worker picks the job up
+            raise
+        except Exception as e:
+            logger.exception("Job %s failed: %s", job_id, e)
+            await run_in_threadpool(self.store.fail, job_id, str(e))
+        else:
+            await run_in_threadpool(self.store.complete, job_id, result)
+        finally:
+            heartbeat.cancel()
+
+        await run_in_threadpool(self.store.remove_job_dir, job_id)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """
+        Extend the job's lease every third of lease_seconds while it runs, so
+        only jobs whose worker died are claimed again.
+        """
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await run_in_threadpool(self.store.extend_lease, job_id, self.lease_seconds)
+            except sqlite3.Error as e:
+                logger.warning("Could not extend the lease of job %s: %s", job_id, e)
+
+
+_store = None
+_runner = None
+
+
+def get_job_store() -> JobStore:
+    global _store
+    if _store is None:
+        _store = JobStore(settings.JOB_DB_PATH, settings.JOB_FILES_DIR)
+    return _store
+
+
+def start_job_runner(handler: Callable[[dict], Awaitable[dict]]) -> JobRunner:
+    global _runner
+    _runner = JobRunner(
+        get_job_store(),
+        handler,
+        workers=settings.JOB_WORKERS,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        retry_base_seconds=settings.JOB_RETRY_BASE_SECONDS,
+        lease_seconds=settings.JOB_LEASE_SECONDS,
+        poll_seconds=settings.JOB_POLL_SECONDS,
+        retention_seconds=settings.JOB_RETENTION_SECONDS,
+    )
+    _runner.start()
+    return _runner
+
+
+def notify_job_runner() -> None:
+    if _runner is not None:
+        _runner.notify()
+
+
+async def stop_job_runner() -> None:
+    global _runner, _store
+    if _runner is not None:
+        await _runner.stop()
+        _runner = None
+    _store = None
@@ -0,0 +1,304 @@
+import math
+import re
+from dataclasses import dataclass, field
+from itertools import chain, islice
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.xlsx_utils import format_cell, open_workbook, rows_to_tsv
+
+# Bump when the detection or aggregation rules change, so cached results are recomputed
+AGGREGATES_VERSION = "1"
+
+AGGREGATE_FIELDS = ["line_items_count", "average_gross_weight", "average_price"]
+
+# Header patterns per column role, checked in this order; each column takes the first role it matches
+COLUMN_PATTERNS = [
+    ("unit_price", re.compile(r"unit\s*(price|value|cost)|\bprice\b|\brate\b")),
+    ("gross_weight", re.compile(r"gross|\bg\.?\s?w\b|weight")),
+    ("quantity", re.compile(r"\bqty\b|quantity|\bpcs\b|pieces")),
+    ("description", re.compile(r"desc|\bitems?\b|product|goods|commodity|article")),
+]
+# Headers that look like a role but hold something else: line totals, net weights
+COLUMN_EXCLUDES = {
+    "unit_price": re.compile(r"total|amount"),
+    "gross_weight": re.compile(r"\bnet\b|\bn\.?\s?w\b"),
+}
+# Weight columns are converted to kilograms based on the unit in their header
+WEIGHT_UNITS = [
+    (re.compile(r"\blbs?\b|pounds?"), 0.45359237),
+    (re.compile(r"\btons?\b|\btonnes?\b|\bmt\b|\(t\)"), 1000.0),
+]
+TOTAL_ROW = re.compile(r"^\s*(sub\s*)?total|^\s*sum\b|合计|总计")
+NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+@dataclass
+class LineItemTable:
+    """
+    A detected line-item table: its header row, the columns found for each
+    role, and what summarize_workbook has read of its line items so far: the
+    count, the first LINE_ITEM_SAMPLE_ROWS rows, and running sums and counts
+    of the numeric price and weight cells.
+    """
+    sheet: str
+    header_row: int
+    columns: Dict[str, int]
+    header: tuple = ()
+    weight_factor: float = 1.0
+    item_count: int = 0
+    sample_rows: List[tuple] = field(default_factory=list)
+    sums: Dict[str, float] = field(default_factory=dict)
+    counts: Dict[str, int] = field(default_factory=dict)
+
+    def add_item(self, cells: tuple):
+        self.item_count += 1
+        if len(self.sample_rows) < settings.LINE_ITEM_SAMPLE_ROWS:
+            self.sample_rows.append(cells)
+        for role in ("unit_price", "gross_weight"):
+            index = self.columns.get(role)
+            if index is None or index >= len(cells):
+                continue
+            value = to_number(cells[index])
+            if not math.isnan(value):
+                self.sums[role] = self.sums.get(role, 0.0) + value
+                self.counts[role] = self.counts.get(role, 0) + 1
+
+    def summary_size(self) -> int:
+        """
+        Rows summarize_table renders for the items read so far.
+        """
+        return 1 + len(self.sample_rows) + (self.item_count > len(self.sample_rows))
+
+    def average(self, role: str) -> Optional[float]:
+        """
+        Mean of the role's numeric cells, skipping rows without a value;
+        None if there are none.
+        """
+        if not self.counts.get(role):
+            return None
+        average = self.sums[role] / self.counts[role]
+        return average * self.weight_factor if role == "gross_weight" else average
+
+
+def to_number(value) -> float:
+    """
+    Read a numeric cell, also accepting strings such as "1,234.50 kg" or "$3";
+    anything else is NaN.
+    """
+    if isinstance(value, bool) or value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = NUMBER.search(str(value).replace(",", ""))
+    return float(match.group()) if match else math.nan
+
+
+def match_columns(row: tuple) -> Dict[str, int]:
+    columns = {}
+    for index, value in enumerate(row):
+        if not isinstance(value, str):
+            continue
+        header = " ".join(value.lower().split())
+        for role, pattern in COLUMN_PATTERNS:
+            if not pattern.search(header):
+                continue
+            if role in COLUMN_EXCLUDES and COLUMN_EXCLUDES[role].search(header):
+                continue
+            # A later explicit "gross weight" column wins over a plain "weight" one
+            if role in columns and not (role == "gross_weight" and "gross" in header):
+                continue
+            columns[role] = index
+            break
+    return columns
+
+
+def find_line_item_table(sheet: str, rows: List[tuple]) -> Optional[LineItemTable]:
+    """
+    Find the header of a sheet's line-item table: the first of rows (the
+    sheet's first LINE_ITEM_HEADER_SCAN_ROWS) naming at least two roles, one
+    of them a price or weight. The line items are the rows after it up to the
+    first empty row, see summarize_workbook.
+    """
+    for header_row, row in enumerate(rows[:settings.LINE_ITEM_HEADER_SCAN_ROWS]):
+        columns = match_columns(row)
+        if len(columns) < 2 or not ({"unit_price", "gross_weight"} & columns.keys()):
+            continue
+
+        table = LineItemTable(sheet, header_row, columns, header=row)
+        if "gross_weight" in columns:
+            header = str(row[columns["gross_weight"]]).lower()
+            table.weight_factor = next((factor for unit, factor in WEIGHT_UNITS if unit.search(header)), 1.0)
+        return table
+    return None
+
+
+def is_total_row(cells: tuple) -> bool:
+    return any(isinstance(value, str) and TOTAL_ROW.search(value.lower()) for value in cells)
+
+
+def is_line_item(cells: tuple, columns: Dict[str, int]) -> bool:
+    """
+    Line items have a description, or a quantity when the table has no
+    description column; totals rows usually have neither.
+    """
+    def cell(role):
+        index = columns.get(role)
+        return cells[index] if index is not None and index < len(cells) else None
+
+    if "description" in columns:
+        return cell("description") not in (None, "")
+    return not math.isnan(to_number(cell("quantity")))
+
+
+def compute_aggregates(tables: List[LineItemTable]) -> dict:
+    """
+    Compute line_items_count, average_gross_weight (kg) and average_price
+    from the detected tables.
+
+    The count and average price come from the first table with a unit price
+    column (the invoice), falling back to the first table; the average gross
+    weight comes from the first table with a weight column (the packing
+    list). Averages skip rows without a value. Returns the computed fields
+    plus "sources", the sheet each field was computed from.
+    """
+    aggregates = {"sources": {}}
+    if not tables:
+        return aggregates
+
+    priced = [table for table in tables if "unit_price" in table.columns]
+    weighed = [table for table in tables if "gross_weight" in table.columns]
+
+    count_table = priced[0] if priced else tables[0]
+    aggregates["line_items_count"] = count_table.item_count
+    aggregates["sources"]["line_items_count"] = count_table.sheet
+
+    for name, role, candidates in (("average_price", "unit_price", priced),
+                                   ("average_gross_weight", "gross_weight", weighed)):
+        if candidates and candidates[0].average(role) is not None:
+            aggregates[name] = round(candidates[0].average(role), 4)
+            aggregates["sources"][name] = candidates[0].sheet
+
+    return aggregates
+
+
+def summarize_table(table: LineItemTable) -> List[List[str]]:
+    """
+    Header plus the first LINE_ITEM_SAMPLE_ROWS line items, and a note in
+    place of the rest, so the LLM sees the table's layout but not every row.
+    """
+    summary = [[format_cell(value) for value in row] for row in [table.header] + table.sample_rows]
+    omitted = table.item_count - len(table.sample_rows)
+    if omitted:
+        summary.append([
+            f"[{table.item_count} line items, {omitted} more not shown; "
+            f"count and averages are computed from the full table]"
+        ])
+    return summary
+
+
+def summarize_sheet(worksheet, max_rows: int, max_columns: Optional[int]) -> Tuple[str, Optional[LineItemTable]]:
+    """
+    Stream a worksheet's rows once: the first LINE_ITEM_HEADER_SCAN_ROWS are
+    searched for a line-item table header, the table's line items are
+    counted and summed as they're read, and other non-empty rows are
+    rendered like extract_text_from_xlsx, capped at max_rows. Only the header
+    rows and the table sample are held in memory.
+
+    Returns the sheet's text and its table, if it has line items.
+    """
+    rows = worksheet.iter_rows(max_col=max_columns, values_only=True)
+    head = list(islice(rows, settings.LINE_ITEM_HEADER_SCAN_ROWS))
+    table = find_line_item_table(worksheet.title, head)
+
+    lines = []
+    summary_at = None
+    # Rendered once the table is closed; until then only its size is tracked
+    summary = None
+    in_table = False
+    truncated = False
+    for index, row in enumerate(chain(head, rows)):
+        if table and index == table.header_row:
+            in_table = True
+            if not truncated:
+                summary_at = len(lines)
+            continue
+        if in_table:
+            if not any(value not in (None, "") for value in row):
+                # The first empty row after the line items ends the table
+                if table.item_count:
+                    in_table = False
+                    summary = summarize_table(table)
+                continue
+            if not is_total_row(row) and is_line_item(row, table.columns):
+                table.add_item(row)
+                continue
+        elif truncated and (table is None or index > table.header_row):
+            # Nothing left to render or count
+            break
+        if truncated:
+            continue
+
+        cells = [format_cell(value) for value in row]
+        if not any(cells):
+            continue
+        if summary_at is None:
+            summary_size = 0
+        else:
+            summary_size = len(summary) if summary is not None else table.summary_size()
+        if max_rows and len(lines) + summary_size >= max_rows:
+            truncated = True
+            continue
+        lines.append(cells)
+
+    if summary_at is not None:
+        lines[summary_at:summary_at] = summary if summary is not None else summarize_table(table)
+    text = rows_to_tsv(lines)
+    if truncated:
+        text += f"\n[truncated after {max_rows} rows]"
+    return text, table if table and table.item_count else None
+
+
+def summarize_workbook(file_path: str) -> Tuple[str, dict]:
+    """
+    Extract an XLSX workbook's text with its line-item tables summarized,
+    and compute the line-item aggregates from the full tables.
+
+    Rows outside line-item tables are rendered like extract_text_from_xlsx,
+    capped at XLSX_MAX_ROWS_PER_SHEET per sheet. Rows are streamed, so memory
+    doesn't grow with the table length; see summarize_sheet.
+
+    Returns:
+        Tuple[str, dict]: Document text and the compute_aggregates result
+    """
+    max_columns = settings.XLSX_MAX_COLUMNS or None
+    max_rows = settings.XLSX_MAX_ROWS_PER_SHEET
+
+    workbook = open_workbook(file_path)
+    try:
+        sheets = []
+        tables = []
+        for worksheet in workbook.worksheets:
+            text, table = summarize_sheet(worksheet, max_rows, max_columns)
+            if table:
+                tables.append(table)
+            if text:
+                sheets.append(f"Sheet: {worksheet.title}\n{text}")
+    finally:
+        workbook.close()
+
+    return "\n\n".join(sheets), compute_aggregates(tables)
+
+
+def merge_aggregates(extraction: dict, aggregates: dict) -> dict:
+    """
+    Override the LLM's line-item fields with the computed aggregates.
+    Returns a new dict; error results are returned unchanged.
+    """
+    if not extraction or "error" in extraction:
+        return extraction
+    merged = dict(extraction)
+    for name in AGGREGATE_FIELDS:
+        if name in aggregates:
+            merged[name] = aggregates[name]
+    return merged
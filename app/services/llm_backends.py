@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.services.llm_gateway import add_token_usage, create_chat_completion, track_token_usage
+
+
+class ReplayMissError(LookupError):
+    """
+    A replayed request was never recorded.
+    """
+
+
+class LLMBackend(ABC):
+    """
+    Sends the text and vision extraction requests. Implement this to plug in
+    another model provider or a stand-in; OpenAI is the default.
+    """
+
+    @abstractmethod
+    async def complete(self, model: str, messages: list, response_format: dict) -> str:
+        """
+        Return the message content of a chat completion for messages, which
+        must be JSON matching response_format.
+        """
+        ...
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    Chat completions through the LLM gateway. base_url points the client at
+    an OpenAI-compatible server instead, such as the local stand-in in
+    app.services.llm_stub.
+    """
+
+    def __init__(self, base_url: Optional[str] = None):
+        self.base_url = base_url
+
+    async def complete(self, model: str, messages: list, response_format: dict) -> str:
+        response = await create_chat_completion(
+            model=model,
+            messages=messages,
+            response_format=response_format,
+            base_url=self.base_url,
+        )
+        return response.choices[0].message.content
+
+
+def request_key(model: str, messages: list, response_format: dict) -> str:
+    payload = json.dumps([model, messages, response_format], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RecordReplayBackend(LLMBackend):
+    """
+    Records responses of another backend to a JSON lines file keyed on the
+    request, or replays them without any network calls. With replay_latency
+    set, a replayed response is returned after the time the recorded call
+    took. With reuse set, a recording backend answers requests it has
+    already recorded from the file, as a response cache.
+
+    Token usage is recorded too, and replayed responses report it to
+    track_token_usage as if the call had been made.
+    """
+
+    def __init__(self, path: str, backend: Optional[LLMBackend] = None, replay_latency: bool = False,
+                 reuse: bool = False):
+        self.path = path
+        self.backend = backend
+        self.replay_latency = replay_latency
+        self.reuse = reuse
+        self._lock = threading.Lock()
+        self.recordings: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        recording = json.loads(line)
+                        self.recordings[recording["key"]] = recording
+
+    @property
+    def recording(self) -> bool:
+        return self.backend is not None
+
+    async def complete(self, model: str, messages: list, response_format: dict) -> str:
+        key = request_key(model, messages, response_format)
+        recording = self.recordings.get(key)
+        if not self.recording or (self.reuse and recording is not None):
+            if recording is None:
+                raise ReplayMissError(f"No recorded response for request {key[:12]} in {self.path}")
+            if self.replay_latency:
+                await asyncio.sleep(recording["seconds"])
+            add_token_usage(recording.get("usage", {}))
+            return recording["content"]
+
+        start = time.perf_counter()
+        with track_token_usage() as usage:
+            content = await self.backend.complete(model, messages, response_format)
+        self._save({
+            "key": key,
+            "model": model,
+            "seconds": round(time.perf_counter() - start, 3),
+            "usage": usage,
+            "content": content,
+        })
+        return content
+
+    def _save(self, recording: dict) -> None:
+        with self._lock:
+            self.recordings[recording["key"]] = recording
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(recording) + "\n")
+
+
+LLM_BACKENDS = {
+    "openai": lambda: OpenAIBackend(),
+    "stub": lambda: OpenAIBackend(base_url=settings.LLM_STUB_URL),
+    "record": lambda: RecordReplayBackend(settings.LLM_RECORDINGS_PATH, backend=OpenAIBackend()),
+    "replay": lambda: RecordReplayBackend(settings.LLM_RECORDINGS_PATH, replay_latency=settings.LLM_REPLAY_LATENCY),
+}
+
+_backend = None
+
+
+def set_llm_backend(backend: Optional[LLMBackend]) -> None:
+    """
+    Use backend instead of the configured one, e.g. from a script that wraps
+    it in a response cache; None goes back to LLM_BACKEND.
+    """
+    global _backend
+    _backend = backend
+
+
+def get_llm_backend() -> LLMBackend:
+    """
+    Return the configured LLM backend.
+    """
+    global _backend
+    if _backend is None:
+        if settings.LLM_BACKEND not in LLM_BACKENDS:
+            raise ValueError(f"Unknown LLM backend: {settings.LLM_BACKEND}")
+        _backend = LLM_BACKENDS[settings.LLM_BACKEND]()
+    return _backend
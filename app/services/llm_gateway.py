@@ -0,0 +1,281 @@
+import asyncio
+import email.utils
+import logging
+import os
+import random
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+from openai import (
+    DEFAULT_CONNECTION_LIMITS,
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    InternalServerError,
+    RateLimitError,
+)
+
+from app.core.config import settings
+from app.core.metrics import (
+    LLM_ERRORS, LLM_QUEUE_SECONDS, LLM_REQUEST_SECONDS, LLM_REQUESTS_IN_FLIGHT, LLM_TOKENS,
+)
+
+logger = logging.getLogger(__name__)
+
+# OpenAI failures that may succeed if the same request is sent again later
+TRANSIENT_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError)
+
+# Connection limits class of the SDK's HTTP library (httpx.Limits)
+Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+# Token totals of the enclosing track_token_usage block, if any
+_token_usage: ContextVar[Optional[Dict[str, int]]] = ContextVar("token_usage", default=None)
+
+# event loop -> {base_url: client}; pooled connections belong to the loop that opened them
+_clients = weakref.WeakKeyDictionary()
+# event loop -> the _close_on_loop_shutdown generator closing its clients
+_client_closers = weakref.WeakKeyDictionary()
+_limiter = None
+
+
+class TokenBucket:
+    """
+    Allows rate requests per second on average, with bursts of up to
+    capacity. Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Limiter:
+    """
+    Concurrency semaphores and rate limiter of one event loop.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.requests = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        self.models: Dict[str, asyncio.Semaphore] = {}
+        rate = settings.LLM_REQUESTS_PER_MINUTE / 60
+        self.bucket = TokenBucket(rate, settings.LLM_RATE_LIMIT_BURST) if rate > 0 else None
+
+    def model(self, name: str) -> asyncio.Semaphore:
+        if name not in self.models:
+            self.models[name] = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY_PER_MODEL)
+        return self.models[name]
+
+
+def _get_limiter() -> _Limiter:
+    # asyncio primitives belong to the loop they are first used on
+    global _limiter
+    if _limiter is None or _limiter.loop is not asyncio.get_running_loop():
+        _limiter = _Limiter()
+    return _limiter
+
+
+async def _close_on_loop_shutdown(clients: Dict[Optional[str], AsyncOpenAI]):
+    # Suspended until the loop shuts down its async generators (asyncio.run does
+    # before closing the loop), then closes the loop's clients while it still runs
+    try:
+        yield
+    finally:
+        await _close(clients)
+
+
+async def _close(clients: Dict[Optional[str], AsyncOpenAI]) -> None:
+    while clients:
+        _, client = clients.popitem()
+        await client.close()
+
+
+def _loop_clients() -> Dict[Optional[str], AsyncOpenAI]:
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        clients = _clients[loop] = {}
+        closer = _close_on_loop_shutdown(clients)
+        # The first step registers the generator with the running loop
+        try:
+            closer.asend(None).send(None)
+        except StopIteration:
+            pass
+        # The loop only keeps a weak reference to the generator
+        _client_closers[loop] = closer
+    return _clients[loop]
+
+
+def get_client(base_url: Optional[str] = None) -> AsyncOpenAI:
+    """
+    The shared OpenAI client of the running event loop, created on first
+    use; one per base_url when an OpenAI-compatible server is used instead.
+    Its connection pool is sized to LLM_MAX_CONCURRENCY so every allowed
+    request has a warm connection; the SDK's own retries are off because the
+    gateway retries. Clients are closed by close_client, or when their loop
+    shuts down, e.g. at the end of each asyncio.run() in scripts and tests.
+    """
+    clients = _loop_clients()
+    if base_url not in clients:
+        clients[base_url] = AsyncOpenAI(
+            # A local stand-in server doesn't check the key
+            api_key=os.getenv("OPENAI_API_KEY") or ("unused" if base_url else None),
+            base_url=base_url,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=Limits(
+                max_connections=settings.LLM_MAX_CONCURRENCY,
+                max_keepalive_connections=settings.LLM_MAX_CONCURRENCY,
+                keepalive_expiry=settings.LLM_KEEPALIVE_SECONDS,
+            )),
+        )
+    return clients[base_url]
+
+
+async def close_client() -> None:
+    """
+    Close the running event loop's clients.
+    """
+    clients = _clients.get(asyncio.get_running_loop())
+    if clients:
+        await _close(clients)
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Seconds to wait before retrying after error: the server's Retry-After
+    when it sends one, otherwise exponential backoff with full jitter.
+    Both are capped at LLM_RETRY_MAX_SECONDS.
+    """
+    headers = error.response.headers if isinstance(error, APIStatusError) else {}
+
+    retry_after = None
+    try:
+        if headers.get("retry-after-ms"):
+            retry_after = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("retry-after"):
+            value = headers["retry-after"]
+            if value.replace(".", "", 1).isdigit():
+                retry_after = float(value)
+            else:
+                retry_after = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+    except (TypeError, ValueError):
+        pass
+    if retry_after is not None and retry_after >= 0:
+        return min(retry_after, settings.LLM_RETRY_MAX_SECONDS)
+
+    backoff = settings.LLM_RETRY_BASE_SECONDS * 2 ** attempt
+    return random.uniform(0, min(backoff, settings.LLM_RETRY_MAX_SECONDS))
+
+
+# Usage fields per token kind: chat completions name them prompt/completion, the Responses API input/output
+TOKEN_USAGE_FIELDS = {
+    "prompt": ("prompt_tokens", "input_tokens"),
+    "completion": ("completion_tokens", "output_tokens"),
+}
+
+
+@contextmanager
+def track_token_usage():
+    """
+    Count the tokens of the LLM calls made inside the block, including in
+    tasks started from it. Yields the totals by kind ("prompt",
+    "completion"), which are also added to an enclosing block's on exit.
+    """
+    usage = {}
+    token = _token_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _token_usage.reset(token)
+        add_token_usage(usage)
+
+
+def add_token_usage(usage: Dict[str, int]) -> None:
+    """
+    Add token counts to the enclosing track_token_usage block, if any.
+    """
+    totals = _token_usage.get()
+    if totals is not None:
+        for kind, count in usage.items():
+            totals[kind] = totals.get(kind, 0) + count
+
+
+def _count_tokens(model: str, response) -> None:
+    usage = getattr(response, "usage", None)
+    for kind, names in TOKEN_USAGE_FIELDS.items():
+        for name in names:
+            count = getattr(usage, name, None)
+            if isinstance(count, int):
+                LLM_TOKENS.labels(model, kind).inc(count)
+                add_token_usage({kind: count})
+                break
+
+
+async def _send(method: Callable[[AsyncOpenAI], Callable], model: str, max_retries: Optional[int],
+                base_url: Optional[str] = None, **kwargs):
+    max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+    limiter = _get_limiter()
+    attempt = 0
+    while True:
+        queued = time.perf_counter()
+        # Throttled requests wait for a token without holding a concurrency slot
+        if limiter.bucket:
+            await limiter.bucket.acquire()
+        async with limiter.requests, limiter.model(model):
+            start = time.perf_counter()
+            LLM_QUEUE_SECONDS.labels(model).observe(start - queued)
+            LLM_REQUESTS_IN_FLIGHT.labels(model).inc()
+            try:
+                response = await method(get_client(base_url))(model=model, **kwargs)
+                LLM_REQUEST_SECONDS.labels(model, "success").observe(time.perf_counter() - start)
+                _count_tokens(model, response)
+                return response
+            except Exception as e:
+                LLM_REQUEST_SECONDS.labels(model, "error").observe(time.perf_counter() - start)
+                LLM_ERRORS.labels(model, type(e).__name__).inc()
+                if not isinstance(e, TRANSIENT_ERRORS) or attempt >= max_retries:
+                    raise
+                delay = retry_delay(e, attempt)
+                logger.info(
+                    "OpenAI request failed (%s), retry %d/%d in %.1fs", type(e).__name__, attempt + 1, max_retries, delay,
+                )
+            finally:
+                LLM_REQUESTS_IN_FLIGHT.labels(model).dec()
+        # Back off without holding a concurrency slot
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def create_chat_completion(model: str, max_retries: Optional[int] = None, base_url: Optional[str] = None, **kwargs):
+    """
+    client.chat.completions.create through the gateway: waits for a global
+    and a per-model concurrency slot and a rate limiter token, and retries
+    429s, 5xx responses, timeouts and connection errors up to LLM_MAX_RETRIES
+    times.
+    """
+    return await _send(lambda client: client.chat.completions.create, model, max_retries, base_url, **kwargs)
+
+
+async def parse_response(model: str, max_retries: Optional[int] = None, **kwargs):
+    """
+    client.responses.parse through the gateway, see create_chat_completion.
+    """
+    return await _send(lambda client: client.responses.parse, model, max_retries, **kwargs)
@@ -1,29 +1,83 @@
-from openai import OpenAI
+from app.core.concurrency import run_in_parsing_pool
 from app.core.config import settings
-import os
+from app.core.metrics import EXTRACTION_ERRORS, VISION_DECISIONS, timed_stage
+from app.services.document_processor import encode_pdf_images
+from app.services.llm_backends import get_llm_backend
+from app.services.llm_gateway import TRANSIENT_ERRORS
+from app.services.line_items import AGGREGATES_VERSION, AGGREGATE_FIELDS, merge_aggregates
+from app.services.prompt_builder import build_document_text
+from app.services.rule_extractor import RULES_VERSION, extract_fields_with_rules
+from app.services.vision_policy import VISION_POLICY_VERSION, decide_vision
+from app.utils.image_utils import vision_mime_type
+import asyncio
+import copy
+import hashlib
 import json
+import logging
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = settings.LLM_MODEL
+
+# Prompt line for each schema field, in schema order
+FIELD_PROMPTS = {
+    "bill_of_lading_number": 'Bill of lading number (may appear as "Bill of lading NO" in the document)',
+    "container_number": "Container Number",
+    "consignee_name": "Consignee Name",
+    "consignee_address": "Consignee Address",
+    "date_of_export": "Date of export (format as YYYY-MM-DD)",
+    "date": "Date (format as YYYY-MM-DD)",
+    "line_items_count": "Line Items Count (as an integer)",
+    "average_gross_weight": "Average Gross Weight (as a number in kilograms, extract numeric value only)",
+    "average_price": "Average Price (as a number in USD, extract numeric value only)",
+}
+
+def field_instructions(fields):
+    return "\n" + "\n".join(f"    - {FIELD_PROMPTS[name]}" for name in fields) + """
+
+    If a field cannot be found, set it to null."""
+
+def text_prompt_template(fields):
+    return """Extract the following fields from the provided documents:
+""" + field_instructions(fields) + """
+
+    Documents:
+    {document_text}
+    """
+
+FIELD_INSTRUCTIONS = field_instructions(FIELD_PROMPTS)
+
+TEXT_SYSTEM_PROMPT = "You are a helpful assistant that extracts structured data from documents."
+
+TEXT_PROMPT_TEMPLATE = text_prompt_template(FIELD_PROMPTS)
+
+VISION_SYSTEM_PROMPT = "You are a helpful assistant that extracts structured data from document images."
+
+def vision_prompt(fields):
+    return "Extract the following fields from the provided document images:\n" + field_instructions(fields)
+
+VISION_PROMPT = vision_prompt(FIELD_PROMPTS)
 
 def format_extracted_data(data):
     if not data or "error" in data:
         return data
     
-    formatted = data.copy()
-    
-    if formatted.get("average_price") is not None:
-        try:
-            price = float(formatted["average_price"])
-            formatted["average_price"] = f"${price:.2f}"
-        except (ValueError, TypeError):
-            pass
-    
-    if formatted.get("average_gross_weight") is not None:
-        try:
-            weight = float(formatted["average_gross_weight"])
-            formatted["average_gross_weight"] = f"{weight:.2f} kg"
-        except (ValueError, TypeError):
-            pass
+    with timed_stage("format"):
+        formatted = data.copy()
+        
+        if formatted.get("average_price") is not None:
+            try:
+                price = float(formatted["average_price"])
+                formatted["average_price"] = f"${price:.2f}"
+            except (ValueError, TypeError):
+                pass
+        
+        if formatted.get("average_gross_weight") is not None:
+            try:
+                weight = float(formatted["average_gross_weight"])
+                formatted["average_gross_weight"] = f"{weight:.2f} kg"
+            except (ValueError, TypeError):
+                pass
     
     return formatted
 
@@ -88,32 +142,75 @@ EXTRACTION_SCHEMA = {
     }
 }
 
-def extract_from_images(pdf_images):
+SCHEMA_FIELDS = EXTRACTION_SCHEMA["json_schema"]["schema"]["required"]
+
+def extraction_schema(fields):
+    """
+    EXTRACTION_SCHEMA narrowed to the given fields.
+    """
+    schema = copy.deepcopy(EXTRACTION_SCHEMA)
+    body = schema["json_schema"]["schema"]
+    body["properties"] = {name: body["properties"][name] for name in fields}
+    body["required"] = list(fields)
+    return schema
+
+# Changes whenever the schema changes, so cached results never outlive it
+EXTRACTION_SCHEMA_VERSION = hashlib.sha256(
+    json.dumps(EXTRACTION_SCHEMA, sort_keys=True).encode("utf-8")
+).hexdigest()[:16]
+
+# Bump when select_vision_images or encode_vision_pages changes, so cached results are recomputed
+VISION_SELECTION_VERSION = "2"
+
+def extraction_fingerprint():
+    """
+    Identify everything besides the documents that shapes an extraction result:
+    the backend, the model, the schema version, the prompts, and the settings
+    that change what the model is shown: page image encoding, OCR, spreadsheet
+    limits and prompt chunking.
+    """
+    payload = json.dumps({
+        "model": MODEL_NAME,
+        "backend": settings.LLM_BACKEND,
+        "schema_version": EXTRACTION_SCHEMA_VERSION,
+        "aggregates_version": AGGREGATES_VERSION if settings.LINE_ITEM_AGGREGATES_ENABLED else None,
+        "prompt_token_budget": settings.PROMPT_TOKEN_BUDGET,
+        "prompt_chunking": [settings.PROMPT_CHUNK_TOKENS, settings.PROMPT_TOKENIZER_ENCODING],
+        "xlsx_limits": [settings.XLSX_MAX_ROWS_PER_SHEET, settings.XLSX_MAX_COLUMNS],
+        "ocr": [settings.OCR_DPI, settings.OCR_MIN_PAGE_CHARS, settings.OCR_MIN_GLYPH_DENSITY],
+        "vision_images": [
+            settings.VISION_DPI, settings.VISION_MAX_LONG_EDGE, settings.VISION_MIN_LONG_EDGE,
+            settings.VISION_GRAYSCALE, settings.VISION_CROP_WHITESPACE, settings.VISION_IMAGE_FORMAT,
+            settings.VISION_IMAGE_QUALITY, settings.VISION_MAX_REQUEST_BYTES,
+        ],
+        "pdf_text_backend": settings.PDF_TEXT_BACKEND,
+        "vision_selection": VISION_SELECTION_VERSION,
+        "vision_policy": ([VISION_POLICY_VERSION, settings.VISION_MIN_OCR_CONFIDENCE]
+                          if settings.VISION_POLICY == "adaptive" else settings.VISION_POLICY),
+        "pdf_page_limits": [settings.PDF_MAX_OCR_PAGES, settings.VISION_MAX_PAGES, settings.PDF_FIRST_PAGES],
+        "rules": [RULES_VERSION, settings.RULES_MIN_CONFIDENCE] if settings.RULES_ENABLED else None,
+        "prompts": [TEXT_SYSTEM_PROMPT, TEXT_PROMPT_TEMPLATE, VISION_SYSTEM_PROMPT, VISION_PROMPT],
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+async def extract_from_images(pdf_images, fields=None):
+    """
+    Extract the schema fields, or only fields if given, from page images.
+    """
     if not pdf_images:
         return None
     
-    print(f"DEBUG: Extracting from {len(pdf_images)} images using Vision API")
+    logger.debug("Extracting from %d images using the vision model", len(pdf_images))
+    prompt = VISION_PROMPT if fields is None else vision_prompt(fields)
     
     messages = [
-        {"role": "system", "content": "You are a helpful assistant that extracts structured data from document images."},
+        {"role": "system", "content": VISION_SYSTEM_PROMPT},
         {
             "role": "user",
             "content": [
                 {
                     "type": "text",
-                    "text": """Extract the following fields from the provided document images:
-
-    - Bill of lading number (may appear as "Bill of lading NO" in the document)
-    - Container Number
-    - Consignee Name
-    - Consignee Address
-    - Date of export (format as YYYY-MM-DD)
-    - Date (format as YYYY-MM-DD)
-    - Line Items Count (as an integer)
-    - Average Gross Weight (as a number in kilograms, extract numeric value only)
-    - Average Price (as a number in USD, extract numeric value only)
-
-    If a field cannot be found, set it to null."""
+                    "text": prompt
                 }
             ]
         }
@@ -123,92 +220,275 @@ def extract_from_images(pdf_images):
         messages[1]["content"].append({
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/png;base64,{img_base64}"
+                "url": f"data:{vision_mime_type()};base64,{img_base64}"
             }
         })
     
     try:
-        response = client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=messages,
-            response_format=EXTRACTION_SCHEMA,
-        )
+        with timed_stage("llm_vision"):
+            content = await get_llm_backend().complete(
+                model=MODEL_NAME,
+                messages=messages,
+                response_format=EXTRACTION_SCHEMA if fields is None else extraction_schema(fields),
+            )
         
-        extracted_data = json.loads(response.choices[0].message.content)
-        print(f"DEBUG: Vision API extracted data: {extracted_data}")
+        extracted_data = json.loads(content)
+        logger.debug("Vision extracted data: %s", extracted_data)
         formatted_data = format_extracted_data(extracted_data)
         return formatted_data
         
     except Exception as e:
-        print(f"DEBUG: Vision API Error: {str(e)}")
-        return {"error": str(e)}
+        logger.warning("Vision extraction failed: %s", e)
+        return _error_result(e)
+
+async def extract_from_text(document_text, known=None):
+    """
+    Extract the schema fields from document text. Fields in known (found
+    locally) are not asked for: the LLM gets a schema and prompt narrowed to
+    the remaining fields, and is not called at all when none remain.
+    """
+    known = known or {}
+    fields = [name for name in SCHEMA_FIELDS if name not in known]
+    if not fields:
+        logger.debug("All fields found locally, skipping the text LLM call")
+        return format_extracted_data({name: known[name] for name in SCHEMA_FIELDS})
+
+    prompt = text_prompt_template(fields).format(document_text=document_text)
+    response_format = extraction_schema(fields) if known else EXTRACTION_SCHEMA
+
+    try:
+        with timed_stage("llm_text"):
+            content = await get_llm_backend().complete(
+                model=MODEL_NAME,
+                messages=[
+                    {"role": "system", "content": TEXT_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                response_format=response_format,
+            )
+        
+        extracted_data = json.loads(content)
+        logger.debug("Text extracted data: %s", extracted_data)
+        extracted_data = {name: known[name] if name in known else extracted_data.get(name) for name in SCHEMA_FIELDS}
+        
+        return format_extracted_data(extracted_data)
+        
+    except json.JSONDecodeError as e:
+        logger.warning("Could not parse the text extraction response: %s; response: %s", e, content)
+        return {"error": f"Failed to parse JSON response: {str(e)}"}
+    except Exception as e:
+        logger.warning("Text extraction failed: %s", e)
+        return _error_result(e)
+
+def _error_result(e):
+    """
+    Error result for a failed API call; transient failures are flagged as
+    retryable so the job runner can try again later.
+    """
+    result = {"error": str(e)}
+    if isinstance(e, TRANSIENT_ERRORS):
+        result["retryable"] = True
+    return result
 
-def extract_field_from_document(document_data):
-    print(f"DEBUG: Received document_data: {document_data}")
-    print(f"DEBUG: document_data keys: {document_data.keys() if document_data else 'None'}")
+async def _with_timeout(coro, label, event=None, progress=None):
+    """
+    Await an extraction call, cancelling it once LLM_CALL_TIMEOUT_SECONDS elapses.
+    A timeout is reported as an error result so the other path can still succeed.
+    The result is passed to progress(event, result) as soon as it is available.
+    """
+    timeout = settings.LLM_CALL_TIMEOUT_SECONDS
+    try:
+        result = await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning("%s timed out after %ss", label, timeout)
+        result = {"error": f"{label} timed out after {timeout}s", "retryable": True}
+
+    if "error" in result:
+        EXTRACTION_ERRORS.labels(event).inc()
+    if progress:
+        progress(event, result)
+    return result
+
+def select_vision_images(document_data):
+    """
+    The page images for the vision call from all PDFs in document_data, up
+    to VISION_MAX_PAGES. Files take turns, page by page, so every PDF's first
+    pages go in before any PDF's later ones; the byte budget was applied
+    across files when the pages were encoded (see encode_vision_pages).
+
+    Returns (file index, image) pairs in file and page order.
+    """
+    by_file = [(f["file"], f["images"]) for f in document_data.get('files', []) if f.get("images")]
+    if not by_file and document_data.get('pdf_images'):
+        by_file = [(0, document_data['pdf_images'])]
+
+    order = sorted((rank, position) for position, (_, images) in enumerate(by_file) for rank in range(len(images)))
+    if settings.VISION_MAX_PAGES:
+        order = order[:settings.VISION_MAX_PAGES]
+    chosen = set(order)
+
+    return [
+        (file, image)
+        for position, (file, images) in enumerate(by_file)
+        for rank, image in enumerate(images) if (rank, position) in chosen
+    ]
+
+def has_vision_pages(document_data):
+    """
+    Whether document_data has PDF pages for the vision call, encoded or not.
+    """
+    return bool(document_data.get('pdf_images')) or any(
+        f.get("images") or "rendered_pages" in f for f in document_data.get('files', [])
+    )
+
+async def encode_vision_images(document_data):
+    """
+    Encode the vision pages of the PDFs in document_data that aren't yet, on
+    the parsing pool, and pick the images for the vision call, see
+    select_vision_images. Called only once the vision call is going to run.
+    """
+    files = document_data.get('files', [])
+    if any("rendered_pages" in f for f in files):
+        await run_in_parsing_pool(encode_pdf_images, files)
+    return select_vision_images(document_data)
+
+def _ocr_confidence(document_data):
+    """
+    The lowest OCR confidence of the PDFs in document_data; None if none was OCR'd.
+    """
+    confidences = [f["ocr_confidence"] for f in document_data.get('files', [])
+                   if f.get("ocr_confidence") is not None]
+    return min(confidences) if confidences else None
+
+async def _vision_for_fields(pdf_images, fields, text_data, known):
+    """
+    Ask the vision model for fields only. The other fields of the result are
+    the text result's, or the locally known ones if the text call failed.
+    """
+    vision_data = await extract_from_images(pdf_images, fields)
+    if "error" in vision_data:
+        return vision_data
+    others = text_data if "error" not in text_data else format_extracted_data(
+        {name: known.get(name) for name in SCHEMA_FIELDS}
+    )
+    return {name: vision_data.get(name) if name in fields else others.get(name) for name in SCHEMA_FIELDS}
+
+async def _with_aggregates(coro, aggregates):
+    """
+    Replace the LLM's line-item fields in an extraction result with the ones
+    computed from the spreadsheets.
+    """
+    return format_extracted_data(merge_aggregates(await coro, aggregates))
+
+async def extract_field_from_document(document_data, progress=None):
+    """
+    Run the text extraction and, following VISION_POLICY, the vision
+    extraction, and combine the results. With the "adaptive" policy the vision
+    call waits for the text result and runs only for the fields decide_vision
+    picks; with "always" both run concurrently.
+
+    progress, if given, is called as progress("text_extraction", result) and
+    progress("vision_extraction", result) as each call finishes, so callers
+    can show one result without waiting for the other.
+    """
+    # Only sizes are logged; document_data holds every page image
+    logger.debug("Received document data with keys %s", list(document_data or {}))
     
-    document_text = ""
+    sections = []
     if 'pdf_text' in document_data:
         pdf_text = document_data['pdf_text']
-        print(f"DEBUG: PDF text length: {len(pdf_text)}")
-        print(f"DEBUG: PDF text preview: {pdf_text[:200] if pdf_text else 'EMPTY'}")
-        document_text += f"PDF Content:\n{pdf_text}\n\n"
+        logger.debug("PDF text: %d characters, starting %r", len(pdf_text), pdf_text[:200])
+        sections.append(("PDF Content", pdf_text))
     if 'xlsx_text' in document_data:
         xlsx_text = document_data['xlsx_text']
-        print(f"DEBUG: XLSX text length: {len(xlsx_text)}")
-        print(f"DEBUG: XLSX text preview: {xlsx_text[:200] if xlsx_text else 'EMPTY'}")
-        document_text += f"Excel Content:\n{xlsx_text}\n\n"
-    
-    print(f"DEBUG: Final document_text length: {len(document_text)}")
+        logger.debug("XLSX text: %d characters, starting %r", len(xlsx_text), xlsx_text[:200])
+        sections.append(("Excel Content", xlsx_text))
     
-    if not document_text.strip():
+    if not any(text.strip() for _, text in sections):
         return {"error": "No text could be extracted from the uploaded documents. Please ensure the files are valid PDFs or Excel files with readable content."}
 
-    prompt = f"""Extract the following fields from the provided documents:
+    # Long documents are cut down to their most relevant chunks to bound prompt size and latency
+    with timed_stage("prompt_build"):
+        document_text = build_document_text(sections)
+    logger.debug("Document text is %d characters", len(document_text))
 
-    - Bill of lading number (may appear as "Bill of lading NO" in the document)
-    - Container Number
-    - Consignee Name
-    - Consignee Address
-    - Date of export (format as YYYY-MM-DD)
-    - Date (format as YYYY-MM-DD)
-    - Line Items Count (as an integer)
-    - Average Gross Weight (as a number in kilograms, extract numeric value only)
-    - Average Price (as a number in USD, extract numeric value only)
+    # Fields matched by patterns with enough confidence are not asked of the LLM
+    with timed_stage("rule_extraction"):
+        rule_fields = extract_fields_with_rules("\n".join(text for _, text in sections)) if settings.RULES_ENABLED else {}
+    known = {
+        name: field["value"] for name, field in rule_fields.items()
+        if field["confidence"] >= settings.RULES_MIN_CONFIDENCE
+    }
 
-    If a field cannot be found, set it to null.
+    # Spreadsheet line items are counted and averaged exactly, not by the LLM
+    aggregates = document_data.get('line_item_aggregates') or {}
+    known.update((name, aggregates[name]) for name in AGGREGATE_FIELDS if name in aggregates)
 
-    Documents:
-    {document_text}
-    """
+    text_call = extract_from_text(document_text, known)
+    # Page images are encoded only once the vision call is certain to run
+    selected = []
+    decision = None
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that extracts structured data from documents."},
-                {"role": "user", "content": prompt}
-            ],
-            response_format=EXTRACTION_SCHEMA,
+    if has_vision_pages(document_data) and settings.VISION_POLICY == "always":
+        async def vision():
+            selected[:] = await encode_vision_images(document_data)
+            if not selected:
+                return None
+            vision_call = extract_from_images([image for _, image in selected])
+            if any(name in aggregates for name in AGGREGATE_FIELDS):
+                vision_call = _with_aggregates(vision_call, aggregates)
+            return await _with_timeout(vision_call, "Vision extraction", "vision_extraction", progress)
+
+        # The text request is sent while the pages are encoded, and alongside the vision request
+        text_data, vision_data = await asyncio.gather(
+            _with_timeout(text_call, "Text extraction", "text_extraction", progress),
+            vision(),
         )
-        
-        extracted_data = json.loads(response.choices[0].message.content)
-        print(f"DEBUG: Text-based extracted data: {extracted_data}")
-        
-        formatted_text_data = format_extracted_data(extracted_data)
-        result = {"text_extraction": formatted_text_data}
-        
-        if 'pdf_images' in document_data:
-            vision_data = extract_from_images(document_data['pdf_images'])
-            if vision_data:
-                result["vision_extraction"] = vision_data
-        
-        return result
-        
-    except json.JSONDecodeError as e:
-        print(f"DEBUG: JSON Parse Error: {str(e)}")
-        print(f"DEBUG: Raw response: {response.choices[0].message.content}")
-        return {"error": f"Failed to parse JSON response: {str(e)}"}
-    except Exception as e:
-        print(f"DEBUG: LLM Error: {str(e)}")
-        return {"error": str(e)}
+    else:
+        text_data = await _with_timeout(text_call, "Text extraction", "text_extraction", progress)
+        vision_data = None
+        if has_vision_pages(document_data):
+            # The vision call only runs for fields the text result leaves in doubt
+            decision = decide_vision(
+                text_data,
+                [name for name in SCHEMA_FIELDS if name not in known],
+                {name: field for name, field in rule_fields.items() if name not in known},
+                _ocr_confidence(document_data),
+            )
+            # Counted once per distinct reason, so a call for missing and invalid fields counts under both
+            for reason in sorted(set(decision.fields.values())) or ["skip"]:
+                VISION_DECISIONS.labels(reason).inc()
+            logger.debug("Vision policy: %s", decision.summary())
+            if decision.run:
+                selected = await encode_vision_images(document_data)
+            if selected:
+                vision_call = _vision_for_fields([image for _, image in selected], list(decision.fields), text_data, known)
+                vision_data = await _with_timeout(vision_call, "Vision extraction", "vision_extraction", progress)
+
+    if "error" in text_data and (not vision_data or "error" in vision_data):
+        error = {"error": text_data["error"]}
+        if text_data.get("retryable") or (vision_data or {}).get("retryable"):
+            error["retryable"] = True
+        return error
+
+    result = {"text_extraction": text_data}
+    if any(name in aggregates for name in AGGREGATE_FIELDS):
+        # Marks which fields were computed locally, and from which sheet
+        result["line_item_aggregates"] = aggregates
+    if rule_fields:
+        # Pattern matches and their confidence; fields below RULES_MIN_CONFIDENCE were left to the LLM
+        result["rule_extraction"] = rule_fields
+    if decision:
+        result["vision_policy"] = decision.summary()
+    if vision_data:
+        result["vision_extraction"] = vision_data
+        # Reported so the image settings can be tuned against extraction accuracy
+        files = [file for file, _ in selected]
+        result["vision_payload"] = {
+            "pages": len(selected),
+            "total_pages": document_data.get('pdf_page_count', len(selected)),
+            "bytes": sum(len(image) for _, image in selected),
+            "files": {str(file): files.count(file) for file in dict.fromkeys(files)},
+        }
+
+    return result
@@ -0,0 +1,162 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load tests and
+benchmarks that should measure the app rather than the model.
+
+Answers POST /v1/chat/completions with JSON that matches the request's
+response_format schema. Values are derived from a hash of the request, so
+the same request always gets the same answer. Latency and error rates are
+configurable:
+
+    python -m app.services.llm_stub --port 8900 --latency-ms 800 --rate-limit-rate 0.02
+
+and point the app at it with LLM_BACKEND=stub (LLM_STUB_URL defaults to
+http://127.0.0.1:8900/v1).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# Reported token usage is estimated: about four characters per text token,
+# and what OpenAI bills for a 1024x1024 high-detail image
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 765
+
+
+@dataclass
+class StubConfig:
+    # Median latency of a text request; latencies are log-normally distributed
+    latency_ms: float = 500.0
+    latency_sigma: float = 0.3
+    # Added per image of a vision request
+    image_latency_ms: float = 200.0
+    # Fractions of requests answered with 429 (with Retry-After) and 500
+    rate_limit_rate: float = 0.0
+    error_rate: float = 0.0
+    retry_after_seconds: float = 1.0
+    # Fraction of nullable fields left null
+    null_rate: float = 0.1
+    seed: int = 0
+
+
+def _schema_value(name: str, spec: dict, rng: random.Random, null_rate: float):
+    types = spec.get("type", "string")
+    types = types if isinstance(types, list) else [types]
+    if "null" in types and rng.random() < null_rate:
+        return None
+    kind = next((t for t in types if t != "null"), "null")
+    if kind == "integer":
+        return rng.randint(1, 50)
+    if kind == "number":
+        return round(rng.uniform(1, 1000), 2)
+    if kind == "boolean":
+        return rng.random() < 0.5
+    if kind == "string":
+        if "YYYY-MM-DD" in spec.get("description", ""):
+            return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        return f"{name.upper()}-{rng.randint(100000, 999999)}"
+    return None
+
+
+def schema_response(schema: dict, rng: random.Random, null_rate: float = 0.0) -> dict:
+    """
+    An object with a value for every property of a JSON schema object.
+    """
+    return {
+        name: _schema_value(name, spec, rng, null_rate)
+        for name, spec in schema.get("properties", {}).items()
+    }
+
+
+def estimate_prompt_tokens(messages: list) -> int:
+    chars = images = 0
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                images += 1
+            else:
+                chars += len(part.get("text") or "")
+    return chars // CHARS_PER_TOKEN + images * IMAGE_TOKENS
+
+
+def _completion(model: str, content: str, prompt_tokens: int = 0) -> dict:
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // CHARS_PER_TOKEN,
+            "total_tokens": prompt_tokens + len(content) // CHARS_PER_TOKEN,
+        },
+    }
+
+
+def _error(status: int, message: str, headers=None) -> JSONResponse:
+    return JSONResponse(status_code=status, headers=headers, content={
+        "error": {"message": message, "type": "stub_error", "param": None, "code": None},
+    })
+
+
+def create_stub_app(config: StubConfig) -> FastAPI:
+    app = FastAPI(title="LLM stand-in")
+    # Latency and errors are random but reproducible for a given seed
+    rng = random.Random(config.seed)
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        images = sum(
+            1 for message in body.get("messages", []) if isinstance(message.get("content"), list)
+            for part in message["content"] if part.get("type") == "image_url"
+        )
+        latency = config.latency_ms * math.exp(rng.gauss(0, config.latency_sigma)) + images * config.image_latency_ms
+        await asyncio.sleep(latency / 1000)
+
+        draw = rng.random()
+        if draw < config.rate_limit_rate:
+            return _error(429, "Rate limit reached (stub)", {"retry-after": str(config.retry_after_seconds)})
+        if draw < config.rate_limit_rate + config.error_rate:
+            return _error(500, "Internal error (stub)")
+
+        schema = body.get("response_format", {}).get("json_schema", {}).get("schema", {})
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+        content = schema_response(schema, random.Random(digest), config.null_rate)
+        prompt_tokens = estimate_prompt_tokens(body.get("messages", []))
+        return _completion(body.get("model", "stub"), json.dumps(content), prompt_tokens)
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    defaults = StubConfig()
+    for field, value in vars(defaults).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    args = parser.parse_args()
+
+    config = StubConfig(**{field: getattr(args, field) for field in vars(defaults)})
+    uvicorn.run(create_stub_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
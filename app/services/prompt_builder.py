@@ -0,0 +1,204 @@
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.utils.field_keywords import FIELD_KEYWORDS, MAX_HITS_PER_TERM
+
+logger = logging.getLogger(__name__)
+
+# Words too common in schema descriptions to say anything about relevance
+STOPWORDS = {
+    "the", "of", "in", "from", "a", "an", "and", "or", "all", "across", "as", "to", "number",
+    "document", "format", "total", "general",
+}
+
+# Relevance weights: a field label is strong evidence, a description word much weaker
+KEYWORD_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 0.5
+# Document headers carry most identifying fields, so each section's first chunk gets a boost
+FIRST_CHUNK_BONUS = 2.0
+
+OMITTED_MARKER = "[...]"
+
+
+@dataclass
+class Chunk:
+    section: int
+    index: int
+    text: str
+    tokens: int
+    score: float = 0.0
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(settings.PROMPT_TOKENIZER_ENCODING)
+    except Exception:
+        # tiktoken missing, or its encoding file can't be downloaded
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens with tiktoken when available, otherwise estimate them at
+    4 characters per token.
+    """
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def field_terms() -> Dict[str, List[str]]:
+    """
+    Significant words of each EXTRACTION_SCHEMA field description.
+    """
+    from app.services.llm_service import EXTRACTION_SCHEMA
+
+    properties = EXTRACTION_SCHEMA["json_schema"]["schema"]["properties"]
+    return {
+        name: [
+            word for word in re.findall(r"[a-z]+", spec.get("description", "").lower())
+            if word not in STOPWORDS and len(word) > 2
+        ]
+        for name, spec in properties.items()
+    }
+
+
+def _split_long_line(line: str, chunk_tokens: int) -> List[str]:
+    # Text extracted without line breaks would otherwise become one huge chunk
+    if count_tokens(line) <= chunk_tokens:
+        return [line]
+    words = line.split(" ")
+    pieces, current = [], []
+    for word in words:
+        current.append(word)
+        if count_tokens(" ".join(current)) >= chunk_tokens:
+            pieces.append(" ".join(current))
+            current = []
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def split_chunks(section: int, text: str, chunk_tokens: int) -> List[Chunk]:
+    """
+    Split text into chunks of about chunk_tokens tokens on line boundaries,
+    breaking overly long lines on spaces.
+    """
+    chunks = []
+    lines = []
+    size = 0
+    for line in (piece for raw in text.splitlines() for piece in _split_long_line(raw, chunk_tokens)):
+        line_tokens = count_tokens(line) + 1
+        if lines and size + line_tokens > chunk_tokens:
+            chunks.append(Chunk(section, len(chunks), "\n".join(lines), size))
+            lines, size = [], 0
+        lines.append(line)
+        size += line_tokens
+    if lines:
+        chunks.append(Chunk(section, len(chunks), "\n".join(lines), size))
+    return chunks
+
+
+def score_chunk(chunk: Chunk, terms: Dict[str, List[str]]) -> Dict[str, float]:
+    """
+    Relevance of a chunk to each schema field.
+    """
+    text = chunk.text.lower()
+    scores = {}
+    for name, keywords in FIELD_KEYWORDS.items():
+        score = sum(min(text.count(keyword), MAX_HITS_PER_TERM) * KEYWORD_WEIGHT for keyword in keywords)
+        score += sum(min(text.count(word), MAX_HITS_PER_TERM) * DESCRIPTION_WEIGHT for word in terms.get(name, []))
+        if chunk.index == 0:
+            score += FIRST_CHUNK_BONUS
+        scores[name] = score
+    return scores
+
+
+def select_chunks(chunks: List[Chunk], budget: int) -> List[Chunk]:
+    """
+    Pick chunks within the token budget: first the best chunk for each field,
+    so every field has a chance of being found, then the highest-scoring rest.
+    """
+    terms = field_terms()
+    field_scores = [score_chunk(chunk, terms) for chunk in chunks]
+    for chunk, scores in zip(chunks, field_scores):
+        chunk.score = sum(scores.values())
+
+    selected = {}
+    used = 0
+
+    def take(position):
+        nonlocal used
+        chunk = chunks[position]
+        if position in selected or used + chunk.tokens > budget:
+            return
+        selected[position] = chunk
+        used += chunk.tokens
+
+    for name in FIELD_KEYWORDS:
+        best = max(range(len(chunks)), key=lambda position: field_scores[position][name])
+        if field_scores[best][name] > 0:
+            take(best)
+    for position in sorted(range(len(chunks)), key=lambda position: -chunks[position].score):
+        take(position)
+
+    return [selected[position] for position in sorted(selected)]
+
+
+def build_document_text(sections: List[tuple], budget: Optional[int] = None) -> str:
+    """
+    Join (title, text) sections into the document text for the extraction
+    prompt, keeping it within budget tokens (PROMPT_TOKEN_BUDGET by default).
+
+    Text that fits is used as is. Otherwise each section is chunked, chunks
+    are scored for relevance to the schema fields, and the best ones are
+    kept in document order with a marker where text was left out.
+    """
+    budget = settings.PROMPT_TOKEN_BUDGET if budget is None else budget
+    full_text = "".join(f"{title}:\n{text}\n\n" for title, text in sections)
+    if not budget or count_tokens(full_text) <= budget:
+        return full_text
+
+    chunks = []
+    for section, (_, text) in enumerate(sections):
+        chunks.extend(split_chunks(section, text, settings.PROMPT_CHUNK_TOKENS))
+    selected = select_chunks(chunks, budget)
+
+    # Section titles and omission markers aren't in the chunk sizes; drop the
+    # least relevant chunks until the assembled text fits
+    document_text = assemble(sections, chunks, selected)
+    while selected and count_tokens(document_text) > budget:
+        selected.remove(min(selected, key=lambda chunk: chunk.score))
+        document_text = assemble(sections, chunks, selected)
+
+    # Counting the full text again is only worth it when the line is logged
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Document text is %d tokens, kept %d/%d chunks for a %d token budget",
+                     count_tokens(full_text), len(selected), len(chunks), budget)
+    return document_text
+
+
+def assemble(sections: List[tuple], chunks: List[Chunk], selected: List[Chunk]) -> str:
+    document_text = ""
+    for section, (title, _) in enumerate(sections):
+        kept = [chunk for chunk in selected if chunk.section == section]
+        total = sum(1 for chunk in chunks if chunk.section == section)
+        parts = []
+        expected = 0
+        for chunk in kept:
+            if chunk.index != expected:
+                parts.append(OMITTED_MARKER)
+            parts.append(chunk.text)
+            expected = chunk.index + 1
+        if expected != total:
+            parts.append(OMITTED_MARKER)
+        document_text += f"{title}:\n" + "\n".join(parts) + "\n\n"
+    return document_text
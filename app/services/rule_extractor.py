@@ -0,0 +1,196 @@
+import datetime
+import re
+from typing import Dict, Optional, Tuple
+
+# Bump when the rules change, so cached results are recomputed
+RULES_VERSION = "1"
+
+# ISO 6346 letter values: A=10 upwards, skipping multiples of 11
+_LETTER_VALUES = {}
+_value = 10
+for _letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ":
+    if _value % 11 == 0:
+        _value += 1
+    _LETTER_VALUES[_letter] = _value
+    _value += 1
+
+# Owner code (3 letters), category (U, J or Z), 6-digit serial, check digit
+CONTAINER_NUMBER = re.compile(r"\b([A-Z]{3}[UJZ])\s?(\d{6})\s?-?\s?(\d)\b")
+CONTAINER_LABEL = re.compile(r"(?i:container\s*(?:no\.?|number|#)|cntr\.?\s*(?:no\.?|#)?)[\s:.#]*([A-Z]{4}\s?\d{6}\s?-?\s?\d)")
+
+BL_LABEL = re.compile(
+    r"(?i:bill\s+of\s+lading\s*(?:no\.?|number|#)|b\s*/\s*l\s*(?:no\.?|number|#)|bol\s*(?:no\.?|number|#))"
+    r"[\s:.#]*([A-Z0-9][A-Z0-9\-/]{4,}[A-Z0-9])"
+)
+
+CONSIGNEE_NAME = re.compile(r"^[ \t]*consignee(?:'s)?\s+name[ \t]*[:\t][ \t]*(\S.*)$", re.I | re.M)
+CONSIGNEE_ADDRESS = re.compile(r"^[ \t]*consignee(?:'s)?\s+address[ \t]*[:\t][ \t]*(\S.*)$", re.I | re.M)
+# A bare "Consignee:" block; the name/address split is a guess, so it stays below the LLM threshold
+CONSIGNEE_BLOCK = re.compile(r"^[ \t]*consignee[ \t]*[:\t]?[ \t]*(.*)$", re.I | re.M)
+
+EXPORT_DATE_LABEL = re.compile(
+    r"(?:date\s+of\s+export|export\s+date|shipped\s+on\s+board(?:\s+date)?|on\s+board\s+date|laden\s+on\s+board)"
+    r"[ \t]*[:\t]?[ \t]*(.{6,30})$",
+    re.I | re.M,
+)
+DATE_LABEL = re.compile(
+    r"^[ \t]*(?:(?:invoice|issue)\s+)?date(?:\s+of\s+issue)?[ \t]*[:\t][ \t]*(.{6,30})$",
+    re.I | re.M,
+)
+
+MONTHS = {
+    name: number
+    for number, names in enumerate([
+        ("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"),
+        ("may",), ("jun", "june"), ("jul", "july"), ("aug", "august"),
+        ("sep", "sept", "september"), ("oct", "october"), ("nov", "november"), ("dec", "december"),
+    ], start=1)
+    for name in names
+}
+
+ISO_DATE = re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+DAY_MONTH_NAME = re.compile(r"\b(\d{1,2})[-/. ]+([A-Za-z]{3,9})\.?[-/., ]+(\d{4}|\d{2})\b")
+MONTH_NAME_DAY = re.compile(r"\b([A-Za-z]{3,9})\.?[ ]+(\d{1,2})(?:st|nd|rd|th)?,?[ ]+(\d{4})\b")
+NUMERIC_DATE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b")
+
+# Confidence per kind of evidence
+LABELED = 0.95
+VALID_CHECK_DIGIT = 0.99
+UNLABELED_VALID_CONTAINER = 0.9
+SEVERAL_CONTAINERS = 0.6
+INVALID_CHECK_DIGIT = 0.4
+AMBIGUOUS_DATE = 0.5
+CONSIGNEE_BLOCK_GUESS = 0.6
+
+
+def iso6346_check_digit(code: str) -> Optional[int]:
+    """
+    ISO 6346 check digit of the first 10 characters of a container number
+    (owner code, category and serial), or None if they are malformed.
+    """
+    code = code[:10]
+    if not re.fullmatch(r"[A-Z]{4}\d{6}", code):
+        return None
+    total = sum(
+        (_LETTER_VALUES[char] if char.isalpha() else int(char)) * 2 ** position
+        for position, char in enumerate(code)
+    )
+    return total % 11 % 10
+
+
+def is_valid_container_number(number: str) -> bool:
+    number = re.sub(r"[\s-]", "", number)
+    return len(number) == 11 and number[10].isdigit() and iso6346_check_digit(number) == int(number[10])
+
+
+def normalize_date(text: str) -> Optional[Tuple[str, float]]:
+    """
+    Parse the first date in text and return it as (YYYY-MM-DD, confidence).
+    Numeric dates where day and month could be swapped get a low confidence.
+    """
+    candidates = []
+    match = ISO_DATE.search(text)
+    if match:
+        candidates.append((match.start(), int(match[1]), int(match[2]), int(match[3]), LABELED))
+    match = DAY_MONTH_NAME.search(text)
+    if match and match[2].lower() in MONTHS:
+        year = int(match[3]) + (2000 if len(match[3]) == 2 else 0)
+        candidates.append((match.start(), year, MONTHS[match[2].lower()], int(match[1]), LABELED))
+    match = MONTH_NAME_DAY.search(text)
+    if match and match[1].lower() in MONTHS:
+        candidates.append((match.start(), int(match[3]), MONTHS[match[1].lower()], int(match[2]), LABELED))
+    match = NUMERIC_DATE.search(text)
+    if match:
+        first, second, year = int(match[1]), int(match[2]), int(match[3])
+        if first > 12:
+            candidates.append((match.start(), year, second, first, LABELED))
+        elif second > 12:
+            candidates.append((match.start(), year, first, second, LABELED))
+        else:
+            # Day first, as on most international shipping documents
+            candidates.append((match.start(), year, second, first, AMBIGUOUS_DATE))
+
+    for _, year, month, day, confidence in sorted(candidates):
+        try:
+            return datetime.date(year, month, day).isoformat(), confidence
+        except ValueError:
+            continue
+    return None
+
+
+def _find_container_number(text: str) -> Optional[Tuple[str, float]]:
+    labeled = CONTAINER_LABEL.search(text)
+    if labeled:
+        number = re.sub(r"[\s-]", "", labeled[1])
+        if is_valid_container_number(number):
+            return number, VALID_CHECK_DIGIT
+        return number, INVALID_CHECK_DIGIT
+
+    found = []
+    for match in CONTAINER_NUMBER.finditer(text):
+        number = "".join(match.groups())
+        if is_valid_container_number(number) and number not in found:
+            found.append(number)
+    if not found:
+        return None
+    return found[0], UNLABELED_VALID_CONTAINER if len(found) == 1 else SEVERAL_CONTAINERS
+
+
+def _find_consignee(text: str) -> Dict[str, Tuple[str, float]]:
+    fields = {}
+    name = CONSIGNEE_NAME.search(text)
+    if name:
+        fields["consignee_name"] = (name[1].strip(), LABELED)
+    address = CONSIGNEE_ADDRESS.search(text)
+    if address:
+        fields["consignee_address"] = (address[1].strip(), LABELED)
+    if fields:
+        return fields
+
+    block = CONSIGNEE_BLOCK.search(text)
+    if not block:
+        return fields
+    lines = [block[1].strip()] if block[1].strip() else []
+    for line in text[block.end():].splitlines()[1:]:
+        line = line.strip()
+        # The block ends at a blank line or the next labelled party
+        if not line or re.match(r"(?i)(notify|shipper|port|vessel|place)\b", line):
+            break
+        lines.append(line)
+    if lines:
+        fields["consignee_name"] = (lines[0], CONSIGNEE_BLOCK_GUESS)
+    if len(lines) > 1:
+        fields["consignee_address"] = (", ".join(lines[1:]), CONSIGNEE_BLOCK_GUESS)
+    return fields
+
+
+def extract_fields_with_rules(text: str) -> Dict[str, dict]:
+    """
+    Find schema fields in document text with patterns: labelled bill of
+    lading numbers, ISO 6346 container numbers (validated by check digit),
+    export and issue dates normalized to YYYY-MM-DD, and labelled consignee
+    details.
+
+    Returns:
+        Dict[str, dict]: {"value", "confidence"} per field found
+    """
+    fields = {}
+
+    bl = BL_LABEL.search(text)
+    if bl and any(char.isdigit() for char in bl[1]):
+        fields["bill_of_lading_number"] = (bl[1], LABELED)
+
+    container = _find_container_number(text)
+    if container:
+        fields["container_number"] = container
+
+    fields.update(_find_consignee(text))
+
+    for name, label in (("date_of_export", EXPORT_DATE_LABEL), ("date", DATE_LABEL)):
+        for match in label.finditer(text):
+            date = normalize_date(match[1])
+            if date:
+                fields[name] = date
+                break
+
+    return {name: {"value": value, "confidence": confidence} for name, (value, confidence) in fields.items()}
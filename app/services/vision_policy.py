@@ -0,0 +1,127 @@
+import datetime
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from app.core.config import settings
+from app.services.rule_extractor import is_valid_container_number
+
+# Bump when the policy changes, so cached results are recomputed
+VISION_POLICY_VERSION = "1"
+
+# Why a field is asked of the vision model
+MISSING = "missing"
+INVALID = "invalid"
+DISPUTED = "disputed"
+LOW_OCR_CONFIDENCE = "low_ocr_confidence"
+TEXT_FAILED = "text_failed"
+
+ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+# Several container numbers may be listed in one value
+CONTAINER_SEPARATORS = re.compile(r"[,;/&\n]+")
+NUMBER = re.compile(r"^-?\d+(?:\.\d+)?$")
+
+
+@dataclass
+class VisionDecision:
+    """
+    Whether to run the vision call, and for which fields: field name ->
+    reason (MISSING, INVALID, ...). An empty dict skips the call.
+    """
+    fields: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def run(self) -> bool:
+        return bool(self.fields)
+
+    def summary(self) -> dict:
+        return {"run": self.run, "fields": self.fields}
+
+
+def _valid_date(value) -> bool:
+    if not isinstance(value, str) or not ISO_DATE.match(value.strip()):
+        return False
+    try:
+        datetime.date.fromisoformat(value.strip())
+    except ValueError:
+        return False
+    return True
+
+
+def _valid_containers(value) -> bool:
+    numbers = [re.sub(r"[\s-]", "", part).upper() for part in CONTAINER_SEPARATORS.split(str(value))]
+    numbers = [number for number in numbers if number]
+    return bool(numbers) and all(is_valid_container_number(number) for number in numbers)
+
+
+def _valid_amount(value) -> bool:
+    # Text results are formatted, e.g. "$12.50" and "1200.00 kg"
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, (int, float)):
+        return value >= 0
+    text = str(value).strip().removeprefix("$").removesuffix("kg").replace(",", "").strip()
+    return bool(NUMBER.match(text)) and float(text) >= 0
+
+
+def _valid_count(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+VALIDATORS = {
+    "container_number": _valid_containers,
+    "date_of_export": _valid_date,
+    "date": _valid_date,
+    "line_items_count": _valid_count,
+    "average_gross_weight": _valid_amount,
+    "average_price": _valid_amount,
+}
+
+
+def validate_fields(data: dict) -> List[str]:
+    """
+    Fields of an extraction result with a value that fails validation: dates
+    that aren't real YYYY-MM-DD dates, container numbers with a wrong ISO 6346
+    check digit, negative or non-numeric counts and amounts.
+    """
+    return [
+        name for name, valid in VALIDATORS.items()
+        if data.get(name) is not None and not valid(data[name])
+    ]
+
+
+def _normalized(value) -> str:
+    return re.sub(r"[\s-]", "", str(value)).upper()
+
+
+def decide_vision(text_data: dict, fields: Iterable[str], rule_fields: Optional[Dict[str, dict]] = None,
+                  ocr_confidence: Optional[float] = None) -> VisionDecision:
+    """
+    Decide which of fields (those not already known from rules or
+    spreadsheets) the vision model should be asked for, given the text
+    extraction result:
+
+    - all of them if the text call failed, or the text came from OCR with a
+      mean word confidence below VISION_MIN_OCR_CONFIDENCE
+    - otherwise the fields the text call left null, those failing
+      validate_fields, and those where a rule match below
+      RULES_MIN_CONFIDENCE disagrees with the LLM
+    """
+    fields = list(fields)
+    if "error" in text_data:
+        return VisionDecision({name: TEXT_FAILED for name in fields})
+    if ocr_confidence is not None and ocr_confidence < settings.VISION_MIN_OCR_CONFIDENCE:
+        return VisionDecision({name: LOW_OCR_CONFIDENCE for name in fields})
+
+    invalid = set(validate_fields(text_data))
+    decision = VisionDecision()
+    for name in fields:
+        value = text_data.get(name)
+        rule = (rule_fields or {}).get(name)
+        if value is None:
+            decision.fields[name] = MISSING
+        elif name in invalid:
+            decision.fields[name] = INVALID
+        elif rule and _normalized(rule["value"]) != _normalized(value):
+            decision.fields[name] = DISPUTED
+    return decision
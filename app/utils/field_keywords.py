@@ -0,0 +1,27 @@
+from typing import Dict, List
+
+# Labels that typically sit next to each schema field's value. Shared by the
+# prompt builder, which ranks text chunks, and select_pages, which ranks PDF pages.
+FIELD_KEYWORDS: Dict[str, List[str]] = {
+    "bill_of_lading_number": ["bill of lading no", "bill of lading number", "b/l no", "bl no", "b/l number", "bol"],
+    "container_number": ["container no", "container number", "cntr no", "container"],
+    "consignee_name": ["consignee", "ship to", "notify party"],
+    "consignee_address": ["consignee address", "address", "ship to"],
+    "date_of_export": ["date of export", "export date", "shipped on board", "on board date", "etd"],
+    "date": ["date", "issue date", "place and date of issue"],
+    "line_items_count": ["s.no", "item", "description", "qty", "quantity", "pcs"],
+    "average_gross_weight": ["gross weight", "g.w", "kgs", "weight"],
+    "average_price": ["unit price", "unit value", "price", "usd", "amount"],
+}
+
+# Repeated labels in one text (e.g. a table column) count at most this many times
+MAX_HITS_PER_TERM = 3
+
+
+def keyword_hits(text: str) -> int:
+    """
+    Field labels in text, each counted at most MAX_HITS_PER_TERM times.
+    """
+    text = text.lower()
+    return sum(min(text.count(keyword), MAX_HITS_PER_TERM)
+               for keywords in FIELD_KEYWORDS.values() for keyword in keywords)
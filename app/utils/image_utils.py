@@ -0,0 +1,94 @@
+import io
+
+from PIL import Image
+
+from app.core.config import settings
+
+VISION_MIME_TYPES = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+# Pixels lighter than this count as paper when cropping margins; scanned paper
+# is rarely pure white, and the reduced copy softens thin strokes
+WHITESPACE_THRESHOLD = 220
+
+# Padding kept around the cropped content, in pixels
+CROP_MARGIN = 16
+
+# Margins are detected on a copy shrunk by this factor
+CROP_REDUCE_FACTOR = 4
+
+# Each budget downsampling step shrinks the long edge by this factor
+BUDGET_DOWNSCALE_STEP = 0.75
+
+
+def vision_mime_type() -> str:
+    return VISION_MIME_TYPES[settings.VISION_IMAGE_FORMAT.upper()]
+
+
+def crop_whitespace(image):
+    """
+    Crop blank margins around the page content. Blank pages are returned unchanged.
+    """
+    # Thresholding a box-reduced copy averages out scanner noise and is cheaper
+    small = image.convert("L").reduce(CROP_REDUCE_FACTOR)
+    bbox = small.point(lambda p: 255 if p < WHITESPACE_THRESHOLD else 0).getbbox()
+    if bbox is None:
+        return image
+
+    left, top, right, bottom = (edge * CROP_REDUCE_FACTOR for edge in bbox)
+    return image.crop((
+        max(0, left - CROP_MARGIN),
+        max(0, top - CROP_MARGIN),
+        min(image.width, right + CROP_MARGIN),
+        min(image.height, bottom + CROP_MARGIN),
+    ))
+
+
+def fit_long_edge(image, long_edge: int):
+    """
+    Downscale so the longer side is at most long_edge pixels. 0 disables the limit.
+    """
+    if not long_edge or max(image.size) <= long_edge:
+        return image
+
+    scale = long_edge / max(image.size)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+def prepare_vision_image(image):
+    if settings.VISION_CROP_WHITESPACE:
+        image = crop_whitespace(image)
+    if settings.VISION_GRAYSCALE:
+        image = image.convert("L")
+    elif image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    return fit_long_edge(image, settings.VISION_MAX_LONG_EDGE)
+
+
+def encode_vision_image(image) -> bytes:
+    image_format = settings.VISION_IMAGE_FORMAT.upper()
+    buffered = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffered, format="PNG")
+    else:
+        image.save(buffered, format=image_format, quality=settings.VISION_IMAGE_QUALITY)
+    return buffered.getvalue()
+
+
+def encode_within_budget(image, budget: int) -> bytes:
+    """
+    Encode a prepared page, downsampling it until it fits in budget bytes.
+
+    Returns:
+        bytes: The encoded page, or b"" if it cannot fit even at VISION_MIN_LONG_EDGE
+    """
+    encoded = encode_vision_image(image)
+    while len(encoded) > budget and max(image.size) > settings.VISION_MIN_LONG_EDGE:
+        long_edge = max(settings.VISION_MIN_LONG_EDGE, int(max(image.size) * BUDGET_DOWNSCALE_STEP))
+        image = fit_long_edge(image, long_edge)
+        encoded = encode_vision_image(image)
+    return encoded if len(encoded) <= budget else b""
@@ -0,0 +1,120 @@
+import logging
+import shutil
+import subprocess
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+import PyPDF2
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PDFTextBackend(ABC):
+    """
+    Extracts the text layer of a PDF. Implement this to plug in another
+    extraction library; PyPDF2 is the default.
+    """
+
+    name: str
+
+    @abstractmethod
+    def extract_pages(self, file_path: str) -> List[str]:
+        """
+        Return the text of each page, in page order, "" for pages without text.
+        """
+        ...
+
+
+class PyPDF2Backend(PDFTextBackend):
+    """
+    Pure Python; slow on long or dense documents but always available.
+    """
+
+    name = "pypdf2"
+
+    def extract_pages(self, file_path: str) -> List[str]:
+        with open(file_path, "rb") as file:
+            reader = PyPDF2.PdfReader(file)
+            return [page.extract_text() or "" for page in reader.pages]
+
+
+class PdfiumBackend(PDFTextBackend):
+    """
+    PDFium through pypdfium2, in process. PDFium is not thread-safe, so
+    documents are extracted one at a time across the parsing pool.
+    """
+
+    name = "pypdfium2"
+    _lock = threading.Lock()
+
+    def __init__(self):
+        import pypdfium2
+
+        self._pdfium = pypdfium2
+
+    def extract_pages(self, file_path: str) -> List[str]:
+        texts = []
+        with self._lock:
+            pdf = self._pdfium.PdfDocument(file_path)
+            try:
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    # PDFium ends lines with \r\n
+                    texts.append(textpage.get_text_range().replace("\r\n", "\n"))
+                    textpage.close()
+                    page.close()
+            finally:
+                pdf.close()
+        return texts
+
+
+class PdftotextBackend(PDFTextBackend):
+    """
+    poppler's pdftotext, installed with poppler-utils for pdf2image. Runs as
+    a subprocess, so documents are extracted in parallel.
+    """
+
+    name = "pdftotext"
+
+    def __init__(self):
+        self.executable = shutil.which("pdftotext")
+        if self.executable is None:
+            raise FileNotFoundError("pdftotext not found; install poppler-utils")
+
+    def extract_pages(self, file_path: str) -> List[str]:
+        output = subprocess.run(
+            [self.executable, "-q", "-enc", "UTF-8", file_path, "-"],
+            capture_output=True, check=True, timeout=settings.PDF_TEXT_TIMEOUT_SECONDS,
+        ).stdout.decode("utf-8", errors="replace")
+        # Pages end with a form feed
+        pages = output.split("\f")
+        return pages[:-1] if pages and not pages[-1].strip() else pages
+
+
+PDF_TEXT_BACKENDS = {
+    "pypdf2": PyPDF2Backend,
+    "pypdfium2": PdfiumBackend,
+    "pdftotext": PdftotextBackend,
+}
+
+_backends: Dict[str, PDFTextBackend] = {}
+
+
+def get_pdf_text_backend(name: str = None) -> PDFTextBackend:
+    """
+    Return the backend called name (PDF_TEXT_BACKEND by default). A backend
+    whose library or executable is missing falls back to PyPDF2.
+    """
+    name = name or settings.PDF_TEXT_BACKEND
+    if name not in PDF_TEXT_BACKENDS:
+        raise ValueError(f"Unknown PDF text backend: {name}")
+    if name not in _backends:
+        try:
+            _backends[name] = PDF_TEXT_BACKENDS[name]()
+        except (ImportError, FileNotFoundError) as e:
+            logger.error("PDF text backend %s is unavailable, using pypdf2: %s", name, e)
+            _backends[name] = PyPDF2Backend()
+    return _backends[name]
@@ -1,79 +1,540 @@
 import PyPDF2
-import os
 import base64
-import io
-from typing import Optional, List, Tuple
+import logging
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Collection, Dict, Iterable, Iterator, Optional, List, Tuple, Union
 
-def pdf_to_images_base64(file_path: str) -> List[str]:
+from app.core.config import settings
+from app.core.concurrency import get_ocr_executor, reset_ocr_executor, run_in_parsing_process
+from app.core.metrics import PDF_PAGES, observe_stage, timed_stage
+from app.utils.field_keywords import keyword_hits
+from app.utils.pdf_backends import PyPDF2Backend, get_pdf_text_backend
+from app.utils.image_utils import prepare_vision_image, encode_vision_image, encode_within_budget
+
+logger = logging.getLogger(__name__)
+
+# Page kinds, see classify_page
+TEXT_PAGE = "text"
+SCANNED_PAGE = "scanned"
+BLANK_PAGE = "blank"
+
+# An image with at least this many pixels per square point of the page covers
+# most of it at any usual scan resolution (a full letter page at 72 DPI is 1.0);
+# logos and stamps stay well below
+SCAN_IMAGE_PIXELS_PER_POINT = 0.5
+# Pages without text or images but with a content stream this long draw
+# something, e.g. text converted to outlines, and are OCR'd
+MIN_DRAWING_BYTES = 1024
+
+def render_pdf_pages(file_path: str, dpi: int, first_page: Optional[int] = None,
+                     last_page: Optional[int] = None) -> list:
+    """
+    Render pages first_page to last_page (1-based; all pages by default).
+
+    poppler writes the pages to a temporary folder instead of a pipe, so a
+    window of pages isn't held in memory twice, as pipe output and as images.
+    """
+    from pdf2image import convert_from_path
+
+    pages = {} if first_page is None else {"first_page": first_page, "last_page": last_page}
+    with tempfile.TemporaryDirectory() as folder:
+        images = convert_from_path(file_path, dpi=dpi, output_folder=folder, **pages)
+        for image in images:
+            image.load()
+    return images
+
+def count_pdf_pages(file_path: str) -> Optional[int]:
+    """
+    Page count of a PDF, or None when PyPDF2 can't read it.
+    """
     try:
-        from pdf2image import convert_from_path
-        
-        images = convert_from_path(file_path, dpi=150)
-        base64_images = []
-        
-        for i, image in enumerate(images):
-            print(f"DEBUG: Converting page {i+1}/{len(images)} to base64")
-            buffered = io.BytesIO()
-            image.save(buffered, format="PNG")
-            img_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-            base64_images.append(img_base64)
-        
-        print(f"DEBUG: Converted {len(base64_images)} pages to base64")
-        return base64_images
-        
-    except ImportError as e:
-        print(f"ERROR: pdf2image not installed: {str(e)}")
-        return []
+        with open(file_path, "rb") as file:
+            return len(PyPDF2.PdfReader(file).pages)
     except Exception as e:
-        print(f"ERROR: Failed to convert PDF to images: {str(e)}")
-        return []
+        logger.debug("Cannot count the pages of %s: %s", file_path, e)
+        return None
+
+def select_pages(candidates: List[int], page_texts: List[str], limit: int) -> List[int]:
+    """
+    At most limit of the candidate page indexes (all of them when limit is 0),
+    in page order: the first PDF_FIRST_PAGES candidates, then those whose text
+    has the most field labels (see field_keywords.keyword_hits), then the
+    earliest of the rest.
+    """
+    if not limit or len(candidates) <= limit:
+        return list(candidates)
+
+    first = candidates[:min(settings.PDF_FIRST_PAGES, limit)]
+
+    def hits(index):
+        return keyword_hits(page_texts[index]) if index < len(page_texts) else 0
+
+    rest = sorted(candidates[len(first):], key=lambda index: -hits(index))
+    return sorted(first + rest[:limit - len(first)])
+
+def resize_to_dpi(image, source_dpi: int, target_dpi: int):
+    """
+    Downscale a page rendered at source_dpi to what target_dpi would have produced.
+    """
+    if target_dpi >= source_dpi:
+        return image
+
+    from PIL import Image
+
+    scale = target_dpi / source_dpi
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+class RenderedPages:
+    """
+    Rasterizes the pages of a PDF a window at a time and shares pages between consumers.
+
+    iter_pages renders PDF_RENDER_WINDOW_PAGES consecutive pages per poppler
+    call and releases each page once it's been yielded, so peak memory depends
+    on the window size rather than the document length. Pages a later consumer
+    needs again are kept: extract_pages_from_pdf keeps the scanned pages it OCRs
+    that are also vision_pages, downscaled to VISION_DPI, so they hit poppler
+    once. Between the OCR and vision passes that is at most VISION_MAX_PAGES
+    pages at VISION_DPI (every scanned page when VISION_MAX_PAGES is 0).
+    """
+
+    def __init__(self, file_path: str, page_count: Optional[int] = None):
+        self.file_path = file_path
+        self._page_count = page_count
+        # page index -> (dpi, image)
+        self._pages: Dict[int, tuple] = {}
+        # Set by extract_pages_from_pdf: 0-based indexes of the pages for the
+        # vision model, and tesseract's mean word confidence per OCR'd page
+        self.vision_pages: Optional[List[int]] = None
+        self.ocr_confidence: Dict[int, float] = {}
+
+    @property
+    def page_count(self) -> int:
+        return self._page_count if self._page_count is not None else len(self._pages)
+
+    @page_count.setter
+    def page_count(self, count: int):
+        self._page_count = count
+
+    def count_pages(self) -> Optional[int]:
+        if self._page_count is None:
+            self._page_count = count_pdf_pages(self.file_path)
+        return self._page_count
+
+    def _render(self, dpi: int, first: Optional[int] = None, last: Optional[int] = None):
+        logger.debug("Rendering %s pages %s-%s at %d DPI", self.file_path, first, last, dpi)
+        with timed_stage("rasterize"):
+            if first is None:
+                images = render_pdf_pages(self.file_path, dpi=dpi)
+            else:
+                images = render_pdf_pages(self.file_path, dpi=dpi, first_page=first + 1, last_page=last + 1)
+        for offset, image in enumerate(images):
+            self._pages[(first or 0) + offset] = (dpi, image)
+        return images
+
+    def _windows(self, missing: List[int]) -> List[Tuple[int, int]]:
+        """
+        Split the sorted page indexes into runs of consecutive pages of at most
+        PDF_RENDER_WINDOW_PAGES pages each, as (first, last) pairs.
+        """
+        size = max(1, settings.PDF_RENDER_WINDOW_PAGES)
+        windows = []
+        for index in missing:
+            if windows and index == windows[-1][1] + 1 and index - windows[-1][0] < size:
+                windows[-1][1] = index
+            else:
+                windows.append([index, index])
+        return [tuple(window) for window in windows]
+
+    def iter_pages(self, dpi: int, indexes: Optional[List[int]] = None,
+                   keep: Union[bool, Collection[int]] = (),
+                   keep_dpi: Optional[int] = None) -> Iterator[Tuple[int, int, object]]:
+        """
+        Yield (index, dpi, image) for the pages at indexes (0-based; all pages
+        by default), in that order, rendered at dpi or higher. Pages are released
+        once yielded unless their index is in keep (True keeps every page);
+        kept pages are downscaled to keep_dpi if given.
+        """
+        if self.count_pages() is None:
+            # A PDF PyPDF2 can't read is rendered whole to find out its page count
+            self._page_count = len(self._render(dpi))
+        indexes = list(range(self._page_count)) if indexes is None else list(indexes)
+
+        def rendered(index):
+            return index in self._pages and self._pages[index][0] >= dpi
+
+        missing = sorted({index for index in indexes if not rendered(index)})
+        if missing and len(missing) == self._page_count <= max(1, settings.PDF_RENDER_WINDOW_PAGES):
+            windows = [(None, None)]
+        else:
+            windows = self._windows(missing)
+
+        for index in indexes:
+            if not rendered(index):
+                first, last = next((first, last) for first, last in windows
+                                   if first is None or first <= index <= last)
+                self._render(dpi, first, last)
+            page_dpi, image = self._pages[index]
+            if keep is not True and index not in keep:
+                del self._pages[index]
+            elif keep_dpi is not None and keep_dpi < page_dpi:
+                self._pages[index] = (keep_dpi, resize_to_dpi(image, page_dpi, keep_dpi))
+            yield index, page_dpi, image
+
+    def at_least(self, dpi: int, indexes: Optional[List[int]] = None) -> list:
+        """
+        Images of the pages at indexes (0-based; all pages by default), in
+        that order, rendered at dpi or higher. The pages stay cached for later
+        consumers, so all of them are in memory at once; see iter_pages.
+        """
+        return [image for _, _, image in self.iter_pages(dpi, indexes, keep=True)]
+
+def _image_pixels(resources, depth: int = 0) -> int:
+    """
+    Pixels of the image XObjects in a page's resources, including those of
+    form XObjects (one level deep).
+    """
+    resources = resources.get_object() if resources is not None else None
+    xobjects = resources.get("/XObject") if resources else None
+    if not xobjects:
+        return 0
+    pixels = 0
+    xobjects = xobjects.get_object()
+    for name in xobjects:
+        xobject = xobjects[name].get_object()
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            pixels += int(xobject.get("/Width", 0)) * int(xobject.get("/Height", 0))
+        elif subtype == "/Form" and depth < 1:
+            pixels += _image_pixels(xobject.get("/Resources"), depth + 1)
+    return pixels
+
+def classify_page(page, text: str) -> str:
+    """
+    Decide from a PyPDF2 page and its extracted text whether it needs OCR:
+
+    - TEXT_PAGE: enough text, and if an image covers the page (a scan with
+      a text layer), text dense enough to be that page's full text
+    - SCANNED_PAGE: too little text, or a page-sized image with only a few
+      words of text on it, e.g. a stamp or a header added to a scan
+    - BLANK_PAGE: no text, no images and next to no drawing; skipped
+    """
+    chars = len(text.strip())
+    width, height = float(page.mediabox.width), float(page.mediabox.height)
+    area = max(width * height, 1.0)
+    pixels = _image_pixels(page.get("/Resources"))
+    covered_by_image = pixels / area >= SCAN_IMAGE_PIXELS_PER_POINT
+
+    if chars >= settings.OCR_MIN_PAGE_CHARS:
+        # Characters per square inch
+        density = chars / (area / 72 ** 2)
+        if not covered_by_image or density >= settings.OCR_MIN_GLYPH_DENSITY:
+            return TEXT_PAGE
+        return SCANNED_PAGE
+
+    if chars == 0 and not pixels:
+        contents = page.get_contents()
+        if contents is None or len(contents.get_data()) < MIN_DRAWING_BYTES:
+            return BLANK_PAGE
+    return SCANNED_PAGE
+
+def tesseract_text(data: dict) -> Tuple[str, Optional[float]]:
+    """
+    Page text and mean word confidence (0-100; None without words) from
+    pytesseract.image_to_data output: words joined into lines, with a blank
+    line between paragraphs, as image_to_string lays them out.
+    """
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data["text"]):
+        if not word or not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        lines.setdefault(key, []).append(word)
+        if float(data["conf"][i]) >= 0:
+            confidences.append(float(data["conf"][i]))
+
+    text = ""
+    previous = None
+    for key, words in lines.items():
+        if previous is not None:
+            text += "\n\n" if key[:2] != previous[:2] else "\n"
+        text += " ".join(words)
+        previous = key
+    return text, sum(confidences) / len(confidences) if confidences else None
+
+def ocr_page(image) -> Tuple[str, Optional[float]]:
+    """
+    OCR a single page image, returning its text and tesseract's mean word
+    confidence, see tesseract_text. Runs inside an OCR worker process.
+    """
+    import pytesseract
+
+    try:
+        data = pytesseract.image_to_data(
+            image, output_type=pytesseract.Output.DICT, timeout=settings.OCR_PAGE_TIMEOUT_SECONDS,
+        )
+        return tesseract_text(data)
+    except (RuntimeError, pytesseract.TesseractNotFoundError) as e:
+        # pytesseract kills tesseract and raises a plain RuntimeError on timeout
+        if "timeout" in str(e).lower():
+            logger.warning("OCR timed out after %ss, skipping page", settings.OCR_PAGE_TIMEOUT_SECONDS)
+            return "", None
+        # pytesseract's own exceptions can't be unpickled, which would break the worker pool
+        raise RuntimeError(f"Tesseract failed: {e}") from None
+
+def timed_ocr_page(image) -> Tuple[str, Optional[float], float]:
+    """
+    ocr_page, also returning how long it took; worker processes can't
+    record metrics for the server themselves.
+    """
+    start = time.perf_counter()
+    text, confidence = ocr_page(image)
+    return text, confidence, time.perf_counter() - start
+
+def ocr_pages(images: Iterable, progress: Optional[Callable] = None,
+              page_numbers: Optional[List[int]] = None) -> List[Tuple[str, Optional[float]]]:
+    """
+    OCR page images on the OCR worker pool, returning (text, confidence) per
+    page, in page order; see ocr_page.
+
+    images may be a generator (see RenderedPages.iter_pages) if page_numbers
+    is given; at most two pages per worker are taken from it ahead of the
+    workers, so pages are rendered as fast as they're OCR'd.
+
+    progress, if given, is called as progress("ocr_page", {...}) as each page
+    finishes, in completion order. Pages are reported by their number in
+    page_numbers, or by their 1-based position in images.
+    """
+    total = len(page_numbers) if page_numbers else len(images)
+    page_numbers = page_numbers or list(range(1, total + 1))
+    if settings.OCR_WORKERS <= 1 or total <= 1:
+        texts = []
+        for i, image in enumerate(images):
+            with timed_stage("ocr_page"):
+                texts.append(ocr_page(image))
+            if progress:
+                progress("ocr_page", {"page": page_numbers[i], "done": i + 1, "pages": total})
+        return texts
+
+    logger.debug("Performing OCR on %d pages with %d workers", total, settings.OCR_WORKERS)
+    executor = get_ocr_executor()
+    futures = {}
+    texts = [None] * total
+    done = 0
+
+    def collect(finished):
+        nonlocal done
+        for future in finished:
+            i = futures.pop(future)
+            text, confidence, seconds = future.result()
+            texts[i] = (text, confidence)
+            observe_stage("ocr_page", seconds)
+            done += 1
+            if progress:
+                progress("ocr_page", {"page": page_numbers[i], "done": done, "pages": total})
+
+    try:
+        # Tesseract binarizes anyway; grayscale pages are a third of the size to ship to workers
+        for i, image in enumerate(images):
+            futures[executor.submit(timed_ocr_page, image.convert("L"))] = i
+            if len(futures) >= settings.OCR_WORKERS * 2:
+                collect(wait(futures, return_when=FIRST_COMPLETED).done)
+        while futures:
+            collect(wait(futures, return_when=FIRST_COMPLETED).done)
+        return texts
+    except BrokenProcessPool:
+        reset_ocr_executor()
+        raise
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+
+def _vision_images(pages: RenderedPages) -> Iterator[Tuple[int, object]]:
+    """
+    Yield (index, image) for the vision pages of a PDF, prepared for encoding:
+    pages.vision_pages if extract_pages_from_pdf picked them, otherwise the
+    first VISION_MAX_PAGES. Pages are rendered a window at a time and
+    released once yielded.
+    """
+    indexes = pages.vision_pages
+    if indexes is None and pages.count_pages() is not None:
+        indexes = select_pages(list(range(pages.page_count)), [], settings.VISION_MAX_PAGES)
+    for index, page_dpi, image in pages.iter_pages(settings.VISION_DPI, indexes):
+        with timed_stage("vision_encode"):
+            image = prepare_vision_image(resize_to_dpi(image, page_dpi, settings.VISION_DPI))
+        yield index, image
+
+def encode_vision_pages(sources: List[RenderedPages]) -> List[List[Tuple[int, str]]]:
+    """
+    Encode the vision pages of several PDFs for one vision request, following
+    the VISION_* settings: whitespace crop, grayscale, long-edge limit and
+    JPEG/WebP/PNG encoding.
+
+    PDFs take turns, page by page, so every PDF's first pages go in before any
+    PDF's later ones, up to VISION_MAX_PAGES pages in total.
+    VISION_MAX_REQUEST_BYTES is one budget across all of them: once the
+    encoded pages would exceed it, pages are downsampled to fit, and the rest
+    are dropped once even a downsampled page doesn't.
+
+    Returns, per source, the (0-based page index, base64 image) pairs encoded,
+    in page order; a PDF that can't be rendered gets none.
+    """
+    # Base64 inflates by 4/3; the budget is on what goes over the wire
+    remaining = settings.VISION_MAX_REQUEST_BYTES * 3 // 4 if settings.VISION_MAX_REQUEST_BYTES else None
+    iterators = {position: _vision_images(pages) for position, pages in enumerate(sources)}
+    encoded = [[] for _ in sources]
+    count = 0
+
+    try:
+        while iterators and not (settings.VISION_MAX_PAGES and count >= settings.VISION_MAX_PAGES):
+            for position in list(iterators):
+                if settings.VISION_MAX_PAGES and count >= settings.VISION_MAX_PAGES:
+                    break
+                try:
+                    index, image = next(iterators[position])
+                except StopIteration:
+                    del iterators[position]
+                    continue
+                except ImportError as e:
+                    logger.error("pdf2image not installed: %s", e)
+                    del iterators[position]
+                    continue
+                except Exception as e:
+                    logger.error("Failed to convert %s to images: %s", sources[position].file_path, e)
+                    del iterators[position]
+                    continue
 
-def extract_text_from_pdf(file_path: str) -> str:
+                with timed_stage("vision_encode"):
+                    data = encode_vision_image(image) if remaining is None else encode_within_budget(image, remaining)
+                if not data:
+                    logger.info("Vision byte budget exhausted, dropping pages from page %d of %s on",
+                                index + 1, sources[position].file_path)
+                    return encoded
+                if remaining is not None:
+                    remaining -= len(data)
+                encoded[position].append((index, base64.b64encode(data).decode('utf-8')))
+                count += 1
+    finally:
+        # Release the pages of windows rendered but not encoded
+        for iterator in iterators.values():
+            iterator.close()
+
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Converted %d pages to base64 (%d bytes)",
+                     count, sum(len(image) for pairs in encoded for _, image in pairs))
+    return encoded
+
+def pdf_to_images_base64(file_path: str, pages: Optional[RenderedPages] = None) -> List[str]:
     """
-    Extract text from a PDF file. Supports both text-based and image-based PDFs.
-    For image-based PDFs, uses OCR (Optical Character Recognition).
-    
+    Encode the vision pages of one PDF, see encode_vision_pages.
+    """
+    [encoded] = encode_vision_pages([pages or RenderedPages(file_path)])
+    return [image for _, image in encoded]
+
+def extract_text_from_pdf(file_path: str, pages: Optional[RenderedPages] = None,
+                          progress: Optional[Callable] = None) -> str:
+    """
+    Extract text from a PDF file. Supports text-based, image-based and mixed PDFs.
+
     Args:
         file_path: Path to the PDF file
-        
+        pages: Shared page renderer, so a later vision pass can reuse the OCR render
+        progress: Optional callback receiving OCR page events, see ocr_pages
+
     Returns:
-        str: Extracted text from the PDF file
+        str: Extracted text from the PDF file, see extract_pages_from_pdf
     """
-    text = ""
-    
-    # First, try standard text extraction with PyPDF2
+    page_texts = extract_pages_from_pdf(file_path, pages, progress)
+    return "".join(page_text + "\n" for page_text in page_texts if page_text)
+
+def read_text_layer(file_path: str) -> Tuple[List[str], List[str]]:
+    """
+    Extract the text layer of each page of a PDF file with the
+    PDF_TEXT_BACKEND backend and classify each page with classify_page.
+    Runs on the parsing processes, see extract_pages_from_pdf.
+
+    Returns:
+        Tuple[List[str], List[str]]: The page texts, "" for blank pages, and the page kinds
+    """
+    texts = []
+    kinds = []
+    # PyPDF2 reads the page structure to classify pages
     with open(file_path, "rb") as file:
+        backend = get_pdf_text_backend()
+        try:
+            page_texts = backend.extract_pages(file_path)
+        except Exception as e:
+            if isinstance(backend, PyPDF2Backend):
+                raise
+            logger.warning("%s failed on %s, using pypdf2: %s", backend.name, file_path, e)
+            backend = PyPDF2Backend()
+            page_texts = backend.extract_pages(file_path)
+
         reader = PyPDF2.PdfReader(file)
-        for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
-    
-    # If no text was extracted OR very little text (likely garbage/partial), use OCR
-    if len(text.strip()) < 50:
-        print(f"DEBUG: extracted text is too short ({len(text.strip())} chars), attempting OCR...")
+        if len(page_texts) != len(reader.pages):
+            logger.warning("%s found %d pages in %s, PyPDF2 %d",
+                           backend.name, len(page_texts), file_path, len(reader.pages))
+            page_texts = (page_texts + [""] * len(reader.pages))[:len(reader.pages)]
+
+        for index, page in enumerate(reader.pages):
+            kind = classify_page(page, page_texts[index])
+            kinds.append(kind)
+            texts.append(page_texts[index] if kind != BLANK_PAGE else "")
+    return texts, kinds
+
+def extract_pages_from_pdf(file_path: str, pages: Optional[RenderedPages] = None,
+                           progress: Optional[Callable] = None) -> List[str]:
+    """
+    Extract the text of each page of a PDF file, in page order, "" for pages
+    without text. The text layer comes from the PDF_TEXT_BACKEND backend. Each
+    page is classified with classify_page; only scanned pages are rasterized
+    and OCR'd (Optical Character Recognition).
+    Of more than PDF_MAX_OCR_PAGES scanned pages, select_pages picks those to
+    OCR; the others keep their text layer. It also picks pages.vision_pages.
+    """
+    pages = pages or RenderedPages(file_path)
+
+    # First, extract and classify the text layer; pure Python, so on a parsing process
+    with timed_stage("pdf_parse"):
+        texts, kinds = run_in_parsing_process(read_text_layer, file_path)
+    for kind in kinds:
+        PDF_PAGES.labels(kind).inc()
+    scanned = [index for index, kind in enumerate(kinds) if kind == SCANNED_PAGE]
+    pages.page_count = len(texts)
+
+    # Keyword matches are judged on the text layer, before OCR
+    pages.vision_pages = select_pages(list(range(len(texts))), texts, settings.VISION_MAX_PAGES)
+    ocr_indexes = select_pages(scanned, texts, settings.PDF_MAX_OCR_PAGES)
+    if len(ocr_indexes) < len(scanned):
+        logger.info("OCR of %d of %d scanned pages of %s (PDF_MAX_OCR_PAGES)",
+                    len(ocr_indexes), len(scanned), file_path)
+
+    if ocr_indexes:
+        logger.debug("OCR of %d of %d pages", len(ocr_indexes), len(texts))
         try:
-            from pdf2image import convert_from_path
             import pytesseract
-            from PIL import Image
-            
-            # Convert PDF pages to images
-            images = convert_from_path(file_path)
-            
-            # Perform OCR on each page
-            for i, image in enumerate(images):
-                print(f"DEBUG: Performing OCR on page {i+1}/{len(images)}")
-                page_text = pytesseract.image_to_string(image)
-                text += page_text + "\n"
-            
-            print(f"DEBUG: OCR extracted {len(text)} characters")
-            
+
+            # Only the scanned pages are rasterized, a window at a time; vision pages are kept for reuse
+            images = (image for _, _, image in pages.iter_pages(settings.OCR_DPI, ocr_indexes,
+                                                                keep=set(pages.vision_pages),
+                                                                keep_dpi=settings.VISION_DPI))
+
+            # Perform OCR on each page, in parallel across the OCR workers
+            page_numbers = [index + 1 for index in ocr_indexes]
+            for index, (page_text, confidence) in zip(ocr_indexes, ocr_pages(images, progress, page_numbers)):
+                texts[index] = page_text
+                if confidence is not None:
+                    pages.ocr_confidence[index] = confidence
+
         except ImportError as e:
-            print(f"ERROR: OCR libraries not installed. Install with: pip install pdf2image pytesseract Pillow")
-            print(f"ERROR: {str(e)}")
-            return ""
+            # The text layer of the scanned pages, if any, is kept
+            logger.error("OCR libraries not installed. Install with: pip install pdf2image pytesseract Pillow (%s)", e)
         except Exception as e:
-            print(f"ERROR: OCR failed: {str(e)}")
-            return ""
-    
-    return text
+            logger.error("OCR failed: %s", e)
+
+    return texts
@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.metrics import timed_stage
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLargeError(Exception):
+    pass
+
+
+def copy_upload(source, destination, max_bytes: int) -> Tuple[int, str]:
+    """
+    Copy an uploaded file object to destination in UPLOAD_CHUNK_BYTES chunks,
+    hashing as it goes, so the upload is never held in memory as a whole.
+
+    Returns:
+        Tuple[int, str]: Number of bytes copied and their SHA-256 hex digest
+
+    Raises:
+        UploadTooLargeError: As soon as more than max_bytes have been read
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = source.read(settings.UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLargeError(f"more than {max_bytes} bytes")
+        hasher.update(chunk)
+        destination.write(chunk)
+    return size, hasher.hexdigest()
+
+
+def remove_files(paths: List[str]):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+async def save_uploads(files: List[UploadFile], directory: Optional[str] = None):
+    """
+    Stream uploaded files to files in directory (the system temp dir by
+    default), enforcing MAX_UPLOAD_FILE_BYTES per file and
+    MAX_UPLOAD_REQUEST_BYTES across the request.
+
+    Returns:
+        Tuple[List[str], List[Tuple[str, str]]]: Saved file paths and
+        (file extension, SHA-256) per file, in upload order
+
+    Files written so far are removed if saving fails; otherwise removing
+    them is up to the caller.
+    """
+    temp_file_paths = []
+    file_hashes = []
+    remaining = settings.MAX_UPLOAD_REQUEST_BYTES
+    try:
+        for file in files:
+            logger.debug("Saving uploaded file %s (%s)", file.filename, file.content_type)
+
+            # Extract file extension
+            file_ext = os.path.splitext(file.filename)[1]  # e.g., ".pdf" or ".xlsx"
+
+            # Save uploaded file temporarily
+            with tempfile.NamedTemporaryFile(suffix=file_ext, dir=directory, delete=False) as temp_file:
+                temp_file_paths.append(temp_file.name)
+                limit = min(settings.MAX_UPLOAD_FILE_BYTES, remaining)
+                try:
+                    with timed_stage("upload_write"):
+                        size, sha256 = await run_in_threadpool(copy_upload, file.file, temp_file, limit)
+                except UploadTooLargeError:
+                    if limit == remaining:
+                        detail = f"Upload exceeds the {settings.MAX_UPLOAD_REQUEST_BYTES} byte limit per request"
+                    else:
+                        detail = f"{file.filename} exceeds the {settings.MAX_UPLOAD_FILE_BYTES} byte limit per file"
+                    raise HTTPException(status_code=413, detail=detail) from None
+
+            logger.debug("Wrote %d bytes to %s", size, temp_file.name)
+            remaining -= size
+            file_hashes.append((file_ext, sha256))
+    except BaseException:
+        remove_files(temp_file_paths)
+        raise
+
+    return temp_file_paths, file_hashes
+
+
+@asynccontextmanager
+async def saved_uploads(files: List[UploadFile]):
+    """
+    Save uploads with save_uploads and yield (paths, file hashes). The temp
+    files are removed when the block exits, whether or not it raised.
+    """
+    temp_file_paths, file_hashes = await save_uploads(files)
+    try:
+        yield temp_file_paths, file_hashes
+    finally:
+        remove_files(temp_file_paths)
@@ -0,0 +1,118 @@
+import datetime
+from typing import Iterator, List, Optional
+
+from app.core.config import settings
+
+
+def format_cell(value) -> str:
+    """
+    Render a cell value compactly: integral floats without ".0", floats
+    without binary noise, dates without a midnight time, and strings on one line.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return str(value).upper()
+    if isinstance(value, float):
+        if value.is_integer():
+            return str(int(value))
+        return format(value, ".15g")
+    if isinstance(value, datetime.datetime):
+        if value.time() == datetime.time():
+            return value.date().isoformat()
+        return value.isoformat(sep=" ")
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    # Keep the row on one line and the TSV columns intact
+    return " ".join(str(value).split())
+
+
+def iter_sheet_rows(worksheet, max_columns: int) -> Iterator[List[str]]:
+    """
+    Lazily yield the formatted cells of each non-empty row, up to max_columns.
+    """
+    for row in worksheet.iter_rows(max_col=max_columns or None, values_only=True):
+        cells = [format_cell(value) for value in row]
+        if any(cells):
+            yield cells
+
+
+def rows_to_tsv(rows: List[List[str]]) -> str:
+    """
+    Join formatted rows as tab-separated lines, dropping columns that are
+    empty in every row.
+    """
+    width = max((len(cells) for cells in rows), default=0)
+    used_columns = [
+        column for column in range(width)
+        if any(column < len(cells) and cells[column] for cells in rows)
+    ]
+    return "\n".join(
+        "\t".join(cells[column] if column < len(cells) else "" for column in used_columns).rstrip("\t")
+        for cells in rows
+    )
+
+
+def sheet_to_tsv(worksheet, max_rows: int, max_columns: int) -> str:
+    """
+    Render a worksheet as tab-separated rows, skipping empty rows and columns.
+
+    Reads at most max_rows non-empty rows; a trailing note marks the cut-off.
+    """
+    rows = []
+    truncated = False
+    for cells in iter_sheet_rows(worksheet, max_columns):
+        if max_rows and len(rows) == max_rows:
+            truncated = True
+            break
+        rows.append(cells)
+
+    text = rows_to_tsv(rows)
+    if truncated:
+        text += f"\n[truncated after {max_rows} rows]"
+    return text
+
+
+def open_workbook(file_path: str):
+    """
+    Open a workbook in read-only mode with cached formula values. Close it when done.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    for worksheet in workbook.worksheets:
+        # Read-only sheets trust the stored dimensions, which some writers get wrong
+        worksheet.reset_dimensions()
+    return workbook
+
+
+def extract_text_from_xlsx(file_path: str, max_rows: Optional[int] = None,
+                           max_columns: Optional[int] = None) -> str:
+    """
+    Extract the text of every sheet of an XLSX workbook as compact TSV.
+
+    Uses openpyxl in read-only mode so rows are streamed from the file rather
+    than loaded into a DataFrame. Each sheet is capped at XLSX_MAX_ROWS_PER_SHEET
+    non-empty rows and XLSX_MAX_COLUMNS columns unless overridden.
+
+    Args:
+        file_path: Path to the XLSX file
+        max_rows: Non-empty rows kept per sheet; 0 means no limit
+        max_columns: Leading columns read per sheet; 0 means no limit
+
+    Returns:
+        str: "Sheet: <name>" followed by the sheet's rows, for each non-empty sheet
+    """
+    max_rows = settings.XLSX_MAX_ROWS_PER_SHEET if max_rows is None else max_rows
+    max_columns = settings.XLSX_MAX_COLUMNS if max_columns is None else max_columns
+
+    workbook = open_workbook(file_path)
+    try:
+        sheets = []
+        for worksheet in workbook.worksheets:
+            text = sheet_to_tsv(worksheet, max_rows, max_columns)
+            if text:
+                sheets.append(f"Sheet: {worksheet.title}\n{text}")
+        return "\n\n".join(sheets)
+    finally:
+        workbook.close()
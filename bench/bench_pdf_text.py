@@ -0,0 +1,127 @@
+"""
+Benchmark the PDF text backends in app.utils.pdf_backends.
+
+Generates text bills of lading of --pages page counts with
+scripts/create_test_docs.py and runs each backend on them and on the sample
+documents. Reports the best of --repeat runs in pages per second, and how
+closely each backend's output matches PyPDF2's:
+
+- similarity: word-level similarity to PyPDF2's text, averaged over pages
+  (1.0 is the same words in the same order; whitespace is ignored)
+- fields: whether the rule extractor finds the same fields with the same
+  values, which is what the extraction results depend on
+
+Backends whose library or executable is missing are reported as skipped.
+
+Usage:
+    python bench/bench_pdf_text.py --pages 10 100 300 --repeat 3
+"""
+import argparse
+import difflib
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+from app.services.rule_extractor import extract_fields_with_rules
+from app.utils.pdf_backends import PDF_TEXT_BACKENDS
+
+REFERENCE = "pypdf2"
+SAMPLES = [
+    os.path.join(ROOT, 'tests', 'sample_bill_of_lading.pdf'),
+    os.path.join(ROOT, 'testDocs', 'BL-COSU534343282.pdf'),
+]
+
+
+def similarity(pages, reference_pages):
+    ratios = [
+        difflib.SequenceMatcher(None, text.split(), reference.split(), autojunk=False).ratio()
+        if text.split() or reference.split() else 1.0
+        for text, reference in zip(pages, reference_pages)
+    ]
+    if len(pages) != len(reference_pages):
+        ratios.append(0.0)
+    return sum(ratios) / len(ratios) if ratios else 1.0
+
+
+def rule_values(pages):
+    return {name: field["value"] for name, field in extract_fields_with_rules("\n".join(pages)).items()}
+
+
+def run_backend(backend, path, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pages = backend.extract_pages(path)
+        times.append(time.perf_counter() - start)
+    return pages, min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 300])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    from create_test_docs import create_text_pdf
+
+    backends = {}
+    skipped = {}
+    for name, backend_class in PDF_TEXT_BACKENDS.items():
+        try:
+            backends[name] = backend_class()
+        except (ImportError, FileNotFoundError) as e:
+            skipped[name] = str(e)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        documents = [(os.path.basename(path), path) for path in SAMPLES if os.path.exists(path)]
+        for pages in args.pages:
+            path = os.path.join(tmp, f"text_{pages}_pages.pdf")
+            create_text_pdf(path, pages)
+            documents.append((f"text {pages} pages", path))
+
+        for document, path in documents:
+            reference, _ = run_backend(backends[REFERENCE], path, 1)
+            reference_fields = rule_values(reference)
+            results[document] = {}
+            for name, backend in backends.items():
+                try:
+                    pages, seconds = run_backend(backend, path, args.repeat)
+                except Exception as e:
+                    results[document][name] = {"error": str(e)}
+                    continue
+                results[document][name] = {
+                    "seconds": round(seconds, 4),
+                    "pages_per_second": round(len(pages) / seconds, 1) if seconds else None,
+                    "chars": sum(len(page) for page in pages),
+                    "similarity": round(similarity(pages, reference), 4),
+                    "same_fields": rule_values(pages) == reference_fields,
+                }
+
+    if args.json:
+        print(json.dumps({"results": results, "skipped": skipped}, indent=2))
+        return
+
+    for document, by_backend in results.items():
+        print(f"\n{document}")
+        print(f"  {'backend':<10} {'seconds':>9} {'pages/s':>9} {'chars':>9} {'similarity':>11} {'fields':>7}")
+        for name, result in by_backend.items():
+            if "error" in result:
+                print(f"  {name:<10} error: {result['error']}")
+                continue
+            print(f"  {name:<10} {result['seconds']:>9.4f} {result['pages_per_second'] or 0:>9.1f} "
+                  f"{result['chars']:>9} {result['similarity']:>11.4f} "
+                  f"{'same' if result['same_fields'] else 'differ':>7}")
+    for name, reason in skipped.items():
+        print(f"\nskipped {name}: {reason}")
+
+
+if __name__ == "__main__":
+    main()
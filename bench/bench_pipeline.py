@@ -0,0 +1,407 @@
+"""
+Load and latency benchmark for the processing pipeline.
+
+Generates text PDFs, scanned PDFs and wide workbooks of increasing size with
+scripts/create_test_docs.py, then runs two scenarios:
+
+- library: extract_text_from_pdf, pdf_to_images_base64, process_documents
+  and extract_field_from_document on each document, --repeat times, in a
+  fresh subprocess per document. Reports the median time per stage,
+  latency percentiles of process + extract, and peak RSS.
+- http: starts the API in a child process and sends --requests uploads of a
+  text PDF plus a workbook to /process-documents, --concurrency at a time.
+  Reports throughput, latency percentiles and the server's peak RSS.
+
+The LLM is the local stand-in from app.services.llm_stub with
+--llm-latency-ms latency, so the numbers measure the app, not the model.
+Stages that need missing system packages (poppler, tesseract) are reported
+as skipped, and fail --check.
+
+--json PATH writes the results. --check compares them with
+bench/baseline.json and exits non-zero when a metric is worse by more than
+--tolerance, missing, or skipped; --update-baseline stores them as the new
+baseline, if no stage was skipped. Baselines
+are machine-specific: record them on the machine that runs --check, with
+poppler and tesseract installed. None is committed, so --check needs a
+--update-baseline run first.
+
+Usage:
+    python bench/bench_pipeline.py --quick
+    python bench/bench_pipeline.py --check
+    python bench/bench_pipeline.py --update-baseline
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# name: (generator, size arguments)
+DOCUMENTS = {
+    "text_pdf_1p": ("text_pdf", {"pages": 1}),
+    "text_pdf_20p": ("text_pdf", {"pages": 20}),
+    "text_pdf_100p": ("text_pdf", {"pages": 100}),
+    "scanned_pdf_1p": ("scanned_pdf", {"pages": 1}),
+    "scanned_pdf_5p": ("scanned_pdf", {"pages": 5}),
+    "workbook_1k_x20": ("workbook", {"rows": 1000, "columns": 20}),
+    "workbook_20k_x60": ("workbook", {"rows": 20000, "columns": 60}),
+}
+QUICK_DOCUMENTS = ["text_pdf_1p", "text_pdf_20p", "scanned_pdf_1p", "workbook_1k_x20"]
+HTTP_DOCUMENTS = ["text_pdf_1p", "workbook_1k_x20"]
+
+# Differences smaller than these are noise, whatever the relative change
+MIN_SECONDS_DELTA = 0.02
+MIN_MB_DELTA = 10
+MIN_RPS_DELTA = 0.5
+
+
+def generate(name, directory):
+    from create_test_docs import create_scanned_pdf, create_text_pdf, create_wide_workbook
+
+    kind, size = DOCUMENTS[name]
+    path = os.path.join(directory, name + (".xlsx" if kind == "workbook" else ".pdf"))
+    if kind == "text_pdf":
+        create_text_pdf(path, **size)
+    elif kind == "scanned_pdf":
+        create_scanned_pdf(path, **size)
+    else:
+        create_wide_workbook(path, **size)
+    return path
+
+
+def percentiles(values):
+    # Nearest rank, so every reported value is an observed one
+    ordered = sorted(values)
+    return {
+        f"p{p}": round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)], 4)
+        for p in (50, 95, 99)
+    }
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+async def run_library(path, repeat):
+    from app.services.document_processor import process_documents
+    from app.services.llm_gateway import close_client
+    from app.services.llm_service import extract_field_from_document
+    from app.utils.pdf_utils import extract_text_from_pdf, pdf_to_images_base64
+
+    stages = {}
+    skipped = {}
+    latencies = []
+
+    def stage(name, measured, function, *args):
+        if name in skipped:
+            return None
+        try:
+            result, seconds = timed(function, *args)
+        except Exception as e:
+            skipped[name] = f"{type(e).__name__}: {e}"[:200]
+            return None
+        if measured:
+            stages.setdefault(name, []).append(seconds)
+        return result, seconds
+
+    # The first run warms up imports and pools and is not measured
+    for run in range(repeat + 1):
+        measured = run > 0
+        if path.endswith(".pdf"):
+            stage("extract_text_from_pdf", measured, extract_text_from_pdf, path)
+            images = stage("pdf_to_images_base64", measured, pdf_to_images_base64, path)
+            if images is not None and not images[0]:
+                # Rendering errors are logged and return no pages
+                skipped["pdf_to_images_base64"] = "no pages rendered (is poppler installed?)"
+                stages.pop("pdf_to_images_base64", None)
+
+        processed = stage("process_documents", measured, process_documents, [path])
+        if processed is None:
+            continue
+        document_data, process_seconds = processed
+        start = time.perf_counter()
+        result = await extract_field_from_document(document_data)
+        extract_seconds = time.perf_counter() - start
+        if "error" in result:
+            skipped["extract_field_from_document"] = result["error"][:200]
+            continue
+        if measured:
+            stages.setdefault("extract_field_from_document", []).append(extract_seconds)
+            latencies.append(process_seconds + extract_seconds)
+
+    await close_client()
+    return {
+        "size_bytes": os.path.getsize(path),
+        "stages": {name: round(statistics.median(seconds), 4) for name, seconds in stages.items()},
+        "latency": percentiles(latencies) if latencies else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "skipped": skipped,
+    }
+
+
+def serve(port):
+    import uvicorn
+    from app.main import app
+
+    try:
+        uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")).run()
+    except KeyboardInterrupt:
+        # uvicorn re-raises the SIGINT used to stop it after shutting down
+        pass
+
+    print(json.dumps({"peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on port {port}")
+
+
+def run_http(args, paths, env):
+    import requests
+
+    def send():
+        files = [("files", (os.path.basename(path), open(path, "rb"))) for path in paths]
+        start = time.perf_counter()
+        try:
+            response = requests.post(f"http://127.0.0.1:{args.port}/process-documents", files=files, timeout=300)
+            ok = response.status_code == 200 and "error" not in response.json()["extracted_data"]
+        finally:
+            for _, (_, f) in files:
+                f.close()
+        return ok, time.perf_counter() - start
+
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", "--port", str(args.port)],
+        stdout=subprocess.PIPE, text=True, env=env,
+    )
+    try:
+        wait_for_port(args.port)
+        send()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(pool.map(lambda _: send(), range(args.requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.send_signal(signal.SIGINT)
+        output, _ = server.communicate(timeout=60)
+
+    latencies = [seconds for ok, seconds in results if ok]
+    return {
+        "documents": [os.path.basename(path) for path in paths],
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": sum(1 for ok, _ in results if not ok),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency": percentiles(latencies) if latencies else None,
+        "peak_rss_mb": round(json.loads(output.strip().splitlines()[-1])["peak_rss_mb"], 1),
+    }
+
+
+def flatten(results):
+    """
+    Comparable metrics as {name: (value, higher_is_better)}.
+    """
+    metrics = {}
+    for name, document in results.get("library", {}).items():
+        for stage, seconds in document["stages"].items():
+            metrics[f"library.{name}.{stage}"] = (seconds, False)
+        for p, seconds in (document["latency"] or {}).items():
+            metrics[f"library.{name}.latency.{p}"] = (seconds, False)
+        metrics[f"library.{name}.peak_rss_mb"] = (document["peak_rss_mb"], False)
+    http = results.get("http")
+    if http:
+        metrics["http.throughput_rps"] = (http["throughput_rps"], True)
+        for p, seconds in (http["latency"] or {}).items():
+            metrics[f"http.latency.{p}"] = (seconds, False)
+        metrics["http.peak_rss_mb"] = (http["peak_rss_mb"], False)
+        metrics["http.errors"] = (http["errors"], False)
+    return metrics
+
+
+def skipped_stages(results):
+    """
+    Stages a run could not measure, as {metric name: reason}.
+    """
+    return {
+        f"library.{name}.{stage}": reason
+        for name, document in results.get("library", {}).items()
+        for stage, reason in document["skipped"].items()
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Metrics worse than the baseline by more than tolerance (a fraction).
+    Stages skipped in the baseline or in this run, and baseline metrics this
+    run didn't report, are failures too: they would otherwise hide
+    regressions in what wasn't measured.
+    """
+    regressions = [f"{name}: skipped in the baseline ({reason})" for name, reason in skipped_stages(baseline).items()]
+    regressions += [f"{name}: skipped ({reason})" for name, reason in skipped_stages(results).items()]
+    current = flatten(results)
+    for name, (before, higher_is_better) in flatten(baseline).items():
+        if name not in current:
+            regressions.append(f"{name}: {before} -> missing")
+            continue
+        value = current[name][0]
+        if name.endswith("rss_mb"):
+            min_delta = MIN_MB_DELTA
+        elif name.endswith("rps"):
+            min_delta = MIN_RPS_DELTA
+        elif name.endswith("errors"):
+            min_delta = 0
+        else:
+            min_delta = MIN_SECONDS_DELTA
+        if higher_is_better:
+            worse = value < before / (1 + tolerance) and before - value > min_delta
+        else:
+            worse = value > before * (1 + tolerance) and value - before > min_delta
+        if worse:
+            regressions.append(f"{name}: {before} -> {value}")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'document':<18} {'stage':<28} {'median s':>9}")
+    for name, document in results["library"].items():
+        for stage, seconds in document["stages"].items():
+            print(f"{name:<18} {stage:<28} {seconds:>9}")
+        for stage, reason in document["skipped"].items():
+            print(f"{name:<18} {stage:<28} {'skipped':>9}  {reason}")
+    print()
+    print(f"{'document':<18} {'p50 s':>8} {'p95 s':>8} {'p99 s':>8} {'peak rss MB':>12}")
+    for name, document in results["library"].items():
+        latency = document["latency"] or {}
+        print(f"{name:<18} {latency.get('p50', '-'):>8} {latency.get('p95', '-'):>8} "
+              f"{latency.get('p99', '-'):>8} {document['peak_rss_mb']:>12}")
+    http = results.get("http")
+    if http:
+        latency = http["latency"] or {}
+        print()
+        print(f"HTTP /process-documents: {http['requests']} requests, concurrency {http['concurrency']}, "
+              f"{http['errors']} errors")
+        print(f"  throughput {http['throughput_rps']} req/s, p50 {latency.get('p50')}s, p95 {latency.get('p95')}s, "
+              f"p99 {latency.get('p99')}s, server peak RSS {http['peak_rss_mb']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Small documents only")
+    parser.add_argument("--repeat", type=int, default=5, help="Library runs per document")
+    parser.add_argument("--requests", type=int, default=50, help="HTTP requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="HTTP requests in flight")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="Stand-in LLM latency")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--stub-port", type=int, default=8901)
+    parser.add_argument("--no-http", action="store_true", help="Skip the HTTP scenario")
+    parser.add_argument("--json", metavar="PATH", help="Write machine-readable results to PATH")
+    parser.add_argument("--check", action="store_true", help="Exit non-zero on regressions against the baseline")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown, as a fraction")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--library", metavar="PATH", help=argparse.SUPPRESS)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+    if args.library:
+        # Child process: report one JSON line; the pipeline logs to stderr
+        print(json.dumps(asyncio.run(run_library(args.library, args.repeat))))
+        return
+
+    if args.check and not args.update_baseline and not os.path.exists(args.baseline):
+        # Fail before the run rather than after it
+        sys.exit(f"No baseline at {args.baseline}; record one with --update-baseline "
+                 f"on this machine, with poppler and tesseract installed")
+
+    names = QUICK_DOCUMENTS if args.quick else list(DOCUMENTS)
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "bench"),
+        LLM_BACKEND="stub",
+        LLM_STUB_URL=f"http://127.0.0.1:{args.stub_port}/v1",
+        CACHE_ENABLED="false",
+        # Measure the app's ceiling, not the configured OpenAI rate limit
+        LLM_REQUESTS_PER_MINUTE="0",
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env["JOB_DB_PATH"] = os.path.join(tmp, "jobs.sqlite3")
+        env["JOB_FILES_DIR"] = os.path.join(tmp, "jobs")
+        paths = {name: generate(name, tmp) for name in names}
+
+        stub = subprocess.Popen(
+            [sys.executable, "-m", "app.services.llm_stub", "--port", str(args.stub_port),
+             "--latency-ms", str(args.llm_latency_ms), "--image-latency-ms", "0"],
+            cwd=ROOT, env=env,
+        )
+        try:
+            wait_for_port(args.stub_port)
+            results = {"config": {
+                "quick": args.quick, "repeat": args.repeat, "llm_latency_ms": args.llm_latency_ms,
+            }, "library": {}}
+            for name in names:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--library", paths[name], "--repeat", str(args.repeat)],
+                    check=True, capture_output=True, text=True, env=env,
+                ).stdout
+                results["library"][name] = json.loads(output.strip().splitlines()[-1])
+            if not args.no_http:
+                results["http"] = run_http(args, [paths[name] for name in HTTP_DOCUMENTS], env)
+        finally:
+            stub.terminate()
+            stub.wait()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        if skipped_stages(results):
+            # --check would fail against it; install poppler and tesseract first
+            print(f"\nNot writing a baseline with skipped stages to {args.baseline}")
+            sys.exit(1)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+    elif args.check:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%}, or metrics not measured:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
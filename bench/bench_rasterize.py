@@ -0,0 +1,133 @@
+"""
+Benchmark PDF rasterization for scanned documents.
+
+Compares rendering each page twice (once for OCR, once for the vision
+encoder, as the pipeline used to) against rendering once at OCR DPI and
+downscaling in memory for vision. OCR itself is identical in both variants
+and is left out so the numbers isolate poppler and image handling.
+
+Each variant runs in a fresh subprocess so peak RSS is not shared. The
+poppler version is reported with the results, since pdftoppm's speed
+differs between releases.
+
+Usage:
+    python bench/bench_rasterize.py --pages 10 --repeat 3
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.core.config import settings
+from app.utils.pdf_utils import RenderedPages, pdf_to_images_base64, render_pdf_pages
+
+VARIANTS = ["separate", "shared"]
+
+
+def create_scanned_pdf(path, pages):
+    from PIL import Image, ImageDraw
+
+    images = []
+    for page in range(pages):
+        image = Image.new("L", (1275, 1650), 255)
+        draw = ImageDraw.Draw(image)
+        for line in range(60):
+            draw.text((80, 80 + line * 25), f"Page {page + 1} line {line + 1} BILL OF LADING COSU534343282", fill=0)
+        images.append(image)
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=150)
+
+
+def run_variant(variant, pdf_path):
+    start = time.perf_counter()
+
+    if variant == "separate":
+        render_pdf_pages(pdf_path, dpi=settings.OCR_DPI)
+        images = pdf_to_images_base64(pdf_path)
+    else:
+        pages = RenderedPages(pdf_path)
+        pages.at_least(settings.OCR_DPI)
+        images = pdf_to_images_base64(pdf_path, pages)
+
+    wall = time.perf_counter() - start
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "variant": variant,
+        "pages": len(images),
+        "wall_seconds": round(wall, 3),
+        "poppler_cpu_seconds": round(children.ru_utime + children.ru_stime, 3),
+        "peak_rss_mb": round(own.ru_maxrss / 1024, 1),
+    }
+
+
+def poppler_version():
+    """
+    pdftoppm's version line, e.g. "pdftoppm version 22.02.0".
+    """
+    executable = shutil.which("pdftoppm")
+    if not executable:
+        sys.exit("pdftoppm not found; install poppler-utils to run this benchmark")
+    # pdftoppm prints its version to stderr
+    output = subprocess.run([executable, "-v"], capture_output=True, text=True)
+    return (output.stderr or output.stdout).strip().splitlines()[0]
+
+
+def measure(variant, pdf_path):
+    output = subprocess.run(
+        [sys.executable, __file__, "--variant", variant, "--pdf", pdf_path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        # Child process: silence pipeline debug output, report one JSON line
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            result = run_variant(args.variant, args.pdf)
+            sys.stdout = stdout
+        print(json.dumps(result))
+        return
+
+    poppler = poppler_version()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "scan.pdf")
+        create_scanned_pdf(pdf_path, args.pages)
+
+        results = {}
+        for variant in VARIANTS:
+            runs = [measure(variant, pdf_path) for _ in range(args.repeat)]
+            results[variant] = {
+                key: min(run[key] for run in runs)
+                for key in ("wall_seconds", "poppler_cpu_seconds", "peak_rss_mb")
+            }
+
+    if args.json:
+        print(json.dumps({"poppler": poppler, "results": results}, indent=2))
+        return
+
+    print(f"Scanned PDF, {args.pages} pages, best of {args.repeat}, {poppler}")
+    print(f"{'variant':<10} {'wall s':>8} {'poppler cpu s':>14} {'peak rss MB':>12}")
+    for variant, row in results.items():
+        print(f"{variant:<10} {row['wall_seconds']:>8} {row['poppler_cpu_seconds']:>14} {row['peak_rss_mb']:>12}")
+
+
+if __name__ == "__main__":
+    main()
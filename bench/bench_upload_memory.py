@@ -0,0 +1,164 @@
+"""
+Benchmark server memory while large uploads are in flight.
+
+Starts the API in a child process with the parsing and LLM stages stubbed
+out, streams several large PDF uploads to /process-documents concurrently,
+and reports how far the server's peak RSS grew over its idle peak. Exits
+non-zero when the growth exceeds --max-growth-mb, so an upload path that
+buffers whole files in memory fails the run.
+
+Usage:
+    python bench/bench_upload_memory.py --files 4 --file-mb 50
+"""
+import argparse
+import http.client
+import json
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+BOUNDARY = "benchboundary7MA4YWxkTrZu0gW"
+CHUNK = b"%PDF-1.4\n" + b"0" * (1024 * 1024 - 9)
+
+
+def serve(port):
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ["CACHE_ENABLED"] = "false"
+
+    from unittest.mock import patch
+    import uvicorn
+    from app.main import app
+
+    async def stub_extract(document_data, progress=None):
+        return {"text_extraction": {}}
+
+    idle_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with patch("app.api.routes.process_documents", return_value={"pdf_text": "stub"}), \
+            patch("app.api.routes.extract_field_from_document", side_effect=stub_extract), \
+            open(os.devnull, "w") as devnull:
+        # Keep the pipeline's debug prints out of the result line
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")).run()
+        except KeyboardInterrupt:
+            # uvicorn re-raises the SIGINT used to stop it after shutting down
+            pass
+        sys.stdout = stdout
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"idle_peak_rss_mb": idle_peak / 1024, "peak_rss_mb": peak / 1024}))
+
+
+def multipart_parts(name, size):
+    header = (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="files"; filename="{name}"\r\n'
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode()
+    footer = f"\r\n--{BOUNDARY}--\r\n".encode()
+    return header, footer
+
+
+def upload(port, name, size, results):
+    header, footer = multipart_parts(name, size)
+
+    def body():
+        yield header
+        remaining = size
+        while remaining:
+            chunk = CHUNK[:min(remaining, len(CHUNK))]
+            remaining -= len(chunk)
+            yield chunk
+        yield footer
+
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    conn.request(
+        "POST", "/process-documents", body=body(),
+        headers={
+            "Content-Type": f"multipart/form-data; boundary={BOUNDARY}",
+            "Content-Length": str(len(header) + size + len(footer)),
+        },
+    )
+    results.append(conn.getresponse().status)
+    conn.close()
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=4, help="Concurrent uploads")
+    parser.add_argument("--file-mb", type=int, default=50, help="Size of each upload")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-growth-mb", type=float, default=64)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    env = dict(os.environ, MAX_UPLOAD_FILE_BYTES=str(args.file_mb * 1024 * 1024 + 1),
+               MAX_UPLOAD_REQUEST_BYTES=str(args.file_mb * 1024 * 1024 + 1))
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", "--port", str(args.port)],
+        stdout=subprocess.PIPE, text=True, env=env,
+    )
+    try:
+        wait_for_port(args.port)
+        statuses = []
+        start = time.perf_counter()
+        uploads = [
+            threading.Thread(target=upload, args=(args.port, f"scan{i}.pdf", args.file_mb * 1024 * 1024, statuses))
+            for i in range(args.files)
+        ]
+        for thread in uploads:
+            thread.start()
+        for thread in uploads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.send_signal(signal.SIGINT)
+        output, _ = server.communicate(timeout=30)
+
+    memory = json.loads(output.strip().splitlines()[-1])
+    results = {
+        "uploaded_mb": args.files * args.file_mb,
+        "seconds": round(elapsed, 2),
+        "statuses": statuses,
+        "idle_peak_rss_mb": round(memory["idle_peak_rss_mb"], 1),
+        "peak_rss_mb": round(memory["peak_rss_mb"], 1),
+        "growth_mb": round(memory["peak_rss_mb"] - memory["idle_peak_rss_mb"], 1),
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"Uploaded {results['uploaded_mb']} MB in {args.files} concurrent requests ({results['seconds']}s)")
+        print(f"Response statuses: {statuses}")
+        print(f"Server peak RSS: {results['peak_rss_mb']} MB (idle {results['idle_peak_rss_mb']} MB, "
+              f"growth {results['growth_mb']} MB, limit {args.max_growth_mb} MB)")
+
+    if any(status != 200 for status in statuses) or results["growth_mb"] > args.max_growth_mb:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
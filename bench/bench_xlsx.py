@@ -0,0 +1,151 @@
+"""
+Benchmark XLSX text extraction.
+
+Compares the old pandas path (read_excel on every sheet, rendered with
+df.to_string()) against the streaming openpyxl reader in
+app.utils.xlsx_utils, and against summarize_workbook, which streams every row
+to compute the line-item aggregates but sends the LLM only a sample of the
+table. Runs on the demo packing list and on a synthetic workbook with
+--rows line items.
+
+Reports parse time, peak RSS and prompt size per variant. Prompt tokens are
+counted with tiktoken's o200k_base encoding when it is available, otherwise
+estimated at 4 characters per token. Each variant runs in a fresh
+subprocess so peak RSS is not shared.
+
+Usage:
+    python bench/bench_xlsx.py --rows 50000 --repeat 3
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+VARIANTS = ["pandas", "openpyxl", "summarized"]
+DEMO_XLSX = os.path.join(os.path.dirname(__file__), '..', 'testDocs', 'Demo-Invoice-PackingList_1.xlsx')
+
+
+def create_packing_list(path, rows):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Packing List")
+    sheet.append(["Packing List"])
+    sheet.append(["B/L NO.:", "ZMLU34110002", None, None, "CNTR NO", "MSCU1234567"])
+    sheet.append([])
+    sheet.append(["S.No.", "Description", "Qty (Pcs)", "Unit Value (USD)", "Total Value (USD)",
+                  "Gross Weight (KG)", "HS code"])
+    for i in range(1, rows + 1):
+        qty = 100 + i % 900
+        price = round(0.25 + (i % 37) * 0.11, 2)
+        sheet.append([i, f"Item {i % 250}", qty, price, round(qty * price, 2), round(qty * 0.013, 2),
+                      f"9505.90.{6000 + i % 100}"])
+    workbook.save(path)
+
+
+def pandas_text(file_path):
+    # The extraction process_documents used before the openpyxl reader
+    import pandas as pd
+
+    xls = pd.ExcelFile(file_path)
+    text_content = []
+    for sheet_name in xls.sheet_names:
+        df = pd.read_excel(xls, sheet_name=sheet_name)
+        text_content.append(f"Sheet: {sheet_name}\n{df.to_string()}")
+    return "\n".join(text_content)
+
+
+def count_tokens(text):
+    try:
+        import tiktoken
+
+        return len(tiktoken.get_encoding("o200k_base").encode(text)), True
+    except Exception:
+        return len(text) // 4, False
+
+
+def run_variant(variant, xlsx_path):
+    start = time.perf_counter()
+    if variant == "pandas":
+        text = pandas_text(xlsx_path)
+    elif variant == "summarized":
+        from app.services.line_items import summarize_workbook
+
+        text, _ = summarize_workbook(xlsx_path)
+    else:
+        from app.utils.xlsx_utils import extract_text_from_xlsx
+
+        text = extract_text_from_xlsx(xlsx_path)
+    wall = time.perf_counter() - start
+
+    tokens, exact = count_tokens(text)
+    return {
+        "variant": variant,
+        "parse_seconds": round(wall, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "chars": len(text),
+        "tokens": tokens,
+        "tokens_exact": exact,
+    }
+
+
+def measure(variant, xlsx_path):
+    output = subprocess.run(
+        [sys.executable, __file__, "--variant", variant, "--xlsx", xlsx_path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--xlsx", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        # Child process: silence pipeline debug output, report one JSON line
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            result = run_variant(args.variant, args.xlsx)
+            sys.stdout = stdout
+        print(json.dumps(result))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic = os.path.join(tmp, f"packing_list_{args.rows}.xlsx")
+        create_packing_list(synthetic, args.rows)
+
+        results = {}
+        for name, path in [("demo", DEMO_XLSX), (f"{args.rows} rows", synthetic)]:
+            results[name] = {}
+            for variant in VARIANTS:
+                runs = [measure(variant, path) for _ in range(args.repeat)]
+                best = min(runs, key=lambda run: run["parse_seconds"])
+                best["peak_rss_mb"] = min(run["peak_rss_mb"] for run in runs)
+                results[name][variant] = best
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"XLSX extraction, best of {args.repeat}")
+    print(f"{'workbook':<12} {'variant':<11} {'parse s':>8} {'peak rss MB':>12} {'chars':>10} {'tokens':>10}")
+    for name, variants in results.items():
+        for variant, row in variants.items():
+            tokens = row["tokens"] if row["tokens_exact"] else f"~{row['tokens']}"
+            print(f"{name:<12} {variant:<11} {row['parse_seconds']:>8} {row['peak_rss_mb']:>12} "
+                  f"{row['chars']:>10} {tokens:>10}")
+
+
+if __name__ == "__main__":
+    main()
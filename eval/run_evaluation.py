@@ -1,82 +1,137 @@
-import sys
-import os
+"""
+Measure extraction accuracy (precision, recall and F1 per field) together
+with per-document latency and token cost, so configurations can be compared
+on both.
+
+Each ground truth entry runs through process_documents and
+extract_field_from_document, --workers documents at a time. LLM responses
+are cached in --cache, keyed on the request, so a rerun that sends the same
+prompts (e.g. after changing the scoring) doesn't query the model again;
+cached calls still report the tokens they originally cost. Each finished
+document is appended to --checkpoint, and a rerun with the same extraction
+configuration skips the documents already there.
+
+Usage:
+    python eval/run_evaluation.py eval/ground_truth_example.json testDocs --workers 4
+    python eval/run_evaluation.py ground_truth.json testDocs --restart --no-cache
+"""
+import argparse
+import asyncio
 import json
-from pathlib import Path
-from typing import Dict, List, Any
+import math
+import os
+import re
+import statistics
+import sys
+import time
 from collections import defaultdict
+from typing import Any, Dict, List, Optional
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from app.services.document_processor import DocumentProcessor
-from app.services.llm_service import LLMService
+from app.core.concurrency import run_in_parsing_pool, shutdown_pools
+from app.core.config import settings
+from app.services.document_processor import process_documents
+from app.services.llm_backends import RecordReplayBackend, get_llm_backend, set_llm_backend
+from app.services.llm_gateway import close_client, track_token_usage
+from app.services.llm_service import extract_field_from_document, extraction_fingerprint
+from app.services.rule_extractor import normalize_date
+
+EVAL_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(EVAL_DIR, ".cache", "llm_responses.jsonl")
+
+# USD per million tokens; the defaults are gpt-5-mini's list prices
+DEFAULT_PROMPT_PRICE = 0.25
+DEFAULT_COMPLETION_PRICE = 2.00
+
+# Amounts are compared as numbers: "$45,000.00" matches "45000"
+_NUMBER = re.compile(r"^\$?\s*(-?[\d,]*\.?\d+)\s*(kg|kgs|usd)?$")
+# Relative difference within which averages match, so averages rounded differently still count
+AVERAGE_TOLERANCE = 0.001
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
 
 
 class ExtractionEvaluator:
-    
-    FIELDS = [
-        "Bill of lading number",
-        "Container Number",
-        "Consignee Name",
-        "Consignee Address",
-        "Date of export",
-        "Date",
-        "Line Items Count",
-        "Average Gross Weight",
-        "Average Price"
-    ]
-    
-    def __init__(self, ground_truth_path: str):
+
+    # Ground truth field names and the extraction schema fields they score
+    FIELDS = {
+        "Bill of lading number": "bill_of_lading_number",
+        "Container Number": "container_number",
+        "Consignee Name": "consignee_name",
+        "Consignee Address": "consignee_address",
+        "Date of export": "date_of_export",
+        "Date": "date",
+        "Line Items Count": "line_items_count",
+        "Average Gross Weight": "average_gross_weight",
+        "Average Price": "average_price",
+    }
+    # Compared as dates: "15 Jan 2024" matches "2024-01-15"
+    DATE_FIELDS = {"Date of export", "Date"}
+    # Compared within AVERAGE_TOLERANCE; other amounts must match to the cent
+    AVERAGE_FIELDS = {"Average Gross Weight", "Average Price"}
+
+    def __init__(self, ground_truth_path: str, source: str = "text_extraction",
+                 prompt_price: float = DEFAULT_PROMPT_PRICE, completion_price: float = DEFAULT_COMPLETION_PRICE):
         self.ground_truth = self._load_ground_truth(ground_truth_path)
-        self.llm_service = LLMService()
-        self.doc_processor = DocumentProcessor(self.llm_service)
-    
+        self.source = source
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+
     def _load_ground_truth(self, path: str) -> Dict[str, Dict[str, Any]]:
         with open(path, 'r') as f:
             return json.load(f)
-    
-    def _normalize_value(self, value: Any) -> str:
+
+    def fingerprint(self) -> str:
+        """
+        Checkpointed results are reused only while this stays the same.
+        """
+        return f"{extraction_fingerprint()}:{self.source}"
+
+    def _normalize_value(self, value: Any, field: Optional[str] = None) -> str:
         if value is None or value == "":
             return ""
-        return str(value).strip().lower()
-    
-    def _values_match(self, extracted: Any, expected: Any) -> bool:
-        norm_extracted = self._normalize_value(extracted)
-        norm_expected = self._normalize_value(expected)
-        
+        text = " ".join(str(value).split()).lower()
+        if field in self.DATE_FIELDS:
+            date = normalize_date(text)
+            if date:
+                return date[0]
+        number = _NUMBER.match(text)
+        if number:
+            try:
+                return f"{float(number.group(1).replace(',', '')):.2f}"
+            except ValueError:
+                pass
+        return text
+
+    def _values_match(self, extracted: Any, expected: Any, field: Optional[str] = None) -> bool:
+        norm_extracted = self._normalize_value(extracted, field)
+        norm_expected = self._normalize_value(expected, field)
+
         if not norm_expected:
             return not norm_extracted
-        
+
         if not norm_extracted:
             return False
-        
+
+        if field in self.AVERAGE_FIELDS and _NUMBER.match(norm_extracted) and _NUMBER.match(norm_expected):
+            return math.isclose(float(norm_extracted), float(norm_expected), rel_tol=AVERAGE_TOLERANCE)
+
         return norm_extracted == norm_expected
-    
-    def evaluate_single_document(self, doc_path: str, expected: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
-        file_path = Path(doc_path)
-        
-        if not file_path.exists():
-            raise FileNotFoundError(f"Document not found: {doc_path}")
-        
-        with open(file_path, 'rb') as f:
-            file_content = f.read()
-        
-        extracted_result = self.doc_processor.process_document(
-            file_content=file_content,
-            filename=file_path.name,
-            fields_to_extract=self.FIELDS
-        )
-        
-        extracted_data = extracted_result.get('extracted_data', {})
-        
+
+    def score_document(self, extracted: Dict[str, Any], expected: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
         results = {}
-        for field in self.FIELDS:
-            extracted_value = extracted_data.get(field)
+        for field, key in self.FIELDS.items():
+            extracted_value = extracted.get(key)
             expected_value = expected.get(field)
-            
-            match = self._values_match(extracted_value, expected_value)
-            has_expected = self._normalize_value(expected_value) != ""
-            has_extracted = self._normalize_value(extracted_value) != ""
-            
+
+            match = self._values_match(extracted_value, expected_value, field)
+            has_expected = self._normalize_value(expected_value, field) != ""
+            has_extracted = self._normalize_value(extracted_value, field) != ""
+
             if match:
                 if has_expected:
                     results[field] = {'TP': 1, 'FP': 0, 'FN': 0, 'TN': 0}
@@ -91,67 +146,184 @@ class ExtractionEvaluator:
                     results[field] = {'TP': 0, 'FP': 1, 'FN': 0, 'TN': 0}
                 else:
                     results[field] = {'TP': 0, 'FP': 0, 'FN': 0, 'TN': 1}
-        
+
         return results
-    
-    def evaluate_all(self, test_docs_dir: str) -> Dict[str, Any]:
+
+    def _document_paths(self, test_docs_dir: str, doc_info: Dict[str, Any]) -> List[str]:
+        # A shipment may span several files, e.g. a bill of lading and an invoice
+        filenames = doc_info.get('filenames') or [doc_info['filename']]
+        paths = [os.path.join(test_docs_dir, filename) for filename in filenames]
+        for path in paths:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Document not found: {path}")
+        return paths
+
+    async def extract_document(self, paths: List[str]) -> Dict[str, Any]:
+        """
+        Run the pipeline on one document's files; returns the extracted
+        fields with the time spent parsing and extracting, and the tokens used.
+        """
+        with track_token_usage() as tokens:
+            start = time.perf_counter()
+            document_data = await run_in_parsing_pool(process_documents, paths)
+            parsed = time.perf_counter()
+            result = await extract_field_from_document(document_data)
+            finished = time.perf_counter()
+
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        extracted = result.get(self.source)
+        if extracted is None and self.source == "vision_extraction" and "vision_policy" in result:
+            # The vision policy skipped the call, so the text result stands
+            extracted = result.get("text_extraction")
+        return {
+            'extracted': extracted or {},
+            'latency': {
+                'parse_seconds': round(parsed - start, 3),
+                'extract_seconds': round(finished - parsed, 3),
+                'total_seconds': round(finished - start, 3),
+            },
+            'tokens': {
+                'prompt': tokens.get("prompt", 0),
+                'completion': tokens.get("completion", 0),
+            },
+        }
+
+    def _load_checkpoint(self, path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+        if not path or not os.path.exists(path):
+            return {}
+        fingerprint = self.fingerprint()
+        done = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get('fingerprint') == fingerprint and entry.get('doc_id') in self.ground_truth:
+                    done[entry['doc_id']] = entry
+        return done
+
+    async def evaluate_all(self, test_docs_dir: str, workers: int = 4, checkpoint: Optional[str] = None,
+                           restart: bool = False) -> Dict[str, Any]:
+        if checkpoint and restart and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        completed = self._load_checkpoint(checkpoint)
+        if completed:
+            print(f"Resuming: {len(completed)}/{len(self.ground_truth)} documents already evaluated")
+
+        semaphore = asyncio.Semaphore(workers)
+        fingerprint = self.fingerprint()
+
+        async def evaluate(doc_id: str, doc_info: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                print(f"Evaluating: {doc_info.get('filename') or doc_info.get('filenames')}")
+                try:
+                    entry = await self.extract_document(self._document_paths(test_docs_dir, doc_info))
+                except Exception as e:
+                    print(f"Error evaluating {doc_id}: {e}")
+                    # Not checkpointed, so a rerun tries the document again
+                    return {'doc_id': doc_id, 'error': str(e)}
+
+            entry = {'fingerprint': fingerprint, 'doc_id': doc_id, **entry}
+            if checkpoint:
+                with open(checkpoint, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry) + "\n")
+            return entry
+
+        pending = [
+            evaluate(doc_id, doc_info) for doc_id, doc_info in self.ground_truth.items()
+            if doc_id not in completed
+        ]
+        entries = {entry['doc_id']: entry for entry in await asyncio.gather(*pending)}
+        entries.update(completed)
+
         field_metrics = defaultdict(lambda: {'TP': 0, 'FP': 0, 'FN': 0, 'TN': 0})
         document_results = {}
-        
         for doc_id, doc_info in self.ground_truth.items():
-            doc_path = os.path.join(test_docs_dir, doc_info['filename'])
-            expected_fields = doc_info['fields']
-            
-            print(f"Evaluating: {doc_info['filename']}")
-            
-            try:
-                doc_results = self.evaluate_single_document(doc_path, expected_fields)
-                document_results[doc_id] = {
-                    'filename': doc_info['filename'],
-                    'field_results': doc_results
-                }
-                
-                for field, metrics in doc_results.items():
-                    for metric_name, value in metrics.items():
-                        field_metrics[field][metric_name] += value
-                        
-            except Exception as e:
-                print(f"Error evaluating {doc_info['filename']}: {e}")
-                document_results[doc_id] = {
-                    'filename': doc_info['filename'],
-                    'error': str(e)
-                }
-        
+            entry = entries[doc_id]
+            filename = doc_info.get('filename') or doc_info.get('filenames')
+            if 'error' in entry:
+                document_results[doc_id] = {'filename': filename, 'error': entry['error']}
+                continue
+
+            # Scored from the stored values, so scoring changes apply to resumed documents too
+            doc_results = self.score_document(entry['extracted'], doc_info['fields'])
+            document_results[doc_id] = {
+                'filename': filename,
+                'field_results': doc_results,
+                'latency': entry['latency'],
+                'tokens': entry['tokens'],
+                'cost_usd': self._cost(entry['tokens']),
+            }
+            for field, metrics in doc_results.items():
+                for metric_name, value in metrics.items():
+                    field_metrics[field][metric_name] += value
+
         return self._calculate_metrics(field_metrics, document_results)
-    
+
+    def _cost(self, tokens: Dict[str, int]) -> float:
+        return round(
+            (tokens['prompt'] * self.prompt_price + tokens['completion'] * self.completion_price) / 1_000_000, 6,
+        )
+
+    def _performance_metrics(self, document_results: Dict) -> Dict[str, Any]:
+        scored = [result for result in document_results.values() if 'latency' in result]
+        if not scored:
+            return {'documents': 0, 'errors': len(document_results)}
+
+        totals = [result['latency']['total_seconds'] for result in scored]
+        prompt_tokens = sum(result['tokens']['prompt'] for result in scored)
+        completion_tokens = sum(result['tokens']['completion'] for result in scored)
+        cost = sum(result['cost_usd'] for result in scored)
+        return {
+            'documents': len(scored),
+            'errors': len(document_results) - len(scored),
+            'latency_p50_seconds': round(percentile(totals, 0.5), 3),
+            'latency_p95_seconds': round(percentile(totals, 0.95), 3),
+            'latency_mean_seconds': round(statistics.mean(totals), 3),
+            'parse_mean_seconds': round(statistics.mean(r['latency']['parse_seconds'] for r in scored), 3),
+            'extract_mean_seconds': round(statistics.mean(r['latency']['extract_seconds'] for r in scored), 3),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cost_usd': round(cost, 6),
+            'cost_per_document_usd': round(cost / len(scored), 6),
+        }
+
     def _calculate_metrics(self, field_metrics: Dict, document_results: Dict) -> Dict[str, Any]:
         results = {
+            'configuration': {
+                'model': settings.LLM_MODEL,
+                'backend': settings.LLM_BACKEND,
+                'source': self.source,
+                'fingerprint': self.fingerprint(),
+            },
             'per_field_metrics': {},
             'overall_metrics': {},
+            'performance_metrics': self._performance_metrics(document_results),
             'document_results': document_results
         }
-        
+
         overall_tp = 0
         overall_fp = 0
         overall_fn = 0
         overall_tn = 0
-        
+
         for field, metrics in field_metrics.items():
             tp = metrics['TP']
             fp = metrics['FP']
             fn = metrics['FN']
             tn = metrics['TN']
-            
+
             overall_tp += tp
             overall_fp += fp
             overall_fn += fn
             overall_tn += tn
-            
+
             precision = tp / (tp + fp) if (tp + fp) > 0 else 0.0
             recall = tp / (tp + fn) if (tp + fn) > 0 else 0.0
             f1 = 2 * (precision * recall) / (precision + recall) if (precision + recall) > 0 else 0.0
             accuracy = (tp + tn) / (tp + tn + fp + fn) if (tp + tn + fp + fn) > 0 else 0.0
-            
+
             results['per_field_metrics'][field] = {
                 'precision': round(precision, 4),
                 'recall': round(recall, 4),
@@ -162,12 +334,12 @@ class ExtractionEvaluator:
                 'false_negatives': fn,
                 'true_negatives': tn
             }
-        
+
         overall_precision = overall_tp / (overall_tp + overall_fp) if (overall_tp + overall_fp) > 0 else 0.0
         overall_recall = overall_tp / (overall_tp + overall_fn) if (overall_tp + overall_fn) > 0 else 0.0
         overall_f1 = 2 * (overall_precision * overall_recall) / (overall_precision + overall_recall) if (overall_precision + overall_recall) > 0 else 0.0
         overall_accuracy = (overall_tp + overall_tn) / (overall_tp + overall_tn + overall_fp + overall_fn) if (overall_tp + overall_tn + overall_fp + overall_fn) > 0 else 0.0
-        
+
         results['overall_metrics'] = {
             'precision': round(overall_precision, 4),
             'recall': round(overall_recall, 4),
@@ -175,14 +347,14 @@ class ExtractionEvaluator:
             'accuracy': round(overall_accuracy, 4),
             'total_fields_evaluated': overall_tp + overall_fp + overall_fn + overall_tn
         }
-        
+
         return results
-    
+
     def print_results(self, results: Dict[str, Any]):
         print("\n" + "="*80)
         print("EVALUATION RESULTS")
         print("="*80)
-        
+
         print("\nOVERALL METRICS:")
         print("-" * 80)
         overall = results['overall_metrics']
@@ -191,7 +363,19 @@ class ExtractionEvaluator:
         print(f"Recall:    {overall['recall']:.2%}")
         print(f"F1 Score:  {overall['f1']:.2%}")
         print(f"Total Fields Evaluated: {overall['total_fields_evaluated']}")
-        
+
+        print("\nPERFORMANCE:")
+        print("-" * 80)
+        performance = results['performance_metrics']
+        print(f"Documents: {performance['documents']}, errors: {performance['errors']}")
+        if performance['documents']:
+            print(f"Latency p50/p95: {performance['latency_p50_seconds']:.2f}s / "
+                  f"{performance['latency_p95_seconds']:.2f}s "
+                  f"(parse {performance['parse_mean_seconds']:.2f}s, "
+                  f"extract {performance['extract_mean_seconds']:.2f}s on average)")
+            print(f"Tokens: {performance['prompt_tokens']} prompt, {performance['completion_tokens']} completion")
+            print(f"Cost: ${performance['cost_usd']:.4f} (${performance['cost_per_document_usd']:.4f} per document)")
+
         print("\nPER-FIELD METRICS:")
         print("-" * 80)
         for field, metrics in results['per_field_metrics'].items():
@@ -202,38 +386,63 @@ class ExtractionEvaluator:
             print(f"  F1 Score:  {metrics['f1']:.2%}")
             print(f"  TP: {metrics['true_positives']}, FP: {metrics['false_positives']}, "
                   f"FN: {metrics['false_negatives']}, TN: {metrics['true_negatives']}")
-        
+
         print("\n" + "="*80)
 
 
+async def run(args) -> Dict[str, Any]:
+    if args.cache:
+        # Responses already in the cache are replayed; new requests go to the configured backend
+        set_llm_backend(RecordReplayBackend(args.cache, backend=get_llm_backend(), reuse=True))
+
+    evaluator = ExtractionEvaluator(args.ground_truth, source=args.source,
+                                    prompt_price=args.prompt_price, completion_price=args.completion_price)
+    try:
+        results = await evaluator.evaluate_all(
+            args.test_docs_dir, workers=args.workers, checkpoint=args.checkpoint, restart=args.restart,
+        )
+    finally:
+        await close_client()
+        shutdown_pools()
+
+    evaluator.print_results(results)
+    return results
+
+
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python run_evaluation.py <ground_truth.json> <test_docs_directory>")
-        print("\nExample: python run_evaluation.py ground_truth.json ../testDocs")
-        sys.exit(1)
-    
-    ground_truth_path = sys.argv[1]
-    test_docs_dir = sys.argv[2]
-    
-    if not os.path.exists(ground_truth_path):
-        print(f"Error: Ground truth file not found: {ground_truth_path}")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("ground_truth", help="Ground truth JSON, see ground_truth_example.json")
+    parser.add_argument("test_docs_dir", help="Directory holding the documents named in the ground truth")
+    parser.add_argument("--workers", type=int, default=4, help="Documents evaluated at the same time")
+    parser.add_argument("--source", choices=["text_extraction", "vision_extraction"], default="text_extraction",
+                        help="Which extraction result is scored")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="LLM response cache (JSON lines)")
+    parser.add_argument("--no-cache", dest="cache", action="store_const", const=None,
+                        help="Send every request to the model")
+    parser.add_argument("--checkpoint", default="evaluation_checkpoint.jsonl",
+                        help="Finished documents, read back to resume an interrupted run")
+    parser.add_argument("--restart", action="store_true", help="Ignore and replace the checkpoint")
+    parser.add_argument("--output", default="evaluation_results.json")
+    parser.add_argument("--prompt-price", type=float, default=DEFAULT_PROMPT_PRICE,
+                        help="USD per million prompt tokens")
+    parser.add_argument("--completion-price", type=float, default=DEFAULT_COMPLETION_PRICE,
+                        help="USD per million completion tokens")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.ground_truth):
+        print(f"Error: Ground truth file not found: {args.ground_truth}")
         sys.exit(1)
-    
-    if not os.path.isdir(test_docs_dir):
-        print(f"Error: Test documents directory not found: {test_docs_dir}")
+
+    if not os.path.isdir(args.test_docs_dir):
+        print(f"Error: Test documents directory not found: {args.test_docs_dir}")
         sys.exit(1)
-    
-    evaluator = ExtractionEvaluator(ground_truth_path)
-    results = evaluator.evaluate_all(test_docs_dir)
-    
-    evaluator.print_results(results)
-    
-    output_path = "evaluation_results.json"
-    with open(output_path, 'w') as f:
+
+    results = asyncio.run(run(args))
+
+    with open(args.output, 'w') as f:
         json.dump(results, f, indent=2)
-    print(f"\nDetailed results saved to: {output_path}")
+    print(f"\nDetailed results saved to: {args.output}")
 
 
 if __name__ == "__main__":
     main()
-
@@ -1,11 +1,44 @@
 import React, { useState } from 'react';
-import axios from 'axios';
 import { API_BASE_URL } from '../config';
 
+// Yields {event, data} for each server-sent event in a fetch response body
+async function* readEvents(response) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) return;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = 'message';
+      let data = '';
+      block.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      });
+      yield { event, data: JSON.parse(data) };
+    }
+  }
+}
+
+const STAGE_LABELS = {
+  upload_stored: () => 'Reading documents...',
+  ocr_page: (data) => `OCR page ${data.done} of ${data.pages}...`,
+  text_extracted: () => 'Extracting fields...',
+  text_extraction: () => 'Text fields ready, waiting for vision check...',
+};
+
 const FileUpload = ({ onUploadSuccess }) => {
   const [files, setFiles] = useState([]);
   const [uploading, setUploading] = useState(false);
   const [error, setError] = useState(null);
+  const [stage, setStage] = useState(null);
 
   const handleFileChange = (e) => {
     setFiles(Array.from(e.target.files));
@@ -23,17 +56,29 @@ const FileUpload = ({ onUploadSuccess }) => {
     });
 
     try {
-      const response = await axios.post(`${API_BASE_URL}/process-documents`, formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
+      // Streams progress so text-based fields show up before the vision check finishes
+      const response = await fetch(`${API_BASE_URL}/process-documents/stream`, {
+        method: 'POST',
+        body: formData,
       });
-      onUploadSuccess(response.data.extracted_data, files);
+      if (!response.ok) throw new Error(`Upload failed with status ${response.status}`);
+
+      for await (const { event, data } of readEvents(response)) {
+        if (STAGE_LABELS[event]) setStage(STAGE_LABELS[event](data));
+        if (event === 'text_extraction' && !data.error) {
+          onUploadSuccess({ text_extraction: data }, files);
+        } else if (event === 'result') {
+          onUploadSuccess(data.extracted_data, files);
+        } else if (event === 'error') {
+          throw new Error(data.error);
+        }
+      }
     } catch (err) {
       setError('Failed to upload files. Please try again.');
       console.error(err);
     } finally {
       setUploading(false);
+      setStage(null);
     }
   };
 
@@ -53,6 +98,7 @@ const FileUpload = ({ onUploadSuccess }) => {
       >
         {uploading ? 'Processing...' : 'Upload & Extract'}
       </button>
+      {stage && <p className="text-gray-600 mt-2">{stage}</p>}
       {error && <p className="text-red-500 mt-2">{error}</p>}
     </div>
   );
@@ -66,6 +66,67 @@ def create_sample_xlsx():
     
     print(f"Created sample XLSX: {output_path}")
 
+def create_text_pdf(output_path, pages, lines_per_page=45):
+    """Create a multi-page text Bill of Lading PDF: the header fields on page 1, then pages of terms"""
+    c = canvas.Canvas(output_path, pagesize=letter)
+    width, height = letter
+
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(100, height - 100, "BILL OF LADING")
+    c.setFont("Helvetica", 12)
+    y_position = height - 150
+    for label, value in [
+        ("Bill of Lading Number:", "COSU534343282"),
+        ("Container Number:", "CSQU3054383"),
+        ("Consignee Name:", "ABC Trading Company"),
+        ("Consignee Address:", "123 Main Street, New York, NY 10001"),
+        ("Date of Export:", "2024-11-15"),
+        ("Date:", "2024-11-22"),
+    ]:
+        c.drawString(100, y_position, f"{label} {value}")
+        y_position -= 30
+
+    for page in range(1, pages):
+        c.showPage()
+        c.setFont("Helvetica", 9)
+        for line in range(lines_per_page):
+            c.drawString(60, height - 60 - line * 15,
+                         f"{page}.{line + 1} The Carrier shall not be liable for loss of or damage to the goods "
+                         f"unless notified in writing within three days.")
+    c.save()
+
+def create_scanned_pdf(output_path, pages):
+    """Create an image-only PDF, as a scanner would produce, that needs OCR"""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for page in range(pages):
+        image = Image.new("L", (1275, 1650), 255)
+        draw = ImageDraw.Draw(image)
+        for line in range(60):
+            draw.text((80, 80 + line * 25), f"Page {page + 1} line {line + 1} BILL OF LADING COSU534343282", fill=0)
+        images.append(image)
+    images[0].save(output_path, save_all=True, append_images=images[1:], resolution=150)
+
+def create_wide_workbook(output_path, rows, columns):
+    """Create a packing list with rows line items and columns columns"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Packing List")
+    sheet.append(["Packing List"])
+    sheet.append(["B/L NO.:", "COSU534343282", None, None, "CNTR NO", "CSQU3054383"])
+    sheet.append([])
+    extra = [f"Attribute {i}" for i in range(max(columns - 6, 0))]
+    sheet.append(["S.No.", "Description", "Qty (Pcs)", "Unit Price (USD)", "Total Value (USD)",
+                  "Gross Weight (KG)"] + extra)
+    for i in range(1, rows + 1):
+        qty = 100 + i % 900
+        price = round(0.25 + (i % 37) * 0.11, 2)
+        sheet.append([i, f"Item {i % 250}", qty, price, round(qty * price, 2), round(qty * 0.013, 2)]
+                     + [f"v{i % 97}-{j}" for j in range(len(extra))])
+    workbook.save(output_path)
+
 if __name__ == "__main__":
     create_sample_pdf()
     create_sample_xlsx()
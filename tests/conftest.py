@@ -1,6 +1,12 @@
+import os
 import sys
 from pathlib import Path
 
 # Add the project root directory to Python path
 project_root = Path(__file__).parent.parent
-sys.path.insert(0, str(project_root)) 
\ No newline at end of file
+sys.path.insert(0, str(project_root))
+
+# Keep cached results from leaking between tests; cache tests opt back in
+os.environ.setdefault("CACHE_ENABLED", "false")
+# Parse in the calling thread so tests can patch the parsers; the concurrency test opts back in
+os.environ.setdefault("PARSING_PROCESSES", "0")
@@ -1,8 +1,10 @@
+import asyncio
 import pytest
 import os
 import sys
 import io
-from unittest.mock import Mock, patch, MagicMock
+import json
+from unittest.mock import AsyncMock, Mock, patch, MagicMock
 from fastapi.testclient import TestClient
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -169,18 +171,263 @@ class TestProcessDocumentsEndpoint:
         assert "extracted_data" in response.json()
 
 
+class TestBatchEndpoint:
+
+    @patch('app.api.routes.extract_field_from_document')
+    @patch('app.api.routes.process_documents')
+    def test_batch_groups_files_by_shipment(self, mock_process, mock_extract):
+        def process(paths, progress=None):
+            return {"pdf_text": " ".join(sorted(os.path.splitext(path)[1] for path in paths))}
+
+        async def extract(document_data, progress=None):
+            return {"text_extraction": {"bill_of_lading_number": document_data["pdf_text"]}}
+
+        mock_process.side_effect = process
+        mock_extract.side_effect = extract
+        files = [
+            ("files", ("bl1.pdf", io.BytesIO(b"%PDF-1.4 one"), "application/pdf")),
+            ("files", ("bl2.pdf", io.BytesIO(b"%PDF-1.4 two"), "application/pdf")),
+            ("files", ("inv1.xlsx", io.BytesIO(b"PK\x03\x04 one"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")),
+        ]
+        data = {"shipment_ids": ["s1", "s2", "s1"]}
+
+        response = client.post("/process-documents/batch", files=files, data=data)
+
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [result["shipment_id"] for result in results] == ["s1", "s2"]
+        assert results[0]["extracted_data"]["text_extraction"]["bill_of_lading_number"] == ".pdf .xlsx"
+        assert results[1]["extracted_data"]["text_extraction"]["bill_of_lading_number"] == ".pdf"
+
+    @patch('app.api.routes.extract_field_from_document')
+    @patch('app.api.routes.process_documents')
+    def test_batch_reports_per_shipment_errors(self, mock_process, mock_extract):
+        def process(paths, progress=None):
+            if len(paths) == 2:
+                raise Exception("Corrupt PDF")
+            return {"pdf_text": "Sample"}
+
+        mock_process.side_effect = process
+        mock_extract.return_value = {"text_extraction": {}}
+        files = [
+            ("files", ("a.pdf", io.BytesIO(b"%PDF-1.4 a"), "application/pdf")),
+            ("files", ("b.pdf", io.BytesIO(b"%PDF-1.4 b"), "application/pdf")),
+            ("files", ("c.pdf", io.BytesIO(b"%PDF-1.4 c"), "application/pdf")),
+        ]
+
+        response = client.post("/process-documents/batch", files=files, data={"shipment_ids": ["bad", "bad", "good"]})
+
+        assert response.status_code == 200
+        bad, good = response.json()["results"]
+        assert bad == {"shipment_id": "bad", "error": "Corrupt PDF"}
+        assert good["extracted_data"] == {"text_extraction": {}}
+
+    @patch('app.api.routes.extract_field_from_document')
+    @patch('app.api.routes.process_documents')
+    def test_batch_shipments_run_concurrently(self, mock_process, mock_extract):
+        import asyncio
+        import time
+
+        async def slow_extract(document_data, progress=None):
+            await asyncio.sleep(0.3)
+            return {"text_extraction": {}}
+
+        mock_process.return_value = {"pdf_text": "Sample"}
+        mock_extract.side_effect = slow_extract
+        files = [("files", (f"{i}.pdf", io.BytesIO(f"%PDF-1.4 {i}".encode()), "application/pdf")) for i in range(4)]
+
+        start = time.perf_counter()
+        response = client.post("/process-documents/batch", files=files, data={"shipment_ids": ["a", "b", "c", "d"]})
+        elapsed = time.perf_counter() - start
+
+        assert response.status_code == 200
+        assert len(response.json()["results"]) == 4
+        assert elapsed < 0.9
+
+    def test_batch_requires_one_shipment_id_per_file(self):
+        files = [
+            ("files", ("a.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")),
+            ("files", ("b.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")),
+        ]
+        response = client.post("/process-documents/batch", files=files, data={"shipment_ids": ["only-one"]})
+        assert response.status_code == 422
+
+
+def _parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestStreamingEndpoint:
+
+    @patch('app.api.routes.extract_field_from_document')
+    @patch('app.api.routes.process_documents')
+    def test_stream_reports_stages_in_order(self, mock_process, mock_extract):
+        def process(paths, progress=None):
+            progress("ocr_page", {"page": 1, "done": 1, "pages": 1})
+            progress("text_extracted", {"file": 0, "type": "pdf", "length": 6})
+            return {"pdf_text": "Sample", "pdf_images": ["aW1n"]}
+
+        async def extract(document_data, progress=None):
+            text_data = {"bill_of_lading_number": "BL123"}
+            progress("text_extraction", text_data)
+            vision_data = {"bill_of_lading_number": "BL123"}
+            progress("vision_extraction", vision_data)
+            return {"text_extraction": text_data, "vision_extraction": vision_data}
+
+        mock_process.side_effect = process
+        mock_extract.side_effect = extract
+        files = [("files", ("test.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf"))]
+
+        response = client.post("/process-documents/stream", files=files)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = _parse_sse(response.text)
+        assert [event for event, _ in events] == [
+            "upload_stored", "ocr_page", "text_extracted", "text_extraction", "vision_extraction", "result",
+        ]
+        assert events[0][1] == {"files": 1, "bytes": 8}
+        assert events[3][1] == {"bill_of_lading_number": "BL123"}
+        assert events[-1][1]["extracted_data"]["vision_extraction"] == {"bill_of_lading_number": "BL123"}
+
+    @patch('app.api.routes.process_documents')
+    def test_stream_reports_errors_and_removes_files(self, mock_process):
+        seen_paths = []
+
+        def fail(paths, progress=None):
+            seen_paths.extend(paths)
+            raise Exception("Corrupt PDF")
+
+        mock_process.side_effect = fail
+        files = [("files", ("test.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf"))]
+
+        response = client.post("/process-documents/stream", files=files)
+
+        events = _parse_sse(response.text)
+        assert events[-1] == ("error", {"error": "Corrupt PDF"})
+        assert not any(os.path.exists(path) for path in seen_paths)
+
+    @patch('app.api.routes.process_documents')
+    def test_files_are_removed_when_the_client_leaves_before_the_stream_starts(self, mock_process):
+        from starlette.datastructures import UploadFile
+        from app.api.routes import process_documents_stream_endpoint
+
+        async def disconnected(message):
+            raise OSError("client went away")
+
+        async def run():
+            upload = UploadFile(io.BytesIO(b"%PDF-1.4"), filename="test.pdf")
+            response = await process_documents_stream_endpoint(files=[upload])
+            paths = list(response.temp_file_paths)
+            assert all(os.path.exists(path) for path in paths)
+            with pytest.raises(Exception):
+                await response({"type": "http", "asgi": {"spec_version": "2.4"}}, AsyncMock(), disconnected)
+            return paths
+
+        paths = asyncio.run(run())
+
+        assert paths and not any(os.path.exists(path) for path in paths)
+        mock_process.assert_not_called()
+
+
+class TestUploadLimits:
+
+    @patch('app.api.routes.extract_field_from_document')
+    @patch('app.api.routes.process_documents')
+    def test_file_over_per_file_limit_is_rejected(self, mock_process, mock_extract):
+        files = [("files", ("big.pdf", io.BytesIO(b"x" * 2048), "application/pdf"))]
+
+        with patch('app.utils.upload_utils.settings.MAX_UPLOAD_FILE_BYTES', 1024), \
+                patch('app.utils.upload_utils.settings.UPLOAD_CHUNK_BYTES', 256):
+            response = client.post("/process-documents", files=files)
+
+        assert response.status_code == 413
+        assert "per file" in response.json()["detail"]
+        mock_process.assert_not_called()
+
+    @patch('app.api.routes.extract_field_from_document')
+    @patch('app.api.routes.process_documents')
+    def test_files_over_per_request_limit_are_rejected(self, mock_process, mock_extract):
+        files = [
+            ("files", ("a.pdf", io.BytesIO(b"x" * 800), "application/pdf")),
+            ("files", ("b.pdf", io.BytesIO(b"x" * 800), "application/pdf")),
+        ]
+
+        with patch('app.utils.upload_utils.settings.MAX_UPLOAD_REQUEST_BYTES', 1024), \
+                patch('app.utils.upload_utils.settings.UPLOAD_CHUNK_BYTES', 256):
+            response = client.post("/process-documents", files=files)
+
+        assert response.status_code == 413
+        assert "per request" in response.json()["detail"]
+        mock_process.assert_not_called()
+
+    def test_oversized_content_length_is_rejected_early(self):
+        with patch('app.main.settings.MAX_UPLOAD_REQUEST_BYTES', 0), \
+                patch('app.main.MULTIPART_OVERHEAD_BYTES', 16):
+            files = [("files", ("a.pdf", io.BytesIO(b"x" * 1024), "application/pdf"))]
+            response = client.post("/process-documents", files=files)
+
+        assert response.status_code == 413
+
+    @patch('app.api.routes.process_documents')
+    def test_chunked_upload_without_content_length_is_cut_off(self, mock_process):
+        def body():
+            yield b'--xyz\r\nContent-Disposition: form-data; name="files"; filename="a.pdf"\r\n'
+            yield b'Content-Type: application/pdf\r\n\r\n'
+            for _ in range(64):
+                yield b"x" * 1024
+            yield b"\r\n--xyz--\r\n"
+
+        with patch('app.main.settings.MAX_UPLOAD_REQUEST_BYTES', 4096), \
+                patch('app.main.MULTIPART_OVERHEAD_BYTES', 1024), \
+                patch('app.utils.upload_utils.copy_upload') as mock_copy:
+            response = client.post("/process-documents", content=body(),
+                                   headers={"Content-Type": "multipart/form-data; boundary=xyz"})
+
+        assert response.status_code == 413
+        assert "per request" in response.json()["detail"]
+        # Cut off while the body was received, before it was spooled and copied
+        mock_copy.assert_not_called()
+        mock_process.assert_not_called()
+
+    @patch('app.api.routes.process_documents')
+    def test_temp_files_removed_when_processing_fails(self, mock_process):
+        seen_paths = []
+
+        def fail(paths, progress=None):
+            seen_paths.extend(paths)
+            assert all(os.path.exists(path) for path in paths)
+            raise Exception("Processing failed")
+
+        mock_process.side_effect = fail
+        files = [
+            ("files", ("a.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf")),
+            ("files", ("b.xlsx", io.BytesIO(b"PK\x03\x04"), "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")),
+        ]
+
+        with pytest.raises(Exception):
+            client.post("/process-documents", files=files)
+
+        assert len(seen_paths) == 2
+        assert not any(os.path.exists(path) for path in seen_paths)
+
+
 class TestHealthCheckEndpoint:
     
-    @patch('openai.OpenAI')
-    def test_health_check_openai_success(self, mock_openai):
+    @patch('app.services.llm_gateway.get_client')
+    def test_health_check_openai_success(self, mock_get_client):
         mock_client = Mock()
         mock_response = Mock()
         mock_parsed = Mock()
         mock_parsed.status = "OK"
         mock_parsed.message = "API is working"
         mock_response.output_parsed = mock_parsed
-        mock_client.responses.parse.return_value = mock_response
-        mock_openai.return_value = mock_client
+        mock_client.responses.parse = AsyncMock(return_value=mock_response)
+        mock_get_client.return_value = mock_client
         
         response = client.get("/health-check/openai")
         
@@ -192,9 +439,24 @@ class TestHealthCheckEndpoint:
         assert "response" in data
         assert data["response"]["status"] == "OK"
     
-    @patch('openai.OpenAI')
-    def test_health_check_openai_api_error(self, mock_openai):
-        mock_openai.side_effect = Exception("API connection failed")
+    @patch('app.services.llm_gateway.get_client')
+    def test_health_check_reuses_the_shared_client(self, mock_get_client):
+        mock_client = Mock()
+        mock_response = Mock()
+        mock_response.output_parsed.status = "OK"
+        mock_response.output_parsed.message = "API is working"
+        mock_client.responses.parse = AsyncMock(return_value=mock_response)
+        mock_get_client.return_value = mock_client
+
+        client.get("/health-check/openai")
+        client.get("/health-check/openai")
+
+        assert mock_client.responses.parse.await_count == 2
+        assert mock_client.responses.parse.await_args.kwargs["model"] == "gpt-5-mini"
+
+    @patch('app.services.llm_gateway.get_client')
+    def test_health_check_openai_api_error(self, mock_get_client):
+        mock_get_client.side_effect = Exception("API connection failed")
         
         response = client.get("/health-check/openai")
         
@@ -204,9 +466,9 @@ class TestHealthCheckEndpoint:
         assert data["detail"]["status"] == "error"
         assert "Failed to connect to OpenAI API" in data["detail"]["message"]
     
-    @patch('openai.OpenAI')
-    def test_health_check_openai_auth_error(self, mock_openai):
-        mock_openai.side_effect = Exception("Invalid API key")
+    @patch('app.services.llm_gateway.get_client')
+    def test_health_check_openai_auth_error(self, mock_get_client):
+        mock_get_client.return_value.responses.parse = AsyncMock(side_effect=Exception("Invalid API key"))
         
         response = client.get("/health-check/openai")
         
@@ -215,9 +477,9 @@ class TestHealthCheckEndpoint:
         assert "detail" in data
         assert data["detail"]["status"] == "error"
     
-    @patch('openai.OpenAI')
-    def test_health_check_openai_timeout(self, mock_openai):
-        mock_openai.side_effect = TimeoutError("Request timeout")
+    @patch('app.services.llm_gateway.get_client')
+    def test_health_check_openai_timeout(self, mock_get_client):
+        mock_get_client.return_value.responses.parse = AsyncMock(side_effect=TimeoutError("Request timeout"))
         
         response = client.get("/health-check/openai")
         
@@ -283,7 +545,7 @@ class TestDocumentProcessor:
         assert isinstance(result, dict)
         assert len(result) == 0
     
-    @patch('app.services.document_processor.extract_text_from_pdf')
+    @patch('app.services.document_processor.extract_pages_from_pdf')
     def test_process_documents_pdf_extraction_error(self, mock_extract):
         mock_extract.side_effect = Exception("PDF extraction failed")
         
@@ -0,0 +1,128 @@
+import io
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services.cache import SQLiteCacheBackend, build_cache_key
+
+client = TestClient(app)
+
+
+def _backend(tmp_path, max_bytes=1024 * 1024, ttl_seconds=3600):
+    return SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+
+
+class TestSQLiteCacheBackend:
+
+    def test_round_trip(self, tmp_path):
+        cache = _backend(tmp_path)
+        cache.set("key", {"text_extraction": {"bill_of_lading_number": "BL123"}})
+        assert cache.get("key") == {"text_extraction": {"bill_of_lading_number": "BL123"}}
+        assert cache.get("missing") is None
+
+    def test_expired_entries_are_dropped(self, tmp_path):
+        cache = _backend(tmp_path, ttl_seconds=60)
+        cache.set("key", {"value": 1})
+        with patch("app.services.cache.time.time", return_value=time.time() + 120):
+            assert cache.get("key") is None
+
+    def test_least_recently_used_evicted_over_size_limit(self, tmp_path):
+        cache = _backend(tmp_path, max_bytes=250)
+        cache.set("a", {"value": "a" * 100})
+        cache.set("b", {"value": "b" * 100})
+        cache.get("a")
+        cache.set("c", {"value": "c" * 100})
+
+        assert cache.get("a") is not None
+        assert cache.get("b") is None
+        assert cache.get("c") is not None
+
+    def test_purge(self, tmp_path):
+        cache = _backend(tmp_path)
+        cache.set("a", {"value": 1})
+        cache.set("b", {"value": 2})
+        assert cache.purge() == 2
+        assert cache.get("a") is None
+
+
+class TestCacheKey:
+
+    def test_key_depends_on_content_and_prompt(self):
+        key = build_cache_key([(".pdf", "aaaa")])
+        assert key == build_cache_key([(".PDF", "aaaa")])
+        assert key != build_cache_key([(".pdf", "bbbb")])
+        assert key != build_cache_key([(".xlsx", "aaaa")])
+
+        with patch("app.services.cache.extraction_fingerprint", return_value="other-prompt"):
+            assert key != build_cache_key([(".pdf", "aaaa")])
+
+    @pytest.mark.parametrize("name, value", [
+        ("VISION_MAX_LONG_EDGE", 1024),
+        ("VISION_IMAGE_FORMAT", "JPEG"),
+        ("XLSX_MAX_ROWS_PER_SHEET", 10),
+        ("PROMPT_CHUNK_TOKENS", 50),
+        ("OCR_DPI", 300),
+    ])
+    def test_key_changes_with_extraction_settings(self, name, value):
+        key = build_cache_key([(".pdf", "aaaa")])
+        with patch.object(settings, name, value):
+            assert key != build_cache_key([(".pdf", "aaaa")])
+
+
+class TestCachedEndpoint:
+
+    @patch('app.api.routes.extract_field_from_document')
+    @patch('app.api.routes.process_documents')
+    def test_second_upload_is_served_from_cache(self, mock_process, mock_extract, tmp_path):
+        mock_process.return_value = {"pdf_text": "Sample PDF content"}
+        mock_extract.return_value = {"text_extraction": {"bill_of_lading_number": "BL123"}}
+        files = lambda: [("files", ("bl.pdf", io.BytesIO(b"%PDF-1.4 cached"), "application/pdf"))]
+
+        with patch('app.api.routes.get_cache', return_value=_backend(tmp_path)):
+            first = client.post("/process-documents", files=files())
+            second = client.post("/process-documents", files=files())
+            purge = client.delete("/cache")
+            third = client.post("/process-documents", files=files())
+
+        assert first.json()["cache"] == "miss"
+        assert second.json()["cache"] == "hit"
+        assert second.json()["extracted_data"] == first.json()["extracted_data"]
+        assert purge.json()["purged"] == 1
+        assert third.json()["cache"] == "miss"
+        assert mock_process.call_count == 2
+
+    @patch('app.api.routes.extract_field_from_document')
+    @patch('app.api.routes.process_documents')
+    def test_errors_are_not_cached(self, mock_process, mock_extract, tmp_path):
+        mock_process.return_value = {"pdf_text": "Sample"}
+        mock_extract.return_value = {"error": "Extraction failed"}
+        files = lambda: [("files", ("bl.pdf", io.BytesIO(b"%PDF-1.4 failing"), "application/pdf"))]
+
+        with patch('app.api.routes.get_cache', return_value=_backend(tmp_path)):
+            client.post("/process-documents", files=files())
+            second = client.post("/process-documents", files=files())
+
+        assert second.json()["cache"] == "miss"
+        assert mock_extract.call_count == 2
+
+    @patch('app.api.routes.extract_field_from_document')
+    @patch('app.api.routes.process_documents')
+    def test_partial_failures_are_not_cached(self, mock_process, mock_extract, tmp_path):
+        mock_process.return_value = {"pdf_text": "Sample"}
+        mock_extract.return_value = {
+            "text_extraction": {"bill_of_lading_number": "BL123"},
+            "vision_extraction": {"error": "Vision extraction timed out after 60s", "retryable": True},
+        }
+        files = lambda: [("files", ("bl.pdf", io.BytesIO(b"%PDF-1.4 partial"), "application/pdf"))]
+
+        with patch('app.api.routes.get_cache', return_value=_backend(tmp_path)):
+            first = client.post("/process-documents", files=files())
+            second = client.post("/process-documents", files=files())
+
+        assert first.json()["extracted_data"]["text_extraction"] == {"bill_of_lading_number": "BL123"}
+        assert second.json()["cache"] == "miss"
+        assert mock_extract.call_count == 2
@@ -0,0 +1,109 @@
+import gc
+import io
+import os
+import time
+import threading
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+from openpyxl import Workbook
+
+from app.core import concurrency
+from app.core.config import settings
+from app.main import app
+from app.services import document_processor
+
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+LINE_ITEMS = 20000
+# Uploads parsed at once. Parses beyond the spare cores would compete with the
+# server for CPU, and the probes would measure the OS scheduler instead of the GIL.
+UPLOADS = max(1, (os.cpu_count() or 1) - 1)
+
+
+def _p99(samples):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+
+
+def _measure_root_latency(client, count=200):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = client.get("/")
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200
+    return samples
+
+
+@pytest.fixture(scope="module")
+def large_invoice():
+    # Parsing and summarizing this takes openpyxl about a second of pure Python
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["Item", "Description", "Quantity", "Unit Price", "Total"])
+    for i in range(LINE_ITEMS):
+        sheet.append([f"SKU-{i}", f"Widget {i}", i % 7 + 1, 4.25, (i % 7 + 1) * 4.25])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    del workbook, sheet
+    # Collected now rather than during the measurements
+    gc.collect()
+    return buffer.getvalue()
+
+
+class TestEventLoopResponsiveness:
+
+    @patch('app.api.routes.extract_field_from_document')
+    def test_root_latency_stays_flat_during_heavy_uploads(self, mock_extract, large_invoice):
+        mock_extract.return_value = {"text_extraction": {}}
+
+        parsing = threading.Semaphore(0)
+
+        def run_in_parsing_process(func, *args):
+            parsing.release()
+            return concurrency.run_in_parsing_process(func, *args)
+
+        # A single TestClient context shares one event loop across threads,
+        # like a single uvicorn worker does.
+        # The niceness only matters without a spare core, where the server waits out the parse's time slices
+        with patch.multiple(settings, PARSING_PROCESSES=UPLOADS, PARSING_PROCESS_NICENESS=19), \
+                patch.object(concurrency, "_parsing_process_executor", None), \
+                patch.object(document_processor, "run_in_parsing_process", side_effect=run_in_parsing_process), \
+                TestClient(app) as client:
+
+            def upload():
+                files = [("files", ("invoice.xlsx", io.BytesIO(large_invoice), XLSX_TYPE))]
+                response = client.post("/process-documents", files=files)
+                assert response.status_code == 200
+
+            def start_uploads():
+                uploads = [threading.Thread(target=upload) for _ in range(UPLOADS)]
+                for thread in uploads:
+                    thread.start()
+                return uploads
+
+            # The first uploads start the parsing processes
+            for thread in start_uploads():
+                thread.join()
+                parsing.acquire()
+            baseline = _measure_root_latency(client)
+
+            # Measured once every workbook is being parsed, not while the uploads are received
+            uploads = start_uploads()
+            for _ in uploads:
+                assert parsing.acquire(timeout=10)
+
+            under_load = _measure_root_latency(client)
+            still_parsing = any(thread.is_alive() for thread in uploads)
+
+            for thread in uploads:
+                thread.join()
+            concurrency.shutdown_pools()
+
+        assert mock_extract.call_count == 2 * UPLOADS
+        for call in mock_extract.call_args_list:
+            assert call.args[0]["line_item_aggregates"]["line_items_count"] == LINE_ITEMS
+        assert still_parsing
+        # With PARSING_PROCESSES at 0 the parses hold the GIL and probes take about 5x as long
+        assert _p99(under_load) < 3 * _p99(baseline)
@@ -1,6 +1,13 @@
-import pytest
-from app.services.document_processor import process_documents
+import shutil
+import time
 from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from app.core import concurrency
+from app.core.config import settings
+from app.services.document_processor import encode_pdf_images, merge_file_results, process_documents
 
 # TODO: Incomplete tests
 def test_process_documents():
@@ -12,3 +19,100 @@ def test_process_documents():
     result = process_documents(sample_files)
     
     # Missing assertions
+
+
+SAMPLE_PDF = "tests/sample_bill_of_lading.pdf"
+SAMPLE_XLSX = "tests/sample_invoice.xlsx"
+
+
+class TestPerFileResults:
+
+    def test_each_file_gets_a_result(self):
+        result = process_documents([SAMPLE_PDF, SAMPLE_XLSX])
+
+        pdf, xlsx = result["files"]
+        assert (pdf["file"], pdf["name"], pdf["type"]) == (0, "sample_bill_of_lading.pdf", "pdf")
+        assert len(pdf["pages"]) == pdf["page_count"] == 1
+        assert "BOL-2024-001234" in pdf["pages"][0]
+        assert pdf["rendered_pages"].file_path == SAMPLE_PDF
+        assert (xlsx["file"], xlsx["type"]) == (1, "xlsx")
+        assert xlsx["text"] in result["xlsx_text"]
+        assert all(f["seconds"] >= 0 for f in result["files"])
+
+    def test_vision_pages_are_not_encoded_while_processing(self):
+        with patch("app.services.document_processor.encode_vision_pages") as encode:
+            result = process_documents([SAMPLE_PDF])
+
+        encode.assert_not_called()
+        assert "pdf_images" not in result
+
+    def test_encoded_pages_are_added_to_the_pdf_results(self):
+        files = process_documents([SAMPLE_PDF, SAMPLE_XLSX])["files"]
+
+        with patch("app.services.document_processor.encode_vision_pages", return_value=[[(0, "aW1n")]]) as encode:
+            encode_pdf_images(files)
+            encode_pdf_images(files)
+
+        pdf, xlsx = files
+        assert (pdf["images"], pdf["image_pages"]) == (["aW1n"], [1])
+        assert "rendered_pages" not in pdf and "images" not in xlsx
+        encode.assert_called_once()
+
+    def test_images_of_every_pdf_are_kept(self, tmp_path):
+        second = tmp_path / "second.pdf"
+        shutil.copy(SAMPLE_PDF, second)
+
+        files = process_documents([SAMPLE_PDF, str(second)])["files"]
+        with patch("app.services.document_processor.encode_vision_pages",
+                   return_value=[[(0, "b25l")], [(0, "dHdv")]]):
+            encode_pdf_images(files)
+        result = merge_file_results(files)
+
+        assert sorted(result["pdf_images"]) == ["b25l", "dHdv"]
+        assert result["pdf_page_count"] == 2
+        assert result["pdf_text"].count("BOL-2024-001234") == 2
+
+    def test_pages_of_pdfs_without_images_are_counted(self, tmp_path):
+        second = tmp_path / "second.pdf"
+        shutil.copy(SAMPLE_PDF, second)
+
+        files = process_documents([SAMPLE_PDF, str(second)])["files"]
+        with patch("app.services.document_processor.encode_vision_pages", return_value=[[(0, "b25l")], []]):
+            encode_pdf_images(files)
+        result = merge_file_results(files)
+
+        assert result["pdf_images"] == ["b25l"]
+        assert result["pdf_page_count"] == 2
+
+    def test_files_are_processed_in_parallel(self, tmp_path):
+        paths = []
+        for i in range(3):
+            paths.append(str(tmp_path / f"doc{i}.pdf"))
+            shutil.copy(SAMPLE_PDF, paths[-1])
+
+        def slow_pages(file_path, pages, progress=None):
+            time.sleep(0.2)
+            return ["Consignee: ACME " * 5]
+
+        with patch("app.services.document_processor.extract_pages_from_pdf", side_effect=slow_pages), \
+                patch.object(settings, "PARSING_POOL_WORKERS", 4), \
+                patch.object(concurrency, "_parsing_executor", None):
+            start = time.perf_counter()
+            result = process_documents(paths)
+            elapsed = time.perf_counter() - start
+            concurrency.shutdown_pools()
+
+        assert [f["file"] for f in result["files"]] == [0, 1, 2]
+        assert elapsed < 0.5
+
+
+class TestMapInParsingPool:
+
+    def test_runs_from_a_busy_pool_without_deadlock(self):
+        with patch.object(settings, "PARSING_POOL_WORKERS", 1), \
+                patch.object(concurrency, "_parsing_executor", None):
+            outer = concurrency.get_parsing_executor().submit(
+                concurrency.map_in_parsing_pool, lambda x: x * 2, [(1,), (2,), (3,)]
+            )
+            assert outer.result(timeout=5) == [2, 4, 6]
+            concurrency.shutdown_pools()
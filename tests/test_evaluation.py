@@ -0,0 +1,188 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from app.services.llm_backends import LLMBackend, RecordReplayBackend, set_llm_backend
+from app.services.llm_gateway import add_token_usage
+from eval.run_evaluation import ExtractionEvaluator
+
+GROUND_TRUTH = {
+    "bol": {
+        "filename": "sample_bill_of_lading.pdf",
+        "fields": {
+            "Bill of lading number": "BOL-2024-001234",
+            "Container Number": "ABCD1234567",
+            "Consignee Name": "ABC Trading Company",
+            "Consignee Address": "123 Main Street, New York, NY 10001",
+            "Date of export": "2024-11-15",
+            "Date": "2024-11-22",
+            "Line Items Count": "",
+            "Average Gross Weight": "",
+            "Average Price": "",
+        },
+    },
+    "invoice": {
+        "filename": "sample_invoice.xlsx",
+        "fields": {
+            "Bill of lading number": "",
+            "Container Number": "",
+            "Consignee Name": "XYZ Corporation",
+            "Consignee Address": "",
+            "Date of export": "",
+            "Date": "",
+            "Line Items Count": "5",
+            "Average Gross Weight": "65",
+            "Average Price": "27.30",
+        },
+    },
+}
+
+# What the model answers for every request
+MODEL_ANSWER = {
+    "bill_of_lading_number": "BOL-2024-001234",
+    "container_number": "ABCD1234567",
+    "consignee_name": "ABC Trading Company",
+    "consignee_address": "123 Main Street, New York, NY 10001",
+    "date_of_export": "2024-11-15",
+    "date": "2024-11-22",
+    "line_items_count": None,
+    "average_gross_weight": None,
+    "average_price": None,
+}
+PROMPT_TOKENS = 1000
+COMPLETION_TOKENS = 100
+
+
+class FakeModel(LLMBackend):
+
+    async def complete(self, model, messages, response_format):
+        add_token_usage({"prompt": PROMPT_TOKENS, "completion": COMPLETION_TOKENS})
+        return json.dumps(MODEL_ANSWER)
+
+
+@pytest.fixture
+def ground_truth(tmp_path):
+    path = tmp_path / "ground_truth.json"
+    path.write_text(json.dumps(GROUND_TRUTH))
+    return str(path)
+
+
+@pytest.fixture
+def evaluator(ground_truth):
+    return ExtractionEvaluator(ground_truth, prompt_price=0.5, completion_price=4.0)
+
+
+@pytest.fixture
+def replay(tmp_path, evaluator):
+    # Record the fake model's answers once, then replay them without any model
+    recordings = str(tmp_path / "recordings.jsonl")
+    set_llm_backend(RecordReplayBackend(recordings, backend=FakeModel()))
+    try:
+        asyncio.run(evaluator.evaluate_all("tests", workers=2))
+        backend = RecordReplayBackend(recordings)
+        set_llm_backend(backend)
+        yield backend
+    finally:
+        set_llm_backend(None)
+
+
+class TestValueMatching:
+
+    def test_dates_match_in_any_format(self, evaluator):
+        for extracted in ("2024-01-15", "15 Jan 2024", "January 15, 2024", "15/01/2024"):
+            assert evaluator._values_match(extracted, "2024-01-15", "Date")
+        assert not evaluator._values_match("2024-01-16", "2024-01-15", "Date of export")
+        # Other fields aren't read as dates
+        assert not evaluator._values_match("15 Jan 2024", "2024-01-15", "Consignee Name")
+
+    def test_amounts_match_as_numbers(self, evaluator):
+        assert evaluator._values_match("$45,000.00", "45000", "Average Price")
+        assert evaluator._values_match("12500.00 kg", "12500", "Average Gross Weight")
+        assert evaluator._values_match("5", "5.00", "Line Items Count")
+
+    def test_averages_match_within_tolerance(self, evaluator):
+        assert evaluator._values_match("$45,030.00", "45000", "Average Price")
+        assert not evaluator._values_match("$45,100.00", "45000", "Average Price")
+        # Counts must match exactly
+        assert not evaluator._values_match("1001", "1000", "Line Items Count")
+
+    def test_text_ignores_case_and_whitespace(self, evaluator):
+        assert evaluator._values_match("  abc   TRADING company ", "ABC Trading Company", "Consignee Name")
+        assert not evaluator._values_match("ABC Trading", "ABC Trading Company", "Consignee Name")
+
+    def test_missing_and_unexpected_values(self, evaluator):
+        expected = {"Consignee Name": "", "Consignee Address": "1 Main St", "Date": "", "Container Number": "X"}
+        extracted = {"consignee_name": None, "consignee_address": None, "date": "2024-01-15",
+                     "container_number": "Y"}
+
+        results = evaluator.score_document(extracted, expected)
+
+        assert results["Consignee Name"] == {'TP': 0, 'FP': 0, 'FN': 0, 'TN': 1}
+        assert results["Consignee Address"] == {'TP': 0, 'FP': 0, 'FN': 1, 'TN': 0}
+        assert results["Date"] == {'TP': 0, 'FP': 1, 'FN': 0, 'TN': 0}
+        # A wrong value is both a false positive and a false negative
+        assert results["Container Number"] == {'TP': 0, 'FP': 1, 'FN': 1, 'TN': 0}
+
+
+class TestEvaluateAll:
+
+    def test_replayed_run_reports_scores_tokens_and_cost(self, evaluator, replay):
+        results = asyncio.run(evaluator.evaluate_all("tests", workers=2))
+
+        documents = results["document_results"]
+        bol = documents["bol"]["field_results"]
+        assert all(bol[field]["TP"] == 1 for field in list(GROUND_TRUTH["bol"]["fields"])[:6])
+        assert bol["Line Items Count"]["TN"] == 1
+        # The aggregates come formatted as "$27.30" and "65.00 kg"
+        invoice = documents["invoice"]["field_results"]
+        assert all(invoice[field]["TP"] == 1 for field in ("Line Items Count", "Average Gross Weight", "Average Price"))
+        assert invoice["Consignee Name"] == {'TP': 0, 'FP': 1, 'FN': 1, 'TN': 0}
+        assert invoice["Bill of lading number"] == {'TP': 0, 'FP': 1, 'FN': 0, 'TN': 0}
+        assert results["per_field_metrics"]["Consignee Name"]["precision"] == 0.5
+
+        # Replayed calls report the tokens they were recorded with
+        calls = len(replay.recordings)
+        performance = results["performance_metrics"]
+        assert (performance["documents"], performance["errors"]) == (2, 0)
+        assert performance["prompt_tokens"] == calls * PROMPT_TOKENS
+        assert performance["completion_tokens"] == calls * COMPLETION_TOKENS
+        assert performance["cost_usd"] == pytest.approx(calls * (PROMPT_TOKENS * 0.5 + COMPLETION_TOKENS * 4.0) / 1e6)
+        assert sum(document["cost_usd"] for document in documents.values()) == pytest.approx(performance["cost_usd"])
+
+    def test_resumes_from_a_partial_checkpoint(self, evaluator, replay, tmp_path):
+        checkpoint = tmp_path / "checkpoint.jsonl"
+        full = asyncio.run(evaluator.evaluate_all("tests", checkpoint=str(checkpoint)))
+
+        # Interrupted after the first document
+        first = checkpoint.read_text().splitlines()[0]
+        checkpoint.write_text(first + "\n")
+        with patch.object(evaluator, "extract_document", wraps=evaluator.extract_document) as extract:
+            resumed = asyncio.run(evaluator.evaluate_all("tests", checkpoint=str(checkpoint)))
+
+        assert extract.call_count == 1
+        assert len(checkpoint.read_text().splitlines()) == 2
+        assert resumed["per_field_metrics"] == full["per_field_metrics"]
+        assert resumed["performance_metrics"]["prompt_tokens"] == full["performance_metrics"]["prompt_tokens"]
+
+    def test_checkpoint_of_another_configuration_is_not_reused(self, evaluator, replay, tmp_path):
+        checkpoint = tmp_path / "checkpoint.jsonl"
+        asyncio.run(evaluator.evaluate_all("tests", checkpoint=str(checkpoint)))
+
+        with patch.object(evaluator, "fingerprint", return_value="other"), \
+                patch.object(evaluator, "extract_document", wraps=evaluator.extract_document) as extract:
+            asyncio.run(evaluator.evaluate_all("tests", checkpoint=str(checkpoint)))
+
+        assert extract.call_count == 2
+
+    def test_failed_documents_are_retried_on_resume(self, evaluator, replay, tmp_path):
+        checkpoint = tmp_path / "checkpoint.jsonl"
+        with patch.object(replay, "recordings", {}):
+            failed = asyncio.run(evaluator.evaluate_all("tests", checkpoint=str(checkpoint)))
+
+        assert failed["performance_metrics"] == {"documents": 0, "errors": 2}
+        assert not checkpoint.exists()
+
+        resumed = asyncio.run(evaluator.evaluate_all("tests", checkpoint=str(checkpoint)))
+        assert resumed["performance_metrics"]["documents"] == 2
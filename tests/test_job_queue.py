@@ -0,0 +1,250 @@
+import asyncio
+import io
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.job_queue import JobRunner, JobStore, TransientJobError
+
+
+def _store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"), str(tmp_path / "files"))
+
+
+def _submit(store):
+    job_id, job_dir = store.new_job_dir()
+    path = os.path.join(job_dir, "doc.pdf")
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4")
+    store.create(job_id, [{"path": path, "ext": ".pdf", "sha256": "abc"}])
+    return job_id
+
+
+async def _run_until_finished(store, handler, job_id, **kwargs):
+    options = dict(workers=2, max_attempts=3, retry_base_seconds=0.01, lease_seconds=60,
+                   poll_seconds=0.01, retention_seconds=3600)
+    options.update(kwargs)
+    runner = JobRunner(store, handler, **options)
+    runner.start()
+    try:
+        for _ in range(500):
+            job = store.get(job_id)
+            if job["status"] in ("succeeded", "failed"):
+                return job
+            await asyncio.sleep(0.01)
+        pytest.fail("job did not finish")
+    finally:
+        await runner.stop()
+
+
+class TestJobStore:
+
+    def test_claim_takes_each_job_once(self, tmp_path):
+        store = _store(tmp_path)
+        job_id = _submit(store)
+
+        job = store.claim(lease_seconds=60)
+        assert job["id"] == job_id
+        assert job["status"] == "running"
+        assert job["attempts"] == 1
+        assert store.claim(lease_seconds=60) is None
+
+    def test_expired_lease_is_claimed_again(self, tmp_path):
+        store = _store(tmp_path)
+        job_id = _submit(store)
+        store.claim(lease_seconds=60)
+
+        with patch("app.services.job_queue.time.time", return_value=time.time() + 120):
+            job = store.claim(lease_seconds=60)
+        assert job["id"] == job_id
+        assert job["attempts"] == 2
+
+    def test_expired_lease_fails_after_max_attempts(self, tmp_path):
+        store = _store(tmp_path)
+        job_id = _submit(store)
+        store.claim(lease_seconds=60, max_attempts=2)
+        with patch("app.services.job_queue.time.time", return_value=time.time() + 120):
+            store.claim(lease_seconds=60, max_attempts=2)
+
+        with patch("app.services.job_queue.time.time", return_value=time.time() + 240):
+            assert store.claim(lease_seconds=60, max_attempts=2) is None
+        job = store.get(job_id)
+        assert job["status"] == "failed"
+        assert job["attempts"] == 2
+        assert "lease expired" in job["error"]
+        assert not os.path.exists(os.path.join(store.files_dir, job_id))
+
+    def test_extended_lease_is_not_claimed_again(self, tmp_path):
+        store = _store(tmp_path)
+        job_id = _submit(store)
+        store.claim(lease_seconds=60)
+
+        with patch("app.services.job_queue.time.time", return_value=time.time() + 50):
+            store.extend_lease(job_id, lease_seconds=60)
+        with patch("app.services.job_queue.time.time", return_value=time.time() + 90):
+            assert store.claim(lease_seconds=60) is None
+
+    def test_retry_waits_for_delay(self, tmp_path):
+        store = _store(tmp_path)
+        job_id = _submit(store)
+        store.claim(lease_seconds=60)
+        store.retry(job_id, "rate limited", delay_seconds=60)
+
+        assert store.get(job_id)["status"] == "queued"
+        assert store.claim(lease_seconds=60) is None
+
+    def test_prune_removes_old_finished_jobs(self, tmp_path):
+        store = _store(tmp_path)
+        done, pending = _submit(store), _submit(store)
+        store.complete(done, {"extracted_data": {}})
+
+        with patch("app.services.job_queue.time.time", return_value=time.time() + 120):
+            assert store.prune(older_than_seconds=60) == 1
+        assert store.get(done) is None
+        assert store.get(pending) is not None
+
+
+class TestJobRunner:
+
+    def test_successful_job_stores_result_and_removes_files(self, tmp_path):
+        store = _store(tmp_path)
+        job_id = _submit(store)
+
+        async def handler(job):
+            assert os.path.exists(job["files"][0]["path"])
+            return {"extracted_data": {"bill_of_lading_number": "BL123"}}
+
+        job = asyncio.run(_run_until_finished(store, handler, job_id))
+        assert job["status"] == "succeeded"
+        assert job["result"] == {"extracted_data": {"bill_of_lading_number": "BL123"}}
+        assert not os.path.exists(os.path.join(store.files_dir, job_id))
+
+    def test_transient_error_is_retried(self, tmp_path):
+        store = _store(tmp_path)
+        job_id = _submit(store)
+        calls = []
+
+        async def handler(job):
+            calls.append(job["attempts"])
+            if len(calls) < 2:
+                raise TransientJobError("Rate limit reached")
+            return {"extracted_data": {}}
+
+        job = asyncio.run(_run_until_finished(store, handler, job_id))
+        assert job["status"] == "succeeded"
+        assert calls == [1, 2]
+
+    def test_transient_error_fails_after_max_attempts(self, tmp_path):
+        store = _store(tmp_path)
+        job_id = _submit(store)
+
+        async def handler(job):
+            raise TransientJobError("Rate limit reached")
+
+        job = asyncio.run(_run_until_finished(store, handler, job_id, max_attempts=2))
+        assert job["status"] == "failed"
+        assert job["attempts"] == 2
+        assert job["error"] == "Rate limit reached"
+
+    def test_heartbeat_keeps_long_job_leased(self, tmp_path):
+        store = _store(tmp_path)
+        job_id = _submit(store)
+        claims = []
+
+        async def handler(job):
+            # Runs for several lease lengths; without the heartbeat another worker would claim it
+            claims.append(job["attempts"])
+            await asyncio.sleep(0.5)
+            return {"extracted_data": {}}
+
+        job = asyncio.run(_run_until_finished(store, handler, job_id, lease_seconds=0.15))
+
+        assert job["status"] == "succeeded"
+        assert claims == [1]
+
+    def test_other_errors_are_not_retried(self, tmp_path):
+        store = _store(tmp_path)
+        job_id = _submit(store)
+
+        async def handler(job):
+            raise ValueError("Corrupt PDF")
+
+        job = asyncio.run(_run_until_finished(store, handler, job_id))
+        assert job["status"] == "failed"
+        assert job["attempts"] == 1
+        assert job["error"] == "Corrupt PDF"
+
+
+class TestJobEndpoints:
+
+    @pytest.fixture
+    def client(self, tmp_path):
+        with patch("app.services.job_queue.settings.JOB_DB_PATH", str(tmp_path / "jobs.sqlite3")), \
+             patch("app.services.job_queue.settings.JOB_FILES_DIR", str(tmp_path / "files")), \
+             patch("app.services.job_queue.settings.JOB_RETRY_BASE_SECONDS", 0.01), \
+             patch("app.services.job_queue.settings.JOB_POLL_SECONDS", 0.01):
+            with TestClient(app) as client:
+                yield client
+
+    def _wait(self, client, job_id):
+        for _ in range(500):
+            status = client.get(f"/jobs/{job_id}").json()["status"]
+            if status in ("succeeded", "failed"):
+                return status
+            time.sleep(0.01)
+        pytest.fail("job did not finish")
+
+    def test_submit_poll_and_fetch_result(self, client):
+        with patch('app.api.routes.process_documents') as mock_process, \
+             patch('app.api.routes.extract_field_from_document') as mock_extract:
+            mock_process.return_value = {"pdf_text": "Sample"}
+            mock_extract.side_effect = [
+                {"error": "Rate limit reached", "retryable": True},
+                {"text_extraction": {"bill_of_lading_number": "BL123"}},
+            ]
+
+            response = client.post(
+                "/jobs",
+                files=[("files", ("test.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf"))],
+            )
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+
+            assert self._wait(client, job_id) == "succeeded"
+
+        response = client.get(f"/jobs/{job_id}/result")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["extracted_data"] == {"text_extraction": {"bill_of_lading_number": "BL123"}}
+        assert client.get(f"/jobs/{job_id}").json()["attempts"] == 2
+
+    def test_permanent_error_fails_job(self, client):
+        with patch('app.api.routes.process_documents') as mock_process:
+            mock_process.side_effect = ValueError("Corrupt PDF")
+            job_id = client.post(
+                "/jobs",
+                files=[("files", ("test.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf"))],
+            ).json()["job_id"]
+
+            assert self._wait(client, job_id) == "failed"
+
+        data = client.get(f"/jobs/{job_id}/result").json()
+        assert data == {"job_id": job_id, "status": "failed", "error": "Corrupt PDF"}
+
+    def test_result_of_unfinished_job_is_conflict(self, client):
+        with patch('app.api.routes.notify_job_runner'), \
+             patch('app.services.job_queue.JobStore.claim', return_value=None):
+            job_id = client.post(
+                "/jobs",
+                files=[("files", ("test.pdf", io.BytesIO(b"%PDF-1.4"), "application/pdf"))],
+            ).json()["job_id"]
+
+            assert client.get(f"/jobs/{job_id}/result").status_code == 409
+
+    def test_unknown_job_is_not_found(self, client):
+        assert client.get("/jobs/missing").status_code == 404
+        assert client.get("/jobs/missing/result").status_code == 404
@@ -0,0 +1,143 @@
+import os
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import pytest
+from openpyxl import Workbook
+
+from app.services.document_processor import process_documents
+from app.services import line_items
+from app.services.line_items import summarize_workbook
+from app.utils.xlsx_utils import extract_text_from_xlsx
+
+DEMO_XLSX = os.path.join(os.path.dirname(__file__), "..", "testDocs", "Demo-Invoice-PackingList_1.xlsx")
+SAMPLE_XLSX = os.path.join(os.path.dirname(__file__), "sample_invoice.xlsx")
+
+
+def _workbook(tmp_path, sheets):
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        sheet = workbook.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    path = tmp_path / "book.xlsx"
+    workbook.save(path)
+    return str(path)
+
+
+class TestSummarizeWorkbook:
+
+    def test_sample_invoice_matches_its_summary_sheet(self):
+        _, aggregates = summarize_workbook(SAMPLE_XLSX)
+
+        assert aggregates["line_items_count"] == 5
+        assert aggregates["average_gross_weight"] == 65
+        assert aggregates["average_price"] == 27.3
+
+    def test_invoice_and_packing_list_sheets(self):
+        text, aggregates = summarize_workbook(DEMO_XLSX)
+
+        # Count and price from the invoice; weight from the packing list, skipping rows without one
+        assert aggregates["line_items_count"] == 18
+        assert aggregates["average_price"] == pytest.approx(13.82 / 18, abs=1e-4)
+        assert aggregates["average_gross_weight"] == pytest.approx(2922.8 / 15, abs=1e-4)
+        assert aggregates["sources"] == {
+            "line_items_count": "Invoice",
+            "average_price": "Invoice",
+            "average_gross_weight": "包装清单 List",
+        }
+        # Header fields stay in the text; the table is reduced to a sample
+        assert "B/L NO.:\tZMLU34110002" in text
+        assert "Bottle opener" not in text
+        assert "[18 line items, 13 more not shown" in text
+
+    def test_large_table_is_summarized_but_fully_aggregated(self, tmp_path):
+        rows = [["Packing List"], ["No.", "Description", "Qty", "Unit Price (USD)", "G.W. (LBS)"]]
+        rows += [[i, f"Item {i}", 10, 2.0 if i % 2 else 4.0, 10.0] for i in range(1, 3001)]
+        rows += [["TOTAL", None, 30000, None, 30000.0]]
+        path = _workbook(tmp_path, {"Items": rows})
+
+        text, aggregates = summarize_workbook(path)
+
+        assert aggregates["line_items_count"] == 3000
+        assert aggregates["average_price"] == 3.0
+        assert aggregates["average_gross_weight"] == pytest.approx(4.5359, abs=1e-4)
+        assert len(text) < 1000
+
+    def test_net_weight_and_line_totals_are_not_used(self, tmp_path):
+        path = _workbook(tmp_path, {"Items": [
+            ["Description", "Total Price", "Net Weight (kg)", "Gross Weight (kg)"],
+            ["A", 100, 1, 2],
+            ["B", 300, 3, 4],
+        ]})
+
+        _, aggregates = summarize_workbook(path)
+
+        assert "average_price" not in aggregates
+        assert aggregates["average_gross_weight"] == 3
+
+    def test_sheet_without_line_items(self, tmp_path):
+        path = _workbook(tmp_path, {"Notes": [["Shipper", "ACME"], ["Port", "Shanghai"]]})
+
+        text, aggregates = summarize_workbook(path)
+
+        assert aggregates == {"sources": {}}
+        assert text == "Sheet: Notes\nShipper\tACME\nPort\tShanghai"
+
+    def test_table_summary_is_rendered_once(self, tmp_path):
+        rows = [["Description", "Qty", "Unit Price"]]
+        rows += [[f"Item {i}", 1, 2.0] for i in range(20)]
+        rows += [[], ["Remarks"]] + [[f"Note {i}"] for i in range(200)]
+        path = _workbook(tmp_path, {"Items": rows})
+
+        with patch.object(line_items, "summarize_table", wraps=line_items.summarize_table) as summarize:
+            text, _ = summarize_workbook(path)
+
+        assert summarize.call_count == 1
+        assert "[20 line items, 15 more not shown" in text
+        assert "Note 199" in text
+
+    def test_large_sheet_costs_no_more_than_plain_extraction(self, tmp_path):
+        # Rows are streamed, so time and peak memory stay close to reading the whole sheet as text
+        header = ["No.", "Description", "Qty", "Unit Price (USD)", "Gross Weight (KG)"]
+        header += [f"Extra {column}" for column in range(25)]
+        rows = [header] + [[i, f"Item {i}", 10, 2.0, 5.0] + list(range(25)) for i in range(1, 5001)]
+        path = _workbook(tmp_path, {"Items": rows})
+
+        def measure(func, **kwargs):
+            tracemalloc.start()
+            start = time.perf_counter()
+            result = func(path, **kwargs)
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return result, seconds, peak
+
+        (text, aggregates), seconds, peak = measure(summarize_workbook)
+        _, plain_seconds, plain_peak = measure(extract_text_from_xlsx, max_rows=0)
+
+        assert aggregates["line_items_count"] == 5000
+        assert aggregates["average_price"] == 2.0
+        assert len(text) < 2000
+        assert peak < 2 * plain_peak
+        assert seconds < 2 * plain_seconds
+
+
+class TestProcessDocumentsAggregates:
+
+    def test_first_workbook_wins_per_field(self, tmp_path):
+        invoice = _workbook(tmp_path, {"Invoice": [["Description", "Unit Price"], ["A", 1.0], ["B", 3.0]]})
+        packing_dir = tmp_path / "packing"
+        packing_dir.mkdir()
+        packing = _workbook(packing_dir, {"Packing": [["Description", "Gross Weight"], ["A", 5.0]]})
+
+        result = process_documents([invoice, packing])
+
+        assert result["line_item_aggregates"] == {
+            "line_items_count": 2,
+            "average_price": 2.0,
+            "average_gross_weight": 5.0,
+            "sources": {"line_items_count": "Invoice", "average_price": "Invoice", "average_gross_weight": "Packing"},
+        }
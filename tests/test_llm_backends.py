@@ -0,0 +1,185 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+
+from app.services import llm_backends, llm_gateway
+from app.services.llm_backends import LLMBackend, OpenAIBackend, RecordReplayBackend, ReplayMissError
+from app.services.llm_service import EXTRACTION_SCHEMA, extract_field_from_document
+from app.services.llm_stub import StubConfig, create_stub_app, schema_response
+
+SCHEMA = EXTRACTION_SCHEMA["json_schema"]["schema"]
+
+
+def _request(content="Bill of lading"):
+    return {
+        "model": "gpt-5-mini",
+        "messages": [{"role": "user", "content": content}],
+        "response_format": EXTRACTION_SCHEMA,
+    }
+
+
+class CountingBackend(LLMBackend):
+
+    def __init__(self):
+        self.calls = 0
+
+    async def complete(self, model, messages, response_format):
+        self.calls += 1
+        return json.dumps({"call": self.calls})
+
+
+@pytest.fixture
+def stub_server():
+    server = uvicorn.Server(uvicorn.Config(
+        create_stub_app(StubConfig(latency_ms=20, latency_sigma=0, image_latency_ms=0)),
+        host="127.0.0.1", port=0, log_level="warning",
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/v1"
+    server.should_exit = True
+    thread.join()
+
+
+class TestStubServer:
+
+    def test_response_matches_the_schema(self):
+        client = TestClient(create_stub_app(StubConfig(latency_ms=0, null_rate=0)))
+
+        response = client.post("/v1/chat/completions", json=_request())
+
+        content = json.loads(response.json()["choices"][0]["message"]["content"])
+        assert set(content) == set(SCHEMA["required"])
+        assert isinstance(content["line_items_count"], int)
+        assert isinstance(content["average_price"], float)
+        assert len(content["date_of_export"]) == len("2024-01-15")
+
+    def test_same_request_same_answer(self):
+        client = TestClient(create_stub_app(StubConfig(latency_ms=0)))
+
+        first = client.post("/v1/chat/completions", json=_request()).json()["choices"][0]["message"]["content"]
+        second = client.post("/v1/chat/completions", json=_request()).json()["choices"][0]["message"]["content"]
+        other = client.post("/v1/chat/completions", json=_request("Invoice")).json()["choices"][0]["message"]["content"]
+
+        assert first == second
+        assert first != other
+
+    def test_rate_limited_responses_carry_retry_after(self):
+        client = TestClient(create_stub_app(StubConfig(latency_ms=0, rate_limit_rate=1.0, retry_after_seconds=2)))
+
+        response = client.post("/v1/chat/completions", json=_request())
+
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "2"
+
+    def test_usage_is_estimated(self):
+        client = TestClient(create_stub_app(StubConfig(latency_ms=0)))
+
+        usage = client.post("/v1/chat/completions", json=_request("x" * 400)).json()["usage"]
+
+        assert usage["prompt_tokens"] == 100
+        assert usage["completion_tokens"] > 0
+
+    def test_nullable_fields_are_sometimes_null(self):
+        values = [schema_response(SCHEMA, random.Random(seed), null_rate=0.5) for seed in range(20)]
+
+        assert any(value["container_number"] is None for value in values)
+        assert any(value["container_number"] is not None for value in values)
+
+    def test_extraction_against_the_stub_server(self, stub_server):
+        async def extract():
+            try:
+                return await extract_field_from_document({"pdf_text": "Consignee: ACME", "pdf_images": ["aW1n"]})
+            finally:
+                await llm_gateway.close_client()
+
+        with patch.object(llm_backends, "_backend", OpenAIBackend(base_url=stub_server)):
+            result = asyncio.run(extract())
+
+        assert set(result["text_extraction"]) == set(SCHEMA["required"])
+        assert set(result["vision_extraction"]) == set(SCHEMA["required"])
+
+
+class TestRecordReplayBackend:
+
+    def test_replays_recorded_responses_without_the_backend(self, tmp_path):
+        path = str(tmp_path / "recordings.jsonl")
+        inner = CountingBackend()
+        recorder = RecordReplayBackend(path, backend=inner)
+
+        recorded = asyncio.run(recorder.complete("gpt-5-mini", [{"role": "user", "content": "a"}], EXTRACTION_SCHEMA))
+        replayed = asyncio.run(RecordReplayBackend(path).complete(
+            "gpt-5-mini", [{"role": "user", "content": "a"}], EXTRACTION_SCHEMA,
+        ))
+
+        assert recorded == replayed == json.dumps({"call": 1})
+        assert inner.calls == 1
+
+    def test_unrecorded_request_fails(self, tmp_path):
+        replayer = RecordReplayBackend(str(tmp_path / "recordings.jsonl"))
+
+        with pytest.raises(ReplayMissError):
+            asyncio.run(replayer.complete("gpt-5-mini", [{"role": "user", "content": "b"}], EXTRACTION_SCHEMA))
+
+    def test_reuse_answers_recorded_requests_from_the_file(self, tmp_path):
+        inner = CountingBackend()
+        cache = RecordReplayBackend(str(tmp_path / "recordings.jsonl"), backend=inner, reuse=True)
+
+        async def complete_twice(content):
+            messages = [{"role": "user", "content": content}]
+            return [await cache.complete("gpt-5-mini", messages, EXTRACTION_SCHEMA) for _ in range(2)]
+
+        assert asyncio.run(complete_twice("a")) == [json.dumps({"call": 1})] * 2
+        assert asyncio.run(complete_twice("b")) == [json.dumps({"call": 2})] * 2
+        assert inner.calls == 2
+
+    def test_replayed_responses_report_recorded_token_usage(self, tmp_path):
+        path = tmp_path / "recordings.jsonl"
+        key = llm_backends.request_key("gpt-5-mini", [], EXTRACTION_SCHEMA)
+        path.write_text(json.dumps({
+            "key": key, "model": "gpt-5-mini", "seconds": 0.1, "usage": {"prompt": 50, "completion": 5}, "content": "{}",
+        }) + "\n")
+
+        async def replay():
+            with llm_gateway.track_token_usage() as usage:
+                await RecordReplayBackend(str(path)).complete("gpt-5-mini", [], EXTRACTION_SCHEMA)
+            return usage
+
+        assert asyncio.run(replay()) == {"prompt": 50, "completion": 5}
+
+    def test_replay_latency(self, tmp_path):
+        path = tmp_path / "recordings.jsonl"
+        key = llm_backends.request_key("gpt-5-mini", [], EXTRACTION_SCHEMA)
+        path.write_text(json.dumps({"key": key, "model": "gpt-5-mini", "seconds": 0.2, "content": "{}"}) + "\n")
+        replayer = RecordReplayBackend(str(path), replay_latency=True)
+
+        start = time.perf_counter()
+        asyncio.run(replayer.complete("gpt-5-mini", [], EXTRACTION_SCHEMA))
+
+        assert time.perf_counter() - start >= 0.2
+
+
+class TestGetLLMBackend:
+
+    def test_unknown_backend(self):
+        with patch.object(llm_backends, "_backend", None), \
+                patch.object(llm_backends.settings, "LLM_BACKEND", "nope"):
+            with pytest.raises(ValueError):
+                llm_backends.get_llm_backend()
+
+    def test_stub_backend_uses_the_stub_url(self):
+        with patch.object(llm_backends, "_backend", None), \
+                patch.object(llm_backends.settings, "LLM_BACKEND", "stub"):
+            backend = llm_backends.get_llm_backend()
+
+        assert backend.base_url == llm_backends.settings.LLM_STUB_URL
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from unittest.mock import Mock, patch
+
+import openai
+import pytest
+
+from app.services import llm_gateway
+from app.services.llm_gateway import create_chat_completion, retry_delay
+
+
+def _rate_limit_error(headers=None):
+    return openai.RateLimitError("rate limited", response=Mock(status_code=429, headers=headers or {}), body=None)
+
+
+def _client(create):
+    client = Mock()
+    client.chat.completions.create = create
+    return client
+
+
+def _run(create, calls=1, **settings):
+    async def send_all():
+        return await asyncio.gather(*(create_chat_completion(model="gpt-5-mini", messages=[]) for _ in range(calls)))
+
+    with patch.object(llm_gateway, "get_client", return_value=_client(create)), \
+            patch.multiple(llm_gateway.settings, **{"LLM_REQUESTS_PER_MINUTE": 0, **settings}):
+        return asyncio.run(send_all())
+
+
+class TestRetries:
+
+    def test_rate_limited_request_is_retried_after_retry_after(self):
+        attempts = []
+
+        async def create(model, messages):
+            attempts.append(time.perf_counter())
+            if len(attempts) == 1:
+                raise _rate_limit_error({"retry-after-ms": "200"})
+            return "ok"
+
+        assert _run(create) == ["ok"]
+        assert attempts[1] - attempts[0] >= 0.2
+
+    def test_gives_up_after_max_retries(self):
+        attempts = []
+
+        async def create(model, messages):
+            attempts.append(1)
+            raise _rate_limit_error({"retry-after": "0"})
+
+        with pytest.raises(openai.RateLimitError):
+            _run(create, LLM_MAX_RETRIES=2)
+        assert len(attempts) == 3
+
+    def test_other_errors_are_not_retried(self):
+        attempts = []
+
+        async def create(model, messages):
+            attempts.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            _run(create)
+        assert len(attempts) == 1
+
+    def test_backoff_is_jittered_and_capped(self):
+        with patch.multiple(llm_gateway.settings, LLM_RETRY_BASE_SECONDS=1.0, LLM_RETRY_MAX_SECONDS=5.0):
+            delays = [retry_delay(_rate_limit_error(), attempt=10) for _ in range(50)]
+            assert retry_delay(_rate_limit_error({"retry-after": "120"}), attempt=0) == 5.0
+
+        assert all(0 <= delay <= 5.0 for delay in delays)
+        assert len(set(delays)) > 1
+
+
+class TestLimits:
+
+    def test_concurrency_is_capped_and_excess_requests_wait(self):
+        in_flight = []
+        peak = []
+
+        async def create(model, messages):
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.05)
+            in_flight.pop()
+            return "ok"
+
+        results = _run(create, calls=10, LLM_MAX_CONCURRENCY=8, LLM_MAX_CONCURRENCY_PER_MODEL=3)
+
+        assert results == ["ok"] * 10
+        assert max(peak) == 3
+
+    def test_request_rate_is_limited(self):
+        async def create(model, messages):
+            return "ok"
+
+        start = time.perf_counter()
+        _run(create, calls=5, LLM_REQUESTS_PER_MINUTE=600, LLM_RATE_LIMIT_BURST=1)
+
+        # One request immediately, then one every 0.1s
+        assert time.perf_counter() - start >= 0.35
+
+    def test_throttled_requests_do_not_hold_concurrency_slots(self):
+        free_slots = []
+
+        async def create(model, messages):
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        async def send_all():
+            limiter = llm_gateway._get_limiter()
+            tasks = [asyncio.create_task(create_chat_completion(model="gpt-5-mini", messages=[])) for _ in range(4)]
+            await asyncio.sleep(0.1)
+            # The first request is done; the rest wait for rate limit tokens, not slots
+            free_slots.append(limiter.requests._value)
+            return await asyncio.gather(*tasks)
+
+        with patch.object(llm_gateway, "get_client", return_value=_client(create)), \
+                patch.multiple(llm_gateway.settings, LLM_REQUESTS_PER_MINUTE=120, LLM_RATE_LIMIT_BURST=1,
+                               LLM_MAX_CONCURRENCY=2):
+            assert asyncio.run(send_all()) == ["ok"] * 4
+
+        assert free_slots == [2]
+
+
+class TestClients:
+
+    def test_clients_are_closed_when_their_loop_shuts_down(self):
+        async def open_client():
+            return llm_gateway.get_client("http://127.0.0.1:1/v1")
+
+        first = asyncio.run(open_client())
+        second = asyncio.run(open_client())
+
+        assert first is not second
+        assert first.is_closed() and second.is_closed()
+
+    def test_close_client_closes_the_running_loops_clients(self):
+        async def open_and_close():
+            client = llm_gateway.get_client()
+            await llm_gateway.close_client()
+            return client, llm_gateway.get_client()
+
+        closed, reopened = asyncio.run(open_and_close())
+
+        assert closed.is_closed() and closed is not reopened
+
+
+class TestTokenUsage:
+
+    def test_tokens_are_counted_per_block(self):
+        async def create(model, messages):
+            response = Mock()
+            response.usage.prompt_tokens = 100
+            response.usage.completion_tokens = 10
+            return response
+
+        async def send():
+            with llm_gateway.track_token_usage() as outer:
+                with llm_gateway.track_token_usage() as inner:
+                    await create_chat_completion(model="gpt-5-mini", messages=[])
+                await asyncio.gather(*(create_chat_completion(model="gpt-5-mini", messages=[]) for _ in range(2)))
+            return outer, inner
+
+        with patch.object(llm_gateway, "get_client", return_value=_client(create)), \
+                patch.object(llm_gateway.settings, "LLM_REQUESTS_PER_MINUTE", 0):
+            outer, inner = asyncio.run(send())
+
+        assert inner == {"prompt": 100, "completion": 10}
+        assert outer == {"prompt": 300, "completion": 30}
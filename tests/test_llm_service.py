@@ -0,0 +1,357 @@
+import asyncio
+import json
+import time
+from unittest.mock import Mock, patch
+
+import openai
+import pytest
+from prometheus_client import REGISTRY
+
+from app.services import llm_gateway, llm_service
+from app.services.llm_service import extract_field_from_document
+
+FIELDS = {
+    "bill_of_lading_number": "BL123",
+    "container_number": "ABCD1234567",
+    "consignee_name": None,
+    "consignee_address": None,
+    "date_of_export": None,
+    "date": None,
+    "line_items_count": None,
+    "average_gross_weight": None,
+    "average_price": None,
+}
+
+
+def _completion(payload):
+    response = Mock()
+    response.choices = [Mock()]
+    response.choices[0].message.content = json.dumps(payload)
+    return response
+
+
+def _fake_client(text_delay=0.0, vision_delay=0.0, text_error=None, vision_error=None):
+    async def create(model, messages, response_format):
+        is_vision = isinstance(messages[1]["content"], list)
+        await asyncio.sleep(vision_delay if is_vision else text_delay)
+        error = vision_error if is_vision else text_error
+        if error:
+            raise error
+        return _completion({**FIELDS, "consignee_name": "vision" if is_vision else "text"})
+
+    client = Mock()
+    client.chat.completions.create = create
+    return client
+
+
+DOCUMENT = {"pdf_text": "Bill of lading NO BL123", "pdf_images": ["aW1n"]}
+
+
+class TestConcurrentExtraction:
+
+    @pytest.fixture(autouse=True)
+    def always_run_vision(self):
+        with patch.object(llm_service.settings, "VISION_POLICY", "always"):
+            yield
+
+    def test_text_and_vision_run_concurrently(self):
+        with patch.object(llm_gateway, "get_client", return_value=_fake_client(text_delay=0.3, vision_delay=0.3)):
+            start = time.perf_counter()
+            result = asyncio.run(extract_field_from_document(DOCUMENT))
+            elapsed = time.perf_counter() - start
+
+        assert result["text_extraction"]["consignee_name"] == "text"
+        assert result["vision_extraction"]["consignee_name"] == "vision"
+        assert elapsed < 0.5
+
+    def test_vision_result_returned_when_text_fails(self):
+        with patch.object(llm_gateway, "get_client", return_value=_fake_client(text_error=RuntimeError("boom"))):
+            result = asyncio.run(extract_field_from_document(DOCUMENT))
+
+        assert result["text_extraction"] == {"error": "boom"}
+        assert result["vision_extraction"]["consignee_name"] == "vision"
+
+    def test_text_result_returned_when_vision_times_out(self):
+        with patch.object(llm_gateway, "get_client", return_value=_fake_client(vision_delay=5)), \
+                patch.object(llm_service.settings, "LLM_CALL_TIMEOUT_SECONDS", 0.2):
+            start = time.perf_counter()
+            result = asyncio.run(extract_field_from_document(DOCUMENT))
+            elapsed = time.perf_counter() - start
+
+        assert result["text_extraction"]["consignee_name"] == "text"
+        assert "timed out" in result["vision_extraction"]["error"]
+        assert elapsed < 1
+
+    def test_error_when_both_paths_fail(self):
+        client = _fake_client(text_error=RuntimeError("text down"), vision_error=RuntimeError("vision down"))
+        with patch.object(llm_gateway, "get_client", return_value=client):
+            result = asyncio.run(extract_field_from_document(DOCUMENT))
+
+        assert result == {"error": "text down"}
+
+    def test_transient_failure_is_marked_retryable(self):
+        rate_limited = openai.RateLimitError(
+            "Rate limit reached",
+            response=Mock(status_code=429, headers={}),
+            body=None,
+        )
+        client = _fake_client(text_error=rate_limited, vision_error=RuntimeError("vision down"))
+        with patch.object(llm_gateway, "get_client", return_value=client):
+            result = asyncio.run(extract_field_from_document(DOCUMENT))
+
+        assert result == {"error": "Rate limit reached", "retryable": True}
+
+    def test_vision_payload_is_reported(self):
+        sent = []
+        client = _fake_client()
+        create = client.chat.completions.create
+
+        async def recording_create(model, messages, response_format):
+            sent.append(messages)
+            return await create(model, messages, response_format)
+
+        client.chat.completions.create = recording_create
+        document = {**DOCUMENT, "pdf_images": ["aW1n", "aW1nMg=="], "pdf_page_count": 3}
+        with patch.object(llm_gateway, "get_client", return_value=client), \
+                patch.object(llm_service.settings, "VISION_IMAGE_FORMAT", "WEBP"):
+            result = asyncio.run(extract_field_from_document(document))
+
+        vision_messages = next(messages for messages in sent if isinstance(messages[1]["content"], list))
+        assert vision_messages[1]["content"][1]["image_url"]["url"].startswith("data:image/webp;base64,")
+        assert result["vision_payload"] == {"pages": 2, "total_pages": 3, "bytes": 12, "files": {"0": 2}}
+
+    def test_text_result_reported_before_vision_finishes(self):
+        events = []
+
+        def progress(event, data):
+            events.append((event, time.perf_counter()))
+
+        with patch.object(llm_gateway, "get_client", return_value=_fake_client(text_delay=0.05, vision_delay=0.3)):
+            start = time.perf_counter()
+            asyncio.run(extract_field_from_document(DOCUMENT, progress=progress))
+
+        assert [event for event, _ in events] == ["text_extraction", "vision_extraction"]
+        assert events[0][1] - start < 0.2
+
+    def test_spreadsheet_aggregates_override_llm_fields(self):
+        aggregates = {
+            "line_items_count": 18,
+            "average_price": 0.7678,
+            "sources": {"line_items_count": "Invoice", "average_price": "Invoice"},
+        }
+        document = {**DOCUMENT, "line_item_aggregates": aggregates}
+        with patch.object(llm_gateway, "get_client", return_value=_fake_client()):
+            result = asyncio.run(extract_field_from_document(document))
+
+        for extraction in (result["text_extraction"], result["vision_extraction"]):
+            assert extraction["line_items_count"] == 18
+            assert extraction["average_price"] == "$0.77"
+            assert extraction["bill_of_lading_number"] == "BL123"
+        assert result["line_item_aggregates"] == aggregates
+
+    def test_no_vision_call_without_images(self):
+        with patch.object(llm_gateway, "get_client", return_value=_fake_client()):
+            result = asyncio.run(extract_field_from_document({"xlsx_text": "Item,Qty"}))
+
+        assert "vision_extraction" not in result
+        assert result["text_extraction"]["bill_of_lading_number"] == "BL123"
+
+
+LABELED_DOCUMENT = {
+    "pdf_text": "\n".join([
+        "BILL OF LADING",
+        "Bill of Lading Number: COSU534343282",
+        "Container Number: CSQU3054383",
+        "Consignee Name: ACME Imports Ltd",
+        "Consignee Address: 1 Harbor Road, Long Beach, CA",
+        "Date of Export: 15-Jan-2024",
+        "Date: 2024-01-10",
+    ]),
+    "line_item_aggregates": {"line_items_count": 3, "average_gross_weight": 12.5, "average_price": 4.0},
+}
+
+
+class TestRuleFastPath:
+
+    def _recording_client(self, payload):
+        calls = []
+
+        async def create(model, messages, response_format):
+            calls.append({"prompt": messages[1]["content"], "response_format": response_format})
+            return _completion(payload)
+
+        client = Mock()
+        client.chat.completions.create = create
+        return client, calls
+
+    def test_llm_skipped_when_every_field_is_found_locally(self):
+        client, calls = self._recording_client(FIELDS)
+        with patch.object(llm_gateway, "get_client", return_value=client):
+            result = asyncio.run(extract_field_from_document(LABELED_DOCUMENT))
+
+        assert calls == []
+        assert result["text_extraction"] == {
+            "bill_of_lading_number": "COSU534343282",
+            "container_number": "CSQU3054383",
+            "consignee_name": "ACME Imports Ltd",
+            "consignee_address": "1 Harbor Road, Long Beach, CA",
+            "date_of_export": "2024-01-15",
+            "date": "2024-01-10",
+            "line_items_count": 3,
+            "average_gross_weight": "12.50 kg",
+            "average_price": "$4.00",
+        }
+        assert result["rule_extraction"]["container_number"] == {"value": "CSQU3054383", "confidence": 0.99}
+
+    def test_llm_asked_only_for_missing_and_low_confidence_fields(self):
+        document = {"pdf_text": "Bill of Lading Number: COSU534343282\nContainer Number: ABCD1234567\n"}
+        client, calls = self._recording_client({"container_number": "ABCD1234567", "consignee_name": "LLM Co"})
+        with patch.object(llm_gateway, "get_client", return_value=client):
+            result = asyncio.run(extract_field_from_document(document))
+
+        # The container number fails its check digit, so the LLM decides
+        schema = calls[0]["response_format"]["json_schema"]["schema"]
+        assert "bill_of_lading_number" not in schema["properties"]
+        assert schema["required"] == [name for name in FIELDS if name != "bill_of_lading_number"]
+        assert "Bill of lading number" not in calls[0]["prompt"].split("Documents:")[0]
+        assert result["text_extraction"]["bill_of_lading_number"] == "COSU534343282"
+        assert result["text_extraction"]["consignee_name"] == "LLM Co"
+        assert result["text_extraction"]["date"] is None
+
+    def test_rules_can_be_disabled(self):
+        client, calls = self._recording_client(FIELDS)
+        with patch.object(llm_gateway, "get_client", return_value=client), \
+                patch.object(llm_service.settings, "RULES_ENABLED", False):
+            result = asyncio.run(extract_field_from_document({"pdf_text": LABELED_DOCUMENT["pdf_text"]}))
+
+        assert calls[0]["response_format"] is llm_service.EXTRACTION_SCHEMA
+        assert "rule_extraction" not in result
+
+
+class TestSelectVisionImages:
+
+    def _files(self, *pages):
+        return {"files": [{"file": i, "images": images} for i, images in enumerate(pages)]}
+
+    def test_files_take_turns(self):
+        document = self._files(["a1", "a2", "a3"], ["b1"])
+
+        with patch.object(llm_service.settings, "VISION_MAX_PAGES", 3):
+            selected = llm_service.select_vision_images(document)
+
+        assert selected == [(0, "a1"), (0, "a2"), (1, "b1")]
+
+    def test_pdf_images_without_files(self):
+        assert llm_service.select_vision_images({"pdf_images": ["aW1n"]}) == [(0, "aW1n")]
+
+
+COMPLETE = {
+    "bill_of_lading_number": "BL123",
+    "container_number": "CSQU3054383",
+    "consignee_name": "ACME Imports Ltd",
+    "consignee_address": "1 Harbor Road, Long Beach, CA",
+    "date_of_export": "2024-01-15",
+    "date": "2024-01-10",
+    "line_items_count": 3,
+    "average_gross_weight": 12.5,
+    "average_price": 4.0,
+}
+
+
+class TestAdaptiveVision:
+
+    def _client(self, text_payload, vision_payload=None):
+        calls = []
+
+        async def create(model, messages, response_format):
+            is_vision = isinstance(messages[1]["content"], list)
+            calls.append({"vision": is_vision, "response_format": response_format})
+            return _completion(vision_payload if is_vision else text_payload)
+
+        client = Mock()
+        client.chat.completions.create = create
+        return client, calls
+
+    def _extract(self, client, document):
+        with patch.object(llm_gateway, "get_client", return_value=client), \
+                patch.object(llm_service.settings, "VISION_POLICY", "adaptive"):
+            return asyncio.run(extract_field_from_document(document))
+
+    @staticmethod
+    def _decisions():
+        return {reason: REGISTRY.get_sample_value("vision_decisions_total", {"decision": reason}) or 0
+                for reason in ("skip", "missing", "invalid", "disputed")}
+
+    def test_vision_skipped_when_the_text_result_is_complete_and_valid(self):
+        client, calls = self._client(COMPLETE)
+        before = self._decisions()
+
+        result = self._extract(client, {"pdf_text": "Shipment notes", "pdf_images": ["aW1n"]})
+
+        after = self._decisions()
+        assert {reason: after[reason] - before[reason] for reason in after} == {
+            "skip": 1, "missing": 0, "invalid": 0, "disputed": 0,
+        }
+        assert [call["vision"] for call in calls] == [False]
+        assert result["vision_policy"] == {"run": False, "fields": {}}
+        assert "vision_extraction" not in result
+
+    def test_pages_are_encoded_only_when_the_vision_call_runs(self):
+        def document():
+            # A processed PDF whose vision pages haven't been encoded yet
+            return {"pdf_text": "Shipment notes",
+                    "files": [{"file": 0, "name": "bol.pdf", "type": "pdf", "rendered_pages": Mock()}]}
+
+        with patch("app.services.document_processor.encode_vision_pages", return_value=[[(0, "aW1n")]]) as encode:
+            skipped = self._extract(self._client(COMPLETE)[0], document())
+            encode.assert_not_called()
+
+            client, calls = self._client({**COMPLETE, "consignee_address": None}, {"consignee_address": "2 Dock Street"})
+            ran = self._extract(client, document())
+
+        encode.assert_called_once()
+        assert skipped["vision_policy"]["run"] is False
+        assert [call["vision"] for call in calls] == [False, True]
+        assert ran["vision_payload"]["pages"] == 1
+
+    def test_vision_asked_only_for_missing_and_invalid_fields(self):
+        text = {**COMPLETE, "consignee_address": None, "date": "2024-13-45"}
+        vision = {"consignee_address": "2 Dock Street", "date": "2024-01-11"}
+        client, calls = self._client(text, vision)
+        before = self._decisions()
+
+        result = self._extract(client, {"pdf_text": "Shipment notes", "pdf_images": ["aW1n"]})
+
+        # One count per distinct reason, not just the first field's
+        after = self._decisions()
+        assert {reason: after[reason] - before[reason] for reason in after} == {
+            "skip": 0, "missing": 1, "invalid": 1, "disputed": 0,
+        }
+        schema = calls[1]["response_format"]["json_schema"]["schema"]
+        assert schema["required"] == ["consignee_address", "date"]
+        assert result["vision_policy"]["fields"] == {"consignee_address": "missing", "date": "invalid"}
+        assert result["vision_extraction"]["consignee_address"] == "2 Dock Street"
+        assert result["vision_extraction"]["date"] == "2024-01-11"
+        # Fields not asked for are the text result's
+        assert result["vision_extraction"]["average_price"] == "$4.00"
+
+    def test_low_ocr_confidence_asks_for_every_field(self):
+        client, calls = self._client(COMPLETE, COMPLETE)
+        document = {
+            "pdf_text": "Shipment notes",
+            "pdf_images": ["aW1n"],
+            "files": [{"file": 0, "type": "pdf", "images": ["aW1n"], "ocr_confidence": 41.0}],
+        }
+
+        result = self._extract(client, document)
+
+        assert calls[1]["response_format"]["json_schema"]["schema"]["required"] == list(COMPLETE)
+        assert set(result["vision_policy"]["fields"].values()) == {"low_ocr_confidence"}
+
+    def test_vision_skipped_when_every_field_is_known_locally(self):
+        client, calls = self._client(FIELDS)
+
+        result = self._extract(client, {**LABELED_DOCUMENT, "pdf_images": ["aW1n"]})
+
+        assert calls == []
+        assert result["vision_policy"]["run"] is False
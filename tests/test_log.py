@@ -0,0 +1,158 @@
+import io
+import json
+import logging
+import os
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.log import (
+    REQUEST_ID, REQUEST_ID_HEADER, JsonFormatter, RequestIdFilter, configure_logging, redact,
+)
+from app.main import app
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "sample_bill_of_lading.pdf")
+
+client = TestClient(app)
+
+
+class RecordingHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.addFilter(RequestIdFilter())
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def app_records():
+    logger = logging.getLogger("app")
+    handler = RecordingHandler()
+    level = logger.level
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    yield handler.records
+    logger.removeHandler(handler)
+    logger.setLevel(level)
+
+
+class TestRedact:
+
+    def test_base64_payloads_are_replaced_by_their_length(self):
+        image = "iVBORw0KGgo" + "A" * 5000
+
+        redacted = redact({"pdf_text": "Consignee: ACME", "pdf_images": [image, image]})
+
+        assert redacted["pdf_text"] == "Consignee: ACME"
+        assert redacted["pdf_images"] == ["<base64 5011 chars>", "<base64 5011 chars>"]
+
+    def test_long_values_and_collections_are_cut(self):
+        redacted = redact({"text": "word " * 1000, "items": list(range(100))}, max_chars=50, max_items=10)
+
+        assert redacted["text"].endswith("... (5000 chars)")
+        assert len(redacted["text"]) < 100
+        assert redacted["items"][:10] == list(range(10))
+        assert redacted["items"][10] == "... 90 more"
+
+    def test_secrets_are_hidden(self):
+        assert redact({"api_key": "sk-123", "Authorization": "Bearer x"}) == {
+            "api_key": "<redacted>", "Authorization": "<redacted>",
+        }
+
+
+class TestJsonFormatter:
+
+    def _format(self, *args, **extra):
+        record = logging.LogRecord("app.test", logging.INFO, __file__, 1, "Received %s", args, None)
+        record.__dict__.update(extra)
+        return json.loads(JsonFormatter().format(record))
+
+    def test_json_line(self):
+        token = REQUEST_ID.set("req-1")
+        try:
+            entry = self._format({"pdf_images": ["A" * 1000]}, shipment_id="s1")
+        finally:
+            REQUEST_ID.reset(token)
+
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "app.test"
+        assert entry["request_id"] == "req-1"
+        assert entry["message"] == "Received {'pdf_images': ['<base64 1000 chars>']}"
+        assert entry["shipment_id"] == "s1"
+
+    def test_configure_logging_writes_json_lines(self):
+        stream = io.StringIO()
+        logger = logging.getLogger("app")
+        handlers, level = logger.handlers, logger.level
+        try:
+            configure_logging("info", stream=stream)
+            logging.getLogger("app.test").info("Processed %d files", 3)
+            logging.getLogger("app.test").debug("Not logged")
+        finally:
+            logger.handlers = handlers
+            logger.setLevel(level)
+
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 1
+        assert json.loads(lines[0])["message"] == "Processed 3 files"
+
+
+class TestLazyLogging:
+
+    def test_disabled_messages_are_not_formatted(self):
+        class Expensive:
+            calls = 0
+
+            def __str__(self):
+                Expensive.calls += 1
+                return "expensive"
+
+        app_logger = logging.getLogger("app")
+        level = app_logger.level
+        app_logger.setLevel(logging.INFO)
+        try:
+            logging.getLogger("app.test").debug("Value: %s", Expensive())
+        finally:
+            app_logger.setLevel(level)
+
+        assert Expensive.calls == 0
+
+
+class TestRequestIds:
+
+    def test_response_carries_a_request_id(self):
+        response = client.get("/")
+
+        assert len(response.headers[REQUEST_ID_HEADER]) == 32
+
+    def test_client_request_id_is_reused(self):
+        response = client.get("/", headers={REQUEST_ID_HEADER: "client-id-1"})
+
+        assert response.headers[REQUEST_ID_HEADER] == "client-id-1"
+
+    def test_unsafe_request_id_is_replaced(self):
+        response = client.get("/", headers={REQUEST_ID_HEADER: "x" * 200})
+
+        assert response.headers[REQUEST_ID_HEADER] != "x" * 200
+
+    @patch("app.api.routes.extract_field_from_document")
+    def test_request_id_reaches_the_parsing_pool(self, mock_extract, app_records):
+        def extract(document_data, progress=None):
+            logging.getLogger("app.services.llm_service").debug("Extracting")
+            return {"text_extraction": {}}
+
+        mock_extract.side_effect = extract
+
+        with open(SAMPLE_PDF, "rb") as f:
+            client.post(
+                "/process-documents",
+                files={"files": ("bl.pdf", f, "application/pdf")},
+                headers={REQUEST_ID_HEADER: "trace-42"},
+            )
+
+        loggers = {record.name for record in app_records if record.request_id == "trace-42"}
+        assert {"app.api.routes", "app.services.document_processor", "app.services.llm_service"} <= loggers
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import subprocess
+import sys
+from unittest.mock import Mock, patch
+
+import openai
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from app.core.metrics import timed_stage
+from app.main import app
+from app.services import llm_gateway
+from app.services.llm_gateway import create_chat_completion
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "sample_bill_of_lading.pdf")
+
+client = TestClient(app)
+
+
+def _value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestTimedStage:
+
+    def test_records_duration(self):
+        before = _value("pipeline_stage_duration_seconds_count", stage="test_stage")
+
+        with timed_stage("test_stage"):
+            pass
+
+        assert _value("pipeline_stage_duration_seconds_count", stage="test_stage") == before + 1
+
+    def test_counts_errors(self):
+        before = _value("pipeline_stage_errors_total", stage="test_failing_stage")
+
+        with pytest.raises(ValueError):
+            with timed_stage("test_failing_stage"):
+                raise ValueError("boom")
+
+        assert _value("pipeline_stage_errors_total", stage="test_failing_stage") == before + 1
+        assert _value("pipeline_stage_duration_seconds_count", stage="test_failing_stage") >= 1
+
+
+class TestMetricsEndpoint:
+
+    @patch("app.api.routes.extract_field_from_document")
+    def test_pipeline_stages_and_requests_are_exposed(self, mock_extract):
+        mock_extract.return_value = {"text_extraction": {}}
+        uploads = _value("pipeline_stage_duration_seconds_count", stage="upload_write")
+        parses = _value("pipeline_stage_duration_seconds_count", stage="pdf_parse")
+
+        with open(SAMPLE_PDF, "rb") as f:
+            client.post("/process-documents", files={"files": ("bl.pdf", f, "application/pdf")})
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "pipeline_stage_duration_seconds_bucket" in response.text
+        assert _value("pipeline_stage_duration_seconds_count", stage="upload_write") == uploads + 1
+        assert _value("pipeline_stage_duration_seconds_count", stage="pdf_parse") == parses + 1
+        assert _value(
+            "http_request_duration_seconds_count", method="POST", route="/process-documents", status="200",
+        ) >= 1
+        assert _value("http_requests_in_flight") == 0
+
+    def test_routes_are_labelled_by_template(self):
+        client.get("/jobs/some-unknown-job")
+
+        assert _value("http_request_duration_seconds_count", method="GET", route="/jobs/{job_id}", status="404") >= 1
+
+    def test_worker_processes_are_aggregated(self, tmp_path):
+        # Metric storage is chosen at import, so each worker is a fresh interpreter
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(tmp_path), OPENAI_API_KEY="sk-test")
+        record = "from app.core.metrics import CACHE_LOOKUPS; CACHE_LOOKUPS.labels('hit').inc()"
+        render = "from app.core.metrics import render_metrics; print(render_metrics()[0].decode())"
+        root = os.path.join(os.path.dirname(__file__), "..")
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", record], env=env, cwd=root, check=True)
+
+        output = subprocess.run([sys.executable, "-c", render], env=env, cwd=root, check=True,
+                                capture_output=True, text=True).stdout
+
+        assert 'extraction_cache_lookups_total{result="hit"} 2.0' in output
+
+
+class TestLLMMetrics:
+
+    def _run(self, create):
+        fake = Mock()
+        fake.chat.completions.create = create
+        with patch.object(llm_gateway, "get_client", return_value=fake), \
+                patch.object(llm_gateway.settings, "LLM_REQUESTS_PER_MINUTE", 0):
+            return asyncio.run(create_chat_completion(model="metrics-model", messages=[]))
+
+    def test_tokens_and_durations(self):
+        async def create(model, messages):
+            response = Mock()
+            response.usage.prompt_tokens = 120
+            response.usage.completion_tokens = 30
+            return response
+
+        self._run(create)
+        self._run(create)
+
+        assert _value("llm_tokens_total", model="metrics-model", kind="prompt") == 240
+        assert _value("llm_tokens_total", model="metrics-model", kind="completion") == 60
+        assert _value("llm_request_duration_seconds_count", model="metrics-model", outcome="success") == 2
+        assert _value("llm_queue_wait_seconds_count", model="metrics-model") == 2
+        assert _value("llm_requests_in_flight", model="metrics-model") == 0
+
+    def test_errors_by_type(self):
+        async def create(model, messages):
+            raise openai.BadRequestError("bad", response=Mock(status_code=400, headers={}), body=None)
+
+        with pytest.raises(openai.BadRequestError):
+            self._run(create)
+
+        assert _value("llm_errors_total", model="metrics-model", error="BadRequestError") == 1
+        assert _value("llm_requests_in_flight", model="metrics-model") == 0
@@ -0,0 +1,79 @@
+import subprocess
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.core.config import settings
+from app.utils import pdf_backends
+from app.utils.pdf_backends import PDFTextBackend, PdftotextBackend, PyPDF2Backend, get_pdf_text_backend
+from app.utils.pdf_utils import extract_text_from_pdf
+
+SAMPLE_PDF = "tests/sample_bill_of_lading.pdf"
+
+
+class FailingBackend(PDFTextBackend):
+    name = "failing"
+
+    def extract_pages(self, file_path):
+        raise RuntimeError("cannot parse")
+
+
+class TestBackends:
+
+    def test_pypdf2_pages(self):
+        pages = PyPDF2Backend().extract_pages(SAMPLE_PDF)
+
+        assert len(pages) == 1
+        assert "BOL-2024-001234" in pages[0]
+
+    def test_pypdfium2_matches_pypdf2(self):
+        pytest.importorskip("pypdfium2")
+
+        pages = pdf_backends.PdfiumBackend().extract_pages(SAMPLE_PDF)
+
+        assert [page.split() for page in pages] == [page.split() for page in PyPDF2Backend().extract_pages(SAMPLE_PDF)]
+
+    def test_pdftotext_splits_pages_on_form_feeds(self):
+        with patch("shutil.which", return_value="/usr/bin/pdftotext"), \
+                patch("subprocess.run", return_value=Mock(stdout=b"page one\n\fpage two\n\f")) as mock_run:
+            pages = PdftotextBackend().extract_pages(SAMPLE_PDF)
+
+        assert pages == ["page one\n", "page two\n"]
+        assert mock_run.call_args.args[0] == ["/usr/bin/pdftotext", "-q", "-enc", "UTF-8", SAMPLE_PDF, "-"]
+
+
+class TestGetPDFTextBackend:
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            get_pdf_text_backend("nope")
+
+    def test_missing_backend_falls_back_to_pypdf2(self):
+        with patch.dict(pdf_backends._backends, clear=True), \
+                patch("shutil.which", return_value=None):
+            backend = get_pdf_text_backend("pdftotext")
+
+        assert isinstance(backend, PyPDF2Backend)
+
+    def test_configured_backend_is_used(self):
+        backend = Mock(spec=PDFTextBackend)
+        backend.extract_pages.return_value = ["Bill of Lading Number: FROM-THE-BACKEND " * 3]
+
+        with patch.object(settings, "PDF_TEXT_BACKEND", "mock"), \
+                patch.dict(pdf_backends.PDF_TEXT_BACKENDS, {"mock": lambda: backend}), \
+                patch.dict(pdf_backends._backends, clear=True):
+            text = extract_text_from_pdf(SAMPLE_PDF)
+
+        assert "FROM-THE-BACKEND" in text
+
+    def test_failing_backend_falls_back_to_pypdf2(self):
+        with patch("app.utils.pdf_utils.get_pdf_text_backend", return_value=FailingBackend()):
+            text = extract_text_from_pdf(SAMPLE_PDF)
+
+        assert "BOL-2024-001234" in text
+
+    def test_pdftotext_errors_surface_as_failures(self):
+        with patch("shutil.which", return_value="/usr/bin/pdftotext"), \
+                patch("subprocess.run", side_effect=subprocess.CalledProcessError(1, "pdftotext")):
+            with pytest.raises(subprocess.CalledProcessError):
+                PdftotextBackend().extract_pages(SAMPLE_PDF)
@@ -0,0 +1,441 @@
+import base64
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+import PyPDF2
+from PIL import Image, ImageDraw
+
+from app.core.config import settings
+from app.services.document_processor import encode_pdf_images, merge_file_results, process_documents
+from app.utils.image_utils import crop_whitespace
+from app.utils.pdf_utils import (
+    BLANK_PAGE, SCANNED_PAGE, TEXT_PAGE, RenderedPages, classify_page, extract_text_from_pdf, ocr_pages,
+    encode_vision_pages, pdf_to_images_base64, select_pages, tesseract_text,
+)
+
+
+def _tesseract_data(text, confidence=90):
+    # pytesseract.image_to_data output with one word per entry, line by line
+    data = {"text": [], "conf": [], "block_num": [], "par_num": [], "line_num": []}
+    for line_num, line in enumerate(text.splitlines(), start=1):
+        for word in line.split():
+            for key, value in zip(data, (word, confidence, 1, 1, line_num)):
+                data[key].append(value)
+    return data
+
+
+def _as_tesseract_data(fake_ocr):
+    # Adapt a fake image_to_string(image, timeout) to image_to_data
+    return lambda image, output_type, timeout: _tesseract_data(fake_ocr(image, timeout))
+
+
+def _process_with_images(file_paths):
+    # process_documents, then the vision encoding extract_field_from_document does when the vision call runs
+    files = process_documents(file_paths)["files"]
+    encode_pdf_images(files)
+    return merge_file_results(files)
+
+
+def _letter_page(dpi):
+    return Image.new("RGB", (int(8.5 * dpi), int(11 * dpi)), "white")
+
+
+@pytest.fixture
+def scanned_pdf(tmp_path):
+    # An image-only PDF has no text layer, so it takes the OCR path
+    path = tmp_path / "scan.pdf"
+    pages = [_letter_page(50), _letter_page(50)]
+    pages[0].save(path, save_all=True, append_images=pages[1:])
+    return str(path)
+
+
+class TestSharedRasterization:
+
+    def test_scanned_pdf_is_rendered_once(self, scanned_pdf):
+        def render(file_path, dpi):
+            return [_letter_page(dpi), _letter_page(dpi)]
+
+        with patch("app.utils.pdf_utils.render_pdf_pages", side_effect=render) as mock_render, \
+                patch.object(settings, "OCR_WORKERS", 1), \
+                patch.object(settings, "VISION_MAX_LONG_EDGE", 0), \
+                patch("pytesseract.image_to_data", return_value=_tesseract_data("BILL OF LADING COSU534343282")) as mock_ocr:
+            result = _process_with_images([scanned_pdf])
+
+        mock_render.assert_called_once_with(scanned_pdf, dpi=settings.OCR_DPI)
+        assert mock_ocr.call_count == 2
+        assert "COSU534343282" in result["pdf_text"]
+
+        # Vision pages are downscaled in memory to VISION_DPI
+        assert len(result["pdf_images"]) == 2
+        image = Image.open(io.BytesIO(base64.b64decode(result["pdf_images"][0])))
+        assert image.size == (int(8.5 * settings.VISION_DPI), int(11 * settings.VISION_DPI))
+
+    def test_text_pdf_is_rendered_at_vision_dpi(self):
+        pdf_path = "tests/sample_bill_of_lading.pdf"
+
+        with patch("app.utils.pdf_utils.render_pdf_pages", return_value=[_letter_page(settings.VISION_DPI)]) as mock_render, \
+                patch("pytesseract.image_to_data") as mock_ocr:
+            result = _process_with_images([pdf_path])
+
+        mock_render.assert_called_once_with(pdf_path, dpi=settings.VISION_DPI)
+        mock_ocr.assert_not_called()
+        assert len(result["pdf_images"]) == 1
+
+
+class TestTesseractText:
+
+    def test_lines_paragraphs_and_confidence(self):
+        data = {
+            "text": ["", "BILL", "OF", "LADING", "Consignee:", "ACME", "", "Page"],
+            "conf": [-1, 90, 95, 85, 70, 80, -1, 60],
+            "block_num": [1, 1, 1, 1, 1, 1, 2, 2],
+            "par_num": [1, 1, 1, 1, 1, 1, 1, 1],
+            "line_num": [1, 1, 1, 1, 2, 2, 1, 1],
+        }
+
+        text, confidence = tesseract_text(data)
+
+        assert text == "BILL OF LADING\nConsignee: ACME\n\nPage"
+        assert confidence == 80.0
+
+    def test_page_without_words(self):
+        assert tesseract_text({"text": [""], "conf": [-1], "block_num": [1], "par_num": [1], "line_num": [1]}) == ("", None)
+
+    def test_confidence_reaches_the_file_result(self, scanned_pdf):
+        with patch("app.utils.pdf_utils.render_pdf_pages", return_value=[_letter_page(20), _letter_page(20)]), \
+                patch.object(settings, "OCR_WORKERS", 1), \
+                patch("pytesseract.image_to_data", return_value=_tesseract_data("BILL OF LADING", confidence=64)):
+            result = _process_with_images([scanned_pdf])
+
+        assert result["files"][0]["ocr_confidence"] == 64.0
+
+
+class TestParallelOCR:
+
+    @staticmethod
+    def _numbered_pages(count):
+        # Encode the page number in the image width so the fake OCR can read it back
+        return [Image.new("RGB", (10 + i, 10), "white") for i in range(count)]
+
+    def test_pages_run_in_parallel_and_keep_order(self):
+        def fake_ocr(image, timeout):
+            page = image.width - 10
+            # Earlier pages finish last, so completion order is reversed
+            time.sleep(0.05 * (6 - page))
+            return f"page {page}"
+
+        with ThreadPoolExecutor(max_workers=6) as executor, \
+                patch("app.utils.pdf_utils.get_ocr_executor", return_value=executor), \
+                patch.object(settings, "OCR_WORKERS", 6), \
+                patch("pytesseract.image_to_data", side_effect=_as_tesseract_data(fake_ocr)):
+            start = time.perf_counter()
+            texts = [text for text, _ in ocr_pages(self._numbered_pages(6))]
+            elapsed = time.perf_counter() - start
+
+        assert texts == [f"page {i}" for i in range(6)]
+        assert elapsed < 0.6
+
+    def test_timed_out_page_is_skipped(self):
+        def fake_ocr(image, timeout):
+            if image.width == 11:
+                raise RuntimeError("Tesseract process timeout")
+            return "text"
+
+        with patch.object(settings, "OCR_WORKERS", 1), \
+                patch("pytesseract.image_to_data", side_effect=_as_tesseract_data(fake_ocr)):
+            texts = [text for text, _ in ocr_pages(self._numbered_pages(3))]
+
+        assert texts == ["text", "", "text"]
+
+    def test_progress_reported_as_pages_finish(self):
+        def fake_ocr(image, timeout):
+            page = image.width - 10
+            time.sleep(0.05 * (3 - page))
+            return f"page {page}"
+
+        events = []
+        with ThreadPoolExecutor(max_workers=3) as executor, \
+                patch("app.utils.pdf_utils.get_ocr_executor", return_value=executor), \
+                patch.object(settings, "OCR_WORKERS", 3), \
+                patch("pytesseract.image_to_data", side_effect=_as_tesseract_data(fake_ocr)):
+            results = ocr_pages(self._numbered_pages(3), progress=lambda event, data: events.append((event, data)))
+
+        assert [text for text, _ in results] == ["page 0", "page 1", "page 2"]
+        assert events == [
+            ("ocr_page", {"page": 3, "done": 1, "pages": 3}),
+            ("ocr_page", {"page": 2, "done": 2, "pages": 3}),
+            ("ocr_page", {"page": 1, "done": 3, "pages": 3}),
+        ]
+
+
+def _text_page(dpi, seed=0):
+    # A scan-like letter page: noisy off-white paper with lines of dark "text"
+    # in the middle and blank margins around it
+    import random
+
+    rng = random.Random(seed)
+    size = (int(8.5 * dpi), int(11 * dpi))
+    image = Image.effect_noise(size, 6).point(lambda p: min(255, p + 120)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for y in range(dpi * 2, dpi * 8, 12):
+        for x in range(dpi, int(dpi * 7), 8):
+            if rng.random() < 0.5:
+                draw.rectangle((x, y, x + 5, y + 8), fill=(40, 40, 40))
+    return image
+
+
+class TestVisionImageEncoding:
+
+    def _encode_base64(self, page_images, **overrides):
+        with patch("app.utils.pdf_utils.render_pdf_pages", return_value=page_images), \
+                patch.multiple(settings, **overrides):
+            return pdf_to_images_base64("scan.pdf", RenderedPages("scan.pdf"))
+
+    def _encode(self, page_images, **overrides):
+        images = self._encode_base64(page_images, **overrides)
+        return [Image.open(io.BytesIO(base64.b64decode(image))) for image in images]
+
+    def test_pages_are_cropped_grayscale_jpeg_within_long_edge(self):
+        [image] = self._encode(
+            [_text_page(settings.VISION_DPI)],
+            VISION_IMAGE_FORMAT="JPEG", VISION_GRAYSCALE=True,
+            VISION_CROP_WHITESPACE=True, VISION_MAX_LONG_EDGE=800, VISION_MAX_REQUEST_BYTES=0,
+        )
+
+        assert image.format == "JPEG"
+        assert image.mode == "L"
+        assert max(image.size) <= 800
+        # Cropping the margins changes the letter aspect ratio
+        assert abs(image.width / image.height - 8.5 / 11) > 0.05
+
+    def test_compact_encoding_is_much_smaller_than_png(self):
+        page = _text_page(settings.VISION_DPI)
+        [png] = self._encode_base64([page], VISION_IMAGE_FORMAT="PNG", VISION_GRAYSCALE=False,
+                                    VISION_CROP_WHITESPACE=False, VISION_MAX_LONG_EDGE=0, VISION_MAX_REQUEST_BYTES=0)
+        [compact] = self._encode_base64([page], VISION_IMAGE_FORMAT="WEBP", VISION_GRAYSCALE=True,
+                                        VISION_CROP_WHITESPACE=True, VISION_MAX_LONG_EDGE=1024, VISION_MAX_REQUEST_BYTES=0)
+
+        assert len(compact) < len(png) / 4
+
+    def test_budget_downsamples_then_drops_pages(self):
+        pages = [_text_page(settings.VISION_DPI, seed=i) for i in range(4)]
+        unlimited = self._encode_base64(pages, VISION_MAX_REQUEST_BYTES=0)
+
+        budget = int(len(unlimited[0]) * 1.5)
+        limited = self._encode_base64(pages, VISION_MIN_LONG_EDGE=300, VISION_MAX_REQUEST_BYTES=budget)
+        sizes = [Image.open(io.BytesIO(base64.b64decode(image))).size for image in limited]
+
+        assert 1 <= len(limited) < len(pages)
+        assert sum(len(image) for image in limited) <= budget
+        # The first page fits as is; the next ones were downsampled to squeeze in
+        assert max(sizes[-1]) < max(sizes[0])
+
+    def test_byte_budget_spans_pdfs_and_downsamples_later_ones(self):
+        pages = {"a.pdf": [_text_page(settings.VISION_DPI, seed=i) for i in range(3)],
+                 "b.pdf": [_text_page(settings.VISION_DPI, seed=i + 10) for i in range(3)]}
+        render = lambda file_path, dpi, **kwargs: pages[file_path]
+
+        with patch("app.utils.pdf_utils.render_pdf_pages", side_effect=render), \
+                patch.multiple(settings, VISION_MAX_REQUEST_BYTES=0):
+            [unlimited] = encode_vision_pages([RenderedPages("a.pdf")])
+        budget = int(len(unlimited[0][1]) * 2.5)
+
+        with patch("app.utils.pdf_utils.render_pdf_pages", side_effect=render), \
+                patch.multiple(settings, VISION_MIN_LONG_EDGE=300, VISION_MAX_REQUEST_BYTES=budget):
+            first, second = encode_vision_pages([RenderedPages("a.pdf"), RenderedPages("b.pdf")])
+
+        sizes = [Image.open(io.BytesIO(base64.b64decode(image))).size for _, image in first + second]
+        # Both PDFs' first pages go in before either's second; later pages are downsampled, not cut
+        assert [index for index, _ in first][:1] == [0] and [index for index, _ in second][:1] == [0]
+        assert len(first) + len(second) >= 3
+        assert sum(len(image) for _, image in first + second) <= budget
+        assert min(max(size) for size in sizes) < max(sizes[0])
+
+    def test_blank_page_is_not_cropped_away(self):
+        page = _letter_page(50)
+        assert crop_whitespace(page).size == page.size
+
+
+SAMPLE_PDF = "tests/sample_bill_of_lading.pdf"
+
+
+def _scan_page(tmp_path):
+    path = tmp_path / "page.pdf"
+    _letter_page(50).save(path)
+    return PyPDF2.PdfReader(str(path)).pages[0]
+
+
+@pytest.fixture
+def mixed_pdf(tmp_path):
+    # A text page, a scanned page and a blank page
+    writer = PyPDF2.PdfWriter()
+    writer.add_page(PyPDF2.PdfReader(SAMPLE_PDF).pages[0])
+    writer.add_page(_scan_page(tmp_path))
+    writer.add_blank_page(612, 792)
+    path = tmp_path / "mixed.pdf"
+    with open(path, "wb") as f:
+        writer.write(f)
+    return str(path)
+
+
+class TestPageClassification:
+
+    def _classify(self, page):
+        return classify_page(page, page.extract_text() or "")
+
+    def test_text_scanned_and_blank_pages(self, mixed_pdf):
+        pages = PyPDF2.PdfReader(mixed_pdf).pages
+
+        assert [self._classify(page) for page in pages] == [TEXT_PAGE, SCANNED_PAGE, BLANK_PAGE]
+
+    def test_scan_with_a_text_layer_depends_on_glyph_density(self, tmp_path):
+        # A scan with the sample's text layer on top, like a searchable PDF
+        page = _scan_page(tmp_path)
+        page.merge_page(PyPDF2.PdfReader(SAMPLE_PDF).pages[0])
+
+        assert self._classify(page) == TEXT_PAGE
+        with patch.object(settings, "OCR_MIN_GLYPH_DENSITY", 100.0):
+            assert self._classify(page) == SCANNED_PAGE
+
+
+class TestMixedDocuments:
+
+    def test_only_scanned_pages_are_rendered_and_ocrd(self, mixed_pdf):
+        events = []
+
+        with patch("app.utils.pdf_utils.render_pdf_pages", return_value=[_letter_page(50)]) as mock_render, \
+                patch.object(settings, "OCR_WORKERS", 1), \
+                patch("pytesseract.image_to_data", return_value=_tesseract_data("SCANNED PAGE TEXT")) as mock_ocr:
+            text = extract_text_from_pdf(mixed_pdf, progress=lambda event, data: events.append(data))
+
+        mock_render.assert_called_once_with(mixed_pdf, dpi=settings.OCR_DPI, first_page=2, last_page=2)
+        assert mock_ocr.call_count == 1
+        assert events == [{"page": 2, "done": 1, "pages": 1}]
+        # Page texts stay in page order
+        assert "BOL-2024-001234" in text
+        assert text.index("BOL-2024-001234") < text.index("SCANNED PAGE TEXT")
+
+    def test_vision_renders_the_remaining_pages(self, mixed_pdf):
+        def render(file_path, dpi, first_page=None, last_page=None):
+            count = 3 if first_page is None else last_page - first_page + 1
+            return [_letter_page(dpi) for _ in range(count)]
+
+        with patch("app.utils.pdf_utils.render_pdf_pages", side_effect=render) as mock_render, \
+                patch.object(settings, "OCR_WORKERS", 1), \
+                patch("pytesseract.image_to_data", return_value=_tesseract_data("SCANNED PAGE TEXT")):
+            result = _process_with_images([mixed_pdf])
+
+        assert [c.kwargs for c in mock_render.call_args_list] == [
+            {"dpi": settings.OCR_DPI, "first_page": 2, "last_page": 2},
+            {"dpi": settings.VISION_DPI, "first_page": 1, "last_page": 1},
+            {"dpi": settings.VISION_DPI, "first_page": 3, "last_page": 3},
+        ]
+        assert len(result["pdf_images"]) == 3
+        assert result["pdf_page_count"] == 3
+
+    def test_text_layer_is_kept_when_ocr_fails(self, mixed_pdf):
+        with patch("app.utils.pdf_utils.render_pdf_pages", side_effect=RuntimeError("poppler missing")):
+            text = extract_text_from_pdf(mixed_pdf)
+
+        assert "BOL-2024-001234" in text
+
+
+@pytest.fixture
+def long_scanned_pdf(tmp_path):
+    path = tmp_path / "long_scan.pdf"
+    pages = [_letter_page(20) for _ in range(10)]
+    pages[0].save(path, save_all=True, append_images=pages[1:])
+    return str(path)
+
+
+class TestPageWindows:
+
+    def _render(self, pages, cached):
+        def render(file_path, dpi, first_page=None, last_page=None):
+            # Pages still cached when the next window is rendered
+            cached.append(len(pages._pages))
+            return [_letter_page(10) for _ in range(last_page - first_page + 1)]
+        return render
+
+    def test_long_document_is_rendered_a_window_at_a_time(self, long_scanned_pdf):
+        pages = RenderedPages(long_scanned_pdf)
+        cached = []
+
+        with patch("app.utils.pdf_utils.render_pdf_pages", side_effect=self._render(pages, cached)) as mock_render, \
+                patch.multiple(settings, OCR_WORKERS=1, PDF_RENDER_WINDOW_PAGES=4, VISION_MAX_PAGES=2), \
+                patch("pytesseract.image_to_data", return_value=_tesseract_data("SCANNED PAGE TEXT")) as mock_ocr:
+            extract_text_from_pdf(long_scanned_pdf, pages)
+
+        assert [(c.kwargs["first_page"], c.kwargs["last_page"]) for c in mock_render.call_args_list] == [
+            (1, 4), (5, 8), (9, 10),
+        ]
+        assert mock_ocr.call_count == 10
+        # Only the two vision pages outlive their window, downscaled to VISION_DPI
+        assert cached == [0, 2, 2]
+        assert sorted(pages._pages) == pages.vision_pages == [0, 1]
+        scale = settings.VISION_DPI / settings.OCR_DPI
+        for dpi, image in pages._pages.values():
+            assert dpi == settings.VISION_DPI
+            assert image.size == (round(_letter_page(10).width * scale), round(_letter_page(10).height * scale))
+
+    def test_ocr_and_vision_page_limits(self, long_scanned_pdf):
+        with patch("app.utils.pdf_utils.render_pdf_pages", side_effect=self._render(RenderedPages(""), [])) as mock_render, \
+                patch.multiple(settings, OCR_WORKERS=1, PDF_MAX_OCR_PAGES=3, VISION_MAX_PAGES=5,
+                               VISION_MAX_LONG_EDGE=0), \
+                patch("pytesseract.image_to_data", return_value=_tesseract_data("SCANNED PAGE TEXT")) as mock_ocr:
+            result = _process_with_images([long_scanned_pdf])
+
+        assert mock_ocr.call_count == 3
+        assert len(result["pdf_images"]) == 5
+        assert result["pdf_page_count"] == 10
+        # The OCR'd pages are reused; vision renders pages 4-5 only
+        assert [(c.kwargs["dpi"], c.kwargs["first_page"], c.kwargs["last_page"]) for c in mock_render.call_args_list] == [
+            (settings.OCR_DPI, 1, 3), (settings.VISION_DPI, 4, 5),
+        ]
+
+    def test_ocr_takes_pages_from_a_generator_as_workers_free_up(self):
+        finished = []
+        ahead = []
+
+        def images():
+            for i in range(12):
+                # Pages taken but not yet OCR'd
+                ahead.append(i - len(finished))
+                yield Image.new("RGB", (10 + i, 10), "white")
+
+        def fake_ocr(image, timeout):
+            time.sleep(0.01)
+            finished.append(image.width)
+            return f"page {image.width - 10}"
+
+        with ThreadPoolExecutor(max_workers=2) as executor, \
+                patch("app.utils.pdf_utils.get_ocr_executor", return_value=executor), \
+                patch.object(settings, "OCR_WORKERS", 2), \
+                patch("pytesseract.image_to_data", side_effect=_as_tesseract_data(fake_ocr)):
+            texts = [text for text, _ in ocr_pages(images(), page_numbers=list(range(1, 13)))]
+
+        assert texts == [f"page {i}" for i in range(12)]
+        assert max(ahead) <= 4
+
+
+class TestSelectPages:
+
+    def test_all_pages_within_the_limit(self):
+        assert select_pages([0, 1, 2], ["", "", ""], 5) == [0, 1, 2]
+        assert select_pages(list(range(30)), [], 0) == list(range(30))
+
+    def test_first_pages_then_pages_with_field_labels(self):
+        texts = ["cover"] * 10
+        texts[7] = "Consignee: ACME\nContainer No: MSCU1234567"
+        texts[5] = "Weight: 1200"
+
+        with patch.object(settings, "PDF_FIRST_PAGES", 2):
+            assert select_pages(list(range(10)), texts, 4) == [0, 1, 5, 7]
+            assert select_pages(list(range(10)), texts, 3) == [0, 1, 7]
+
+    def test_pages_without_labels_fill_in_page_order(self):
+        with patch.object(settings, "PDF_FIRST_PAGES", 1):
+            assert select_pages([2, 4, 6, 8], [""] * 10, 3) == [2, 4, 6]
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import re
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app.services import llm_gateway, llm_service
+from app.services.document_processor import process_documents
+from app.services.llm_service import extract_field_from_document
+from app.services.prompt_builder import OMITTED_MARKER, build_document_text, count_tokens
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "sample_bill_of_lading.pdf")
+DEMO_XLSX = os.path.join(os.path.dirname(__file__), "..", "testDocs", "Demo-Invoice-PackingList_1.xlsx")
+
+# Bill of lading terms and conditions, the bulk of long multi-page uploads
+TERMS_PAGE = "\n".join([
+    "TERMS AND CONDITIONS OF CARRIAGE",
+    "1. The Carrier shall not be liable for loss of or damage to the goods unless notified in writing.",
+    "2. The Merchant warrants that the particulars furnished are correct and indemnifies the Carrier.",
+    "3. Goods may be stowed in or on deck of the vessel at the Carrier's discretion without notice.",
+    "4. Freight shall be deemed earned on receipt of the goods and is payable in full whatever happens.",
+    "5. The Carrier may substitute vessels, transship, lighter or land the goods at any place.",
+] * 6)
+
+# Field label followed by its value, as a model reading the prompt would find them
+FIELD_PATTERNS = {
+    "bill_of_lading_number": r"(?:Bill of Lading Number|B/L NO\.?):?\s*(\S+)",
+    "container_number": r"(?:Container Number|CNTR NO)[:\t ]+([A-Z]{4}\d{7})",
+    "consignee_name": r"Consignee Name:\s*(.+)",
+    "consignee_address": r"Consignee Address:\s*(.+)",
+    "date_of_export": r"Date of Export:\s*(\S+)",
+    "date": r"\nDate:\s*(\S+)",
+}
+
+
+def _reading_client(prompts):
+    async def create(model, messages, response_format):
+        prompt = messages[1]["content"]
+        prompts.append(prompt)
+        fields = {name: None for name in llm_service.EXTRACTION_SCHEMA["json_schema"]["schema"]["properties"]}
+        for name, pattern in FIELD_PATTERNS.items():
+            match = re.search(pattern, prompt)
+            fields[name] = match.group(1).strip() if match else None
+        response = Mock()
+        response.choices = [Mock()]
+        response.choices[0].message.content = json.dumps(fields)
+        return response
+
+    client = Mock()
+    client.chat.completions.create = create
+    return client
+
+
+class TestBuildDocumentText:
+
+    def test_text_within_budget_is_unchanged(self):
+        sections = [("PDF Content", "Bill of Lading Number: BL1"), ("Excel Content", "Item\tQty")]
+        assert build_document_text(sections, budget=1000) == (
+            "PDF Content:\nBill of Lading Number: BL1\n\nExcel Content:\nItem\tQty\n\n"
+        )
+
+    def test_long_text_is_cut_to_relevant_chunks_within_budget(self):
+        header = "BILL OF LADING\nBill of Lading Number: BL-77\nContainer Number: MSCU1234567\n"
+        consignee = "Consignee Name: ACME Imports\nConsignee Address: 1 Harbor Rd\n"
+        text = header + TERMS_PAGE * 40 + consignee + TERMS_PAGE * 40
+
+        document_text = build_document_text([("PDF Content", text)], budget=1000)
+
+        assert count_tokens(document_text) <= 1000
+        assert "Bill of Lading Number: BL-77" in document_text
+        assert "Consignee Address: 1 Harbor Rd" in document_text
+        assert OMITTED_MARKER in document_text
+
+    def test_text_without_line_breaks_is_still_chunked(self):
+        text = "Bill of Lading Number: BL-77 " + "lorem ipsum dolor " * 20000
+
+        document_text = build_document_text([("PDF Content", text)], budget=500)
+
+        assert 0 < count_tokens(document_text) <= 500
+        assert "BL-77" in document_text
+
+
+class TestAccuracyUnderBudget:
+
+    @pytest.fixture
+    def long_upload(self):
+        document_data = process_documents([SAMPLE_PDF, DEMO_XLSX])
+        # Simulate a multi-hundred-page upload: the bill of lading followed by pages of terms
+        document_data["pdf_text"] += "\n".join([TERMS_PAGE] * 300)
+        return document_data
+
+    def _extract(self, document_data, budget):
+        prompts = []
+        with patch.object(llm_gateway, "get_client", return_value=_reading_client(prompts)), \
+                patch.object(llm_service.settings, "PROMPT_TOKEN_BUDGET", budget):
+            result = asyncio.run(extract_field_from_document(document_data))
+        return result["text_extraction"], prompts[0]
+
+    def test_fields_match_full_text_extraction(self, long_upload):
+        full, full_prompt = self._extract(long_upload, budget=0)
+        budgeted, budgeted_prompt = self._extract(long_upload, budget=2000)
+
+        assert full["bill_of_lading_number"] == "BOL-2024-001234"
+        assert full["container_number"] == "ABCD1234567"
+        assert budgeted == full
+        assert count_tokens(budgeted_prompt) < 2000 + count_tokens(llm_service.TEXT_PROMPT_TEMPLATE)
+        assert count_tokens(full_prompt) > 50 * count_tokens(budgeted_prompt)
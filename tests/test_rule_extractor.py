@@ -0,0 +1,85 @@
+import pytest
+
+from app.services.rule_extractor import (
+    extract_fields_with_rules,
+    iso6346_check_digit,
+    is_valid_container_number,
+    normalize_date,
+)
+
+
+class TestContainerNumbers:
+
+    @pytest.mark.parametrize("number", ["CSQU3054383", "MSKU2914171", "TGHU7763172", "HLXU1000060"])
+    def test_valid_check_digits(self, number):
+        assert is_valid_container_number(number)
+
+    def test_check_digit_ten_wraps_to_zero(self):
+        assert iso6346_check_digit("HLXU100006") == 0
+
+    @pytest.mark.parametrize("number", ["CSQU3054384", "ABCD1234567", "CSQU305438"])
+    def test_invalid_numbers(self, number):
+        assert not is_valid_container_number(number)
+
+    def test_unlabelled_number_found_by_check_digit(self):
+        fields = extract_fields_with_rules("Marks: CSQU 305438 3 / seal 123\nPO 1234567")
+
+        assert fields["container_number"] == {"value": "CSQU3054383", "confidence": 0.9}
+
+    def test_labelled_number_with_bad_check_digit_is_low_confidence(self):
+        fields = extract_fields_with_rules("CNTR NO\tMSCU1234567")
+
+        assert fields["container_number"]["value"] == "MSCU1234567"
+        assert fields["container_number"]["confidence"] < 0.8
+
+    def test_several_containers_are_ambiguous(self):
+        fields = extract_fields_with_rules("CSQU3054383\nMSKU2914171")
+
+        assert fields["container_number"]["confidence"] < 0.8
+
+
+class TestDates:
+
+    @pytest.mark.parametrize("text, expected", [
+        ("2024-01-15", "2024-01-15"),
+        ("2024/1/5", "2024-01-05"),
+        ("15-Jan-2024", "2024-01-15"),
+        ("15 JANUARY 24", "2024-01-15"),
+        ("Jan 15th, 2024", "2024-01-15"),
+        ("25/12/2024", "2024-12-25"),
+        ("12/25/2024", "2024-12-25"),
+    ])
+    def test_formats(self, text, expected):
+        assert normalize_date(text) == (expected, 0.95)
+
+    def test_day_month_ambiguity_is_low_confidence(self):
+        assert normalize_date("03/04/2024") == ("2024-04-03", 0.5)
+
+    def test_invalid_date(self):
+        assert normalize_date("31/02/2024") is None
+
+    def test_export_and_issue_dates(self):
+        fields = extract_fields_with_rules("Shipped on Board: 20 Mar 2024\nDate: 18.03.2024\n")
+
+        assert fields["date_of_export"]["value"] == "2024-03-20"
+        assert fields["date"]["value"] == "2024-03-18"
+
+
+class TestExtractFieldsWithRules:
+
+    def test_labelled_bill_of_lading_number(self):
+        fields = extract_fields_with_rules("B/L NO.:\tZMLU34110002\nVessel: EVER GIVEN")
+
+        assert fields["bill_of_lading_number"] == {"value": "ZMLU34110002", "confidence": 0.95}
+
+    def test_bill_of_lading_label_without_a_number(self):
+        assert "bill_of_lading_number" not in extract_fields_with_rules("Bill of lading number: TO ORDER")
+
+    def test_consignee_block_is_a_guess(self):
+        fields = extract_fields_with_rules("Consignee:\nACME Imports\n1 Harbor Rd\nLong Beach\n\nNotify: same")
+
+        assert fields["consignee_name"] == {"value": "ACME Imports", "confidence": 0.6}
+        assert fields["consignee_address"]["value"] == "1 Harbor Rd, Long Beach"
+
+    def test_nothing_found(self):
+        assert extract_fields_with_rules("Terms and conditions of carriage") == {}
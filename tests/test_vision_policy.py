@@ -0,0 +1,68 @@
+from unittest.mock import patch
+
+from app.core.config import settings
+from app.services.vision_policy import (
+    DISPUTED, INVALID, LOW_OCR_CONFIDENCE, MISSING, TEXT_FAILED, decide_vision, validate_fields,
+)
+
+FIELDS = ["bill_of_lading_number", "container_number", "date_of_export", "date", "average_price"]
+
+TEXT_RESULT = {
+    "bill_of_lading_number": "COSU534343282",
+    "container_number": "CSQU3054383",
+    "date_of_export": "2024-01-15",
+    "date": "2024-01-10",
+    "average_price": "$4.00",
+}
+
+
+class TestValidateFields:
+
+    def test_valid_result(self):
+        assert validate_fields(TEXT_RESULT) == []
+
+    def test_invalid_values(self):
+        data = {
+            "container_number": "CSQU3054384",
+            "date_of_export": "15/01/2024",
+            "date": "2024-02-30",
+            "line_items_count": -1,
+            "average_gross_weight": "heavy",
+            "average_price": "$4.00",
+        }
+
+        assert validate_fields(data) == [
+            "container_number", "date_of_export", "date", "line_items_count", "average_gross_weight",
+        ]
+
+    def test_every_listed_container_is_checked(self):
+        assert validate_fields({"container_number": "CSQU3054383, CSQU 305438-3"}) == []
+        assert validate_fields({"container_number": "CSQU3054383 / CSQU3054384"}) == ["container_number"]
+
+
+class TestDecideVision:
+
+    def test_complete_valid_result_skips_vision(self):
+        decision = decide_vision(TEXT_RESULT, FIELDS)
+
+        assert not decision.run
+
+    def test_only_doubtful_fields_are_asked(self):
+        text = {**TEXT_RESULT, "date": None, "container_number": "CSQU3054384"}
+        rules = {"bill_of_lading_number": {"value": "COSU534343283", "confidence": 0.6}}
+
+        decision = decide_vision(text, FIELDS, rules)
+
+        assert decision.fields == {
+            "bill_of_lading_number": DISPUTED, "container_number": INVALID, "date": MISSING,
+        }
+
+    def test_failed_text_call_asks_for_every_field(self):
+        assert decide_vision({"error": "down"}, FIELDS).fields == {name: TEXT_FAILED for name in FIELDS}
+
+    def test_low_ocr_confidence_asks_for_every_field(self):
+        with patch.object(settings, "VISION_MIN_OCR_CONFIDENCE", 80.0):
+            assert decide_vision(TEXT_RESULT, FIELDS, ocr_confidence=92.0).fields == {}
+            assert decide_vision(TEXT_RESULT, FIELDS, ocr_confidence=55.0).fields == {
+                name: LOW_OCR_CONFIDENCE for name in FIELDS
+            }
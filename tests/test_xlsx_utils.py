@@ -0,0 +1,76 @@
+import datetime
+import os
+
+from openpyxl import Workbook
+
+from app.utils.xlsx_utils import extract_text_from_xlsx, format_cell
+
+DEMO_XLSX = os.path.join(os.path.dirname(__file__), "..", "testDocs", "Demo-Invoice-PackingList_1.xlsx")
+
+
+def _workbook(tmp_path, sheets):
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for title, rows in sheets.items():
+        sheet = workbook.create_sheet(title)
+        for row in rows:
+            sheet.append(row)
+    path = tmp_path / "book.xlsx"
+    workbook.save(path)
+    return str(path)
+
+
+class TestFormatCell:
+
+    def test_numbers_are_compact(self):
+        assert format_cell(932.0) == "932"
+        assert format_cell(0.1 + 0.2) == "0.3"
+        assert format_cell(8424899000) == "8424899000"
+
+    def test_dates_and_strings(self):
+        assert format_cell(datetime.datetime(2024, 3, 1)) == "2024-03-01"
+        assert format_cell(datetime.datetime(2024, 3, 1, 9, 30)) == "2024-03-01 09:30:00"
+        assert format_cell("Qty (Pcs)\n数量\t(个) ") == "Qty (Pcs) 数量 (个)"
+        assert format_cell(None) == ""
+
+
+class TestExtractTextFromXlsx:
+
+    def test_empty_rows_and_columns_are_skipped(self, tmp_path):
+        path = _workbook(tmp_path, {
+            "Invoice": [
+                ["INV.NO.:", None, "INV100000LAX"],
+                [],
+                [None, None, None],
+                ["S.No.", None, "Description", None, 12.0],
+            ],
+            "Empty": [],
+        })
+
+        assert extract_text_from_xlsx(path) == (
+            "Sheet: Invoice\n"
+            "INV.NO.:\tINV100000LAX\n"
+            "S.No.\tDescription\t12"
+        )
+
+    def test_rows_and_columns_are_capped(self, tmp_path):
+        path = _workbook(tmp_path, {"Items": [[i, f"item {i}", "x", "y"] for i in range(10)]})
+
+        text = extract_text_from_xlsx(path, max_rows=3, max_columns=2)
+
+        assert text == (
+            "Sheet: Items\n"
+            "0\titem 0\n"
+            "1\titem 1\n"
+            "2\titem 2\n"
+            "[truncated after 3 rows]"
+        )
+
+    def test_demo_packing_list_is_much_smaller_than_dataframe_dump(self):
+        text = extract_text_from_xlsx(DEMO_XLSX)
+
+        assert "Sheet: Invoice" in text
+        assert "Sheet: 包装清单 List" in text
+        assert "2\tHeadphones\t10188\t0.06\t611.28\t8504409580" in text
+        assert "NaN" not in text
+        assert len(text) < 2000